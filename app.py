@@ -1,13 +1,47 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from prometheus_client import make_asgi_app
+from src.database.db import Database
+from src.database.timer import timer
+from src.database.timer_events import timer_events
+from src.database.timer_journal import TimerJournal
 from src.routes.timer import timerRoutes
+from src.settings import settings
+from src.utilities.metrics import RequestMetricsMiddleware, metrics_registry
 from src.utilities.logging_config import setup_logging
 
 setup_logging()
 
-app = FastAPI(redirect_slashes=False)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker process: its pools are opened on its own event loop and closed on shutdown
+    Database()
+    await timer.ensure_indexes()
+    await timer.cache.start()
+    if settings.TIMER_WRITE_BEHIND:
+        journal = TimerJournal(insert=timer.insert_journaled)
+        await journal.start()
+        timer.journal = journal
+    yield
+    if timer.journal is not None:
+        journal, timer.journal = timer.journal, None
+        await journal.stop()
+    await timer_events.stop()
+    await timer.cache.aclose()
+    if timer.due_queue is not None:
+        await timer.due_queue.aclose()
+    Database().close()
+
+
+app = FastAPI(redirect_slashes=False, lifespan=lifespan)
+
+app.add_middleware(RequestMetricsMiddleware)
 app.include_router(timerRoutes, prefix="/timer")
+app.mount("/metrics", make_asgi_app(registry=metrics_registry()))
 
 if __name__ == '__main__':
+    # Development server with auto reload, production runs `python -m src.server`
     import uvicorn
-    uvicorn.run("app:app", host="0.0.0.0", port=80, reload=True)
\ No newline at end of file
+    uvicorn.run("app:app", host="0.0.0.0", port=80, reload=True, log_config=None)
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+Throughput of the production API server (`python -m src.server`) as the number of worker processes grows.
+
+For every `--workers` count, starts the server on uvloop and httptools against the local mongod at
+`MONGO_URI`, then drives `GET /timer/{id}` for a sample of `--timers` timers from `--clients` load generator
+processes with `--connections` keep-alive connections each, for `--duration` seconds. Reports requests per
+second, latency percentiles and the speedup over one worker, and writes them as JSON to `--output` so runs on
+two commits or machines can be compared with `python -m benchmarks.compare`.
+
+The load generators share the machine with the server, so the speedup flattens out before the core count;
+for a clean curve pin them apart, e.g. `taskset -c 0-3 python -m benchmarks.api_scaling_bench --cpus 4-7`.
+The benchmark drops the `timer` collection of `MONGO_DBNAME`, which defaults to `timer_bench` here and must
+end in `_bench`.
+
+    python -m benchmarks.api_scaling_bench --workers 1 2 4 8 --duration 10 --output scaling.json
+"""
+import os
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_DBNAME", "timer_bench")
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import multiprocessing  # noqa: E402
+import platform  # noqa: E402
+import random  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+from typing import Dict, List, Optional, Tuple  # noqa: E402
+
+import httpx  # noqa: E402
+
+from benchmarks.stats import distribution, git_commit  # noqa: E402
+from src.settings import settings  # noqa: E402
+
+
+def start_server(workers: int, port: int, cpus: Optional[str]) -> subprocess.Popen:
+    command = [sys.executable, "-m", "src.server", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)]
+    if cpus:
+        command = ["taskset", "-c", cpus, *command]
+    return subprocess.Popen(command, env={**os.environ, "LOG_FILE": ""}, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/metrics/").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"API server at {base_url} did not start within {timeout}s")
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def create_timers(base_url: str, count: int) -> List[str]:
+    """Timers far enough out that none fires during the run."""
+    ids: List[str] = []
+    with httpx.Client(base_url=base_url, timeout=60) as http:
+        for start in range(0, count, 1000):
+            batch = [{"hours": 24, "url": "http://127.0.0.1:9/webhook"} for _ in range(min(1000, count - start))]
+            response = http.post("/timer/batch", json=batch)
+            ids.extend(item["id"] for item in response.json()["timers"] if item.get("id"))
+    return ids
+
+
+def load_client(base_url: str, ids: List[str], connections: int, duration: float) -> Tuple[int, int, List[float]]:
+    """One load generator process: `connections` concurrent keep-alive clients GETting random timers."""
+
+    async def run() -> Tuple[int, int, List[float]]:
+        latencies: List[float] = []
+        errors = 0
+        deadline = time.perf_counter() + duration
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+
+            async def connection() -> None:
+                nonlocal errors
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        response = await http.get(f"/timer/{random.choice(ids)}")
+                        if response.status_code != 200:
+                            errors += 1
+                    except httpx.HTTPError:
+                        errors += 1
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+            await asyncio.gather(*(connection() for _ in range(connections)))
+        return len(latencies), errors, latencies
+
+    return asyncio.run(run())
+
+
+def measure(base_url: str, ids: List[str], clients: int, connections: int, duration: float) -> Dict:
+    with multiprocessing.get_context("spawn").Pool(clients) as pool:
+        results = pool.starmap(load_client, [(base_url, ids, connections, duration)] * clients)
+    requests = sum(count for count, _, _ in results)
+    latencies = [latency for _, _, samples in results for latency in samples]
+    return {
+        "requests": requests,
+        "errors": sum(errors for _, errors, _ in results),
+        "requests_per_second": requests / duration,
+        **distribution(latencies, "latency_ms"),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict:
+    from src.database.timer import timer
+
+    async def reset() -> None:
+        await timer._collection.drop()
+
+    asyncio.run(reset())
+    results: Dict[str, Dict] = {}
+    ids: List[str] = []
+    for workers in args.workers:
+        port = args.port + workers
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(workers, port, args.cpus)
+        try:
+            wait_ready(base_url)
+            ids = ids or create_timers(base_url, args.timers)
+            # Warm the connection pools and the caches of every worker
+            measure(base_url, ids, args.clients, args.connections, min(args.duration, 2.0))
+            results[f"workers_{workers}"] = measure(base_url, ids, args.clients, args.connections, args.duration)
+        finally:
+            stop_server(server)
+
+    baseline = results[f"workers_{args.workers[0]}"]["requests_per_second"]
+    for result in results.values():
+        result["speedup"] = result["requests_per_second"] / baseline if baseline else None
+    return {
+        "benchmark": "api_scaling",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "timers": args.timers,
+            "clients": args.clients,
+            "connections": args.connections,
+            "duration_seconds": args.duration,
+            "cpus": args.cpus,
+        },
+        "results": results,
+    }
+
+
+if __name__ == '__main__':
+    cores = os.cpu_count() or 1
+    default_workers = sorted({1, *(2 ** power for power in range(1, cores.bit_length()) if 2 ** power <= cores), cores})
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers, help="Worker counts to measure")
+    parser.add_argument("--timers", type=int, default=10_000)
+    parser.add_argument("--clients", type=int, default=max(cores // 2, 1), help="Load generator processes")
+    parser.add_argument("--connections", type=int, default=64, help="Keep-alive connections per load generator")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per worker count")
+    parser.add_argument("--port", type=int, default=18000, help="The server listens on this port plus the worker count")
+    parser.add_argument("--cpus", default=None, help="Pin the server to these CPUs with taskset, e.g. 4-7")
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    args = parser.parse_args()
+
+    if not settings.MONGO_DBNAME.endswith("_bench"):
+        sys.exit(f"Refusing to drop timers of MONGO_DBNAME={settings.MONGO_DBNAME}, use a *_bench database")
+    result = run(args)
+    rendered = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(rendered + "\n")
+    print(rendered)
@@ -0,0 +1,57 @@
+"""
+Compare two JSON benchmark results, typically the same benchmark run on two commits.
+
+Prints one JSON line per numeric metric present in both with its relative change. `--fail-above` exits
+non-zero when a latency or lateness metric grew, or a throughput metric shrank, by more than that fraction.
+
+    python -m benchmarks.compare e2e-main.json e2e-branch.json --fail-above 0.1
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict
+
+# Metrics where a larger value is a regression, every other rate is better when larger
+LOWER_IS_BETTER = ("latency", "lateness", "seconds", "missing", "twice", "errors")
+
+
+def flatten(result: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    metrics = {}
+    for key, value in result.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[name] = float(value)
+    return metrics
+
+
+def regression(name: str, before: float, after: float) -> float:
+    """Relative change in the bad direction, negative for an improvement."""
+    if not before:
+        return 0.0
+    change = (after - before) / before
+    return change if any(word in name for word in LOWER_IS_BETTER) else -change
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--fail-above", type=float, default=None, help="Max tolerated regression, e.g. 0.1")
+    args = parser.parse_args()
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+
+    failed = []
+    before_metrics, after_metrics = flatten(before), flatten(after)
+    for name, old in before_metrics.items():
+        if name.startswith("config.") or name not in after_metrics:
+            continue
+        new = after_metrics[name]
+        worse = regression(name, old, new)
+        print(json.dumps({"metric": name, "before": old, "after": new, "regression": worse}))
+        if args.fail_above is not None and worse > args.fail_above:
+            failed.append(name)
+    if failed:
+        sys.exit(f"Regressed by more than {args.fail_above:.0%}: {', '.join(failed)}")
@@ -0,0 +1,231 @@
+"""
+End-to-end load test of the timer service: API, scheduler, Celery worker and webhook delivery in one process.
+
+Creates `--timers` timers through the FastAPI app, all due `--lead` seconds out (spread over `--spread`
+seconds), reads a sample of them back, and lets the dispatcher and a Celery worker fire them at a stub webhook
+receiver. The worker consumes from kombu's in-memory broker. Mongo is the local mongod at `MONGO_URI`
+(default `mongodb://localhost:27017`) or, with `--mongo mock`, mongomock-motor, whose linear scans make it a
+smoke test rather than a measurement. mongomock ignores partial index filters, so the mock run creates the
+indexes without the unique `idempotency_key` one, which would otherwise reject every timer without a key after
+the first. Reports timers created per second, POST and GET latency percentiles, firing lateness (webhook
+arrival minus eta) percentiles, webhook throughput and any timer fired twice, and writes them as JSON to `--output` so runs on two commits can be compared with `python -m benchmarks.compare`.
+
+The benchmark drops the `timer` collection of `MONGO_DBNAME`, which defaults to `timer_bench` here and must
+end in `_bench`. `--lead` has to cover the create phase for lateness to mean anything.
+
+    python -m benchmarks.e2e_bench --timers 10000 --lead 20 --output e2e.json
+    python -m benchmarks.e2e_bench --timers 1000000 --batch-size 1000 --lead 600 --output e2e-1m.json
+"""
+import os
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_DBNAME", "timer_bench")
+os.environ["CELERY_BROKER_URL"] = "memory://"
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import logging  # noqa: E402
+import platform  # noqa: E402
+import random  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+from datetime import timezone  # noqa: E402
+from typing import Dict, List  # noqa: E402
+from urllib.parse import parse_qs  # noqa: E402
+
+import httpx  # noqa: E402
+import orjson  # noqa: E402
+from bson import ObjectId  # noqa: E402
+from celery.contrib.testing.worker import start_worker  # noqa: E402
+
+from benchmarks.stats import distribution, git_commit  # noqa: E402
+from benchmarks.stub_server import StubWebhookServer  # noqa: E402
+from src.celery_workers.celery_app import celery_app  # noqa: E402
+from src.celery_workers.runtime import run_coroutine  # noqa: E402
+from src.database.db import Database  # noqa: E402
+from src.database.timer import timer  # noqa: E402
+from src.scheduler.dispatcher import Dispatcher  # noqa: E402
+from src.settings import settings  # noqa: E402
+
+
+def use_mongomock() -> None:
+    """Point the database singleton at an in-memory mongomock-motor client."""
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("--mongo mock needs mongomock-motor: pip install mongomock-motor")
+    database = Database()
+    database.client = AsyncMongoMockClient()
+    database.db = database.client[settings.MONGO_DBNAME]
+    # mongomock enforces `unique` but not `partialFilterExpression`
+    timer._indexes = [index for index in timer._indexes if index.document["name"] != "idempotency_key"]
+
+
+def received_ids(body: bytes) -> List[str]:
+    """Timer ids of one webhook: the `id` form field, or the `ids` of a coalesced batch."""
+    if body.startswith(b"{"):
+        return orjson.loads(body)["ids"]
+    return parse_qs(body.decode())["id"]
+
+
+async def create_timers(
+    http: httpx.AsyncClient, url: str, count: int, concurrency: int, batch_size: int, lead: int, spread: int
+) -> Dict:
+    """POST `count` timers from `concurrency` clients, one per request or `batch_size` per batch request."""
+    ids: List[str] = []
+    latencies: List[float] = []
+    per_request = max(batch_size, 1)
+    remaining = iter(range(0, count, per_request))
+
+    def body(start: int) -> Dict:
+        return {"hours": 0, "minutes": 0, "seconds": lead + random.randint(0, spread), "url": url}
+
+    async def client() -> None:
+        for start in remaining:
+            size = min(per_request, count - start)
+            started = time.perf_counter()
+            if batch_size:
+                response = await http.post("/timer/batch", json=[body(start) for _ in range(size)])
+                ids.extend(item["id"] for item in response.json()["timers"] if item.get("id"))
+            else:
+                response = await http.post("/timer/", json=body(start))
+                ids.append(response.json()["id"])
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "ids": ids,
+        "stats": {
+            "timers_created": len(ids),
+            "create_seconds": elapsed,
+            "timers_created_per_second": len(ids) / elapsed,
+            **distribution(latencies, "post_latency_ms"),
+        },
+    }
+
+
+async def read_timers(http: httpx.AsyncClient, ids: List[str], count: int, concurrency: int) -> Dict:
+    """GET a random sample of `count` timers from `concurrency` clients."""
+    sample = iter(random.choices(ids, k=count) if ids else [])
+    latencies: List[float] = []
+
+    async def client() -> None:
+        for timer_id in sample:
+            started = time.perf_counter()
+            await http.get(f"/timer/{timer_id}")
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"gets": len(latencies), "gets_per_second": len(latencies) / elapsed, **distribution(latencies, "get_latency_ms")}
+
+
+async def firing_stats(stub: StubWebhookServer, ids: List[str], timeout: float) -> Dict:
+    """Wait until every timer's webhook arrived or `timeout` passed, then measure lateness and throughput."""
+    deadline = time.monotonic() + timeout
+    expected = set(ids)
+    arrived: Dict[str, float] = {}
+    seen = deliveries = 0
+    while time.monotonic() < deadline:
+        for at, body in stub.received[seen:]:
+            for timer_id in received_ids(body):
+                arrived.setdefault(timer_id, at)
+                deliveries += 1
+        seen = len(stub.received)
+        if expected <= arrived.keys():
+            break
+        await asyncio.sleep(0.2)
+
+    etas: Dict[str, float] = {}
+    for start in range(0, len(ids), 10_000):
+        chunk = [ObjectId(timer_id) for timer_id in ids[start:start + 10_000]]
+        async for doc in timer._collection.find({"_id": {"$in": chunk}}, projection={"eta": 1}):
+            etas[str(doc["_id"])] = doc["eta"].replace(tzinfo=timezone.utc).timestamp()
+
+    lateness = [(arrived[timer_id] - etas[timer_id]) * 1000 for timer_id in arrived if timer_id in etas]
+    fired_at = sorted(arrived.values())
+    window = fired_at[-1] - fired_at[0] if len(fired_at) > 1 else 0.0
+    return {
+        "timers_fired": len(arrived),
+        "timers_missing": len(expected - arrived.keys()),
+        "timers_fired_twice": deliveries - len(arrived),
+        "webhook_requests": seen,
+        "webhooks_per_second": len(fired_at) / window if window else None,
+        **distribution(lateness, "lateness_ms"),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    from app import app
+
+    await timer._collection.drop()
+    await timer.ensure_indexes()
+
+    async with StubWebhookServer(delay=args.webhook_delay, record=True) as stub:
+        dispatcher = Dispatcher()
+        dispatching = asyncio.create_task(dispatcher.run())
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as http:
+            created = await create_timers(
+                http, stub.url, args.timers, args.concurrency, args.batch_size, args.lead, args.spread
+            )
+            reads = await read_timers(http, created["ids"], args.gets, args.concurrency)
+        fired = await firing_stats(stub, created["ids"], timeout=args.lead + args.spread + args.drain_timeout)
+        dispatcher.stop()
+        await dispatching
+
+    return {
+        "benchmark": "e2e",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "mongo": args.mongo,
+        "config": {
+            "timers": args.timers,
+            "concurrency": args.concurrency,
+            "batch_size": args.batch_size,
+            "lead_seconds": args.lead,
+            "spread_seconds": args.spread,
+            "webhook_delay_ms": args.webhook_delay * 1000,
+        },
+        "create": created["stats"],
+        "read": reads,
+        "fire": fired,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--timers", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent API clients")
+    parser.add_argument("--batch-size", type=int, default=0, help="Create timers through POST /timer/batch")
+    parser.add_argument("--gets", type=int, default=10_000, help="GET /timer/{id} requests")
+    parser.add_argument("--lead", type=int, default=20, help="Seconds from creation to the earliest eta")
+    parser.add_argument("--spread", type=int, default=0, help="Etas are spread over this many seconds")
+    parser.add_argument("--webhook-delay", type=float, default=0.0, help="Stub receiver latency in seconds")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="Seconds to wait for late webhooks")
+    parser.add_argument("--mongo", choices=("local", "mock"), default="local")
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    args = parser.parse_args()
+
+    if not settings.MONGO_DBNAME.endswith("_bench"):
+        sys.exit(f"Refusing to drop timers of MONGO_DBNAME={settings.MONGO_DBNAME}, use a *_bench database")
+    logging.disable(logging.WARNING)
+    # The in-memory transport polls its queues, once a second by default
+    celery_app.conf.broker_transport_options = {"polling_interval": 0.01}
+    # `fire_webhook` only hands the POST to the delivery engine, one solo pool consumer keeps up and avoids
+    # the per message polling of the thread pool on the in-memory transport
+    if args.mongo == "mock":
+        use_mongomock()
+    with start_worker(celery_app, pool="solo", perform_ping_check=False, shutdown_timeout=30):
+        # The worker's delivery engine and result writer run on the worker loop, and a Motor client
+        # must stay on one loop, so the API and the dispatcher run there too
+        result = run_coroutine(run(args)).result()
+    rendered = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(rendered + "\n")
+    print(rendered)
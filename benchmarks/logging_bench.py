@@ -0,0 +1,116 @@
+"""
+Request latency of the API with synchronous vs queue based logging.
+
+Serves a route that logs one INFO record per request, like the timer routes and the access log, and drives it
+with `--concurrency` clients for `--requests` requests in total. `sync` writes every record to a log file from
+the request's own thread with a `FileHandler`, the previous setup; `queue` uses the project's pipeline, where
+the request only enqueues the record and the listener thread formats and writes it. `--fsync` syncs the file
+after every record, standing in for a slow disk or a blocked stdout pipe.
+
+    python -m benchmarks.logging_bench --requests 20000 --concurrency 100 --fsync
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import queue
+import statistics
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+import httpx
+from fastapi import FastAPI
+
+from benchmarks.stats import percentile
+from src.utilities.logging_config import JsonFormatter, SamplingFilter, DeferredQueueHandler
+
+
+class FsyncFileHandler(logging.FileHandler):
+    def flush(self) -> None:
+        super().flush()
+        if self.stream:
+            os.fsync(self.stream.fileno())
+
+
+def make_app(logger: logging.Logger) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/timer/")
+    async def set_timer(payload: dict):
+        logger.info("Timer request received: %s", payload)
+        return {"id": "0" * 24, "time_left": 0}
+
+    return app
+
+
+def configure(mode: str, path: str, sample_rate: float, fsync: bool):
+    logger = logging.getLogger(f"benchmarks.logging_bench.{mode}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    file_handler = (FsyncFileHandler if fsync else logging.FileHandler)(path)
+    listener = None
+    if mode == "sync":
+        file_handler.setFormatter(logging.Formatter(
+            '[%(asctime)s] %(levelname)s in %(module)s (func: %(funcName)s): %(message)s'
+        ))
+        logger.addHandler(file_handler)
+    else:
+        file_handler.setFormatter(JsonFormatter())
+        log_queue = queue.SimpleQueue()
+        handler = DeferredQueueHandler(log_queue)
+        handler.addFilter(SamplingFilter(rate=sample_rate, loggers=(logger.name,)))
+        logger.addHandler(handler)
+        listener = QueueListener(log_queue, file_handler)
+        listener.start()
+    return logger, listener
+
+
+async def run(mode: str, requests: int, concurrency: int, sample_rate: float, fsync: bool) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.log")
+        logger, listener = configure(mode, path, sample_rate, fsync)
+        latencies = []
+        remaining = iter(range(requests))
+        transport = httpx.ASGITransport(app=make_app(logger))
+
+        async def client() -> None:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+                for key in remaining:
+                    started = time.perf_counter()
+                    await http.post("/timer/", json={"hours": 0, "minutes": 1, "seconds": key, "url": "http://example.com"})
+                    latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        if listener is not None:
+            listener.stop()
+        for handler in list(logger.handlers):
+            handler.close()
+            logger.removeHandler(handler)
+
+    latency_ms = [value * 1000 for value in latencies]
+    return {
+        "mode": mode,
+        "requests": requests,
+        "concurrency": concurrency,
+        "sample_rate": sample_rate if mode == "queue" else 1.0,
+        "fsync": fsync,
+        "requests_per_second": requests / elapsed,
+        "latency_ms_p50": statistics.median(latency_ms),
+        "latency_ms_p99": percentile(latency_ms, 99),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--sample-rate", type=float, default=1.0,
+                        help="Fraction of the per request records the queue pipeline keeps")
+    parser.add_argument("--fsync", action="store_true", help="Sync the log file after every record")
+    args = parser.parse_args()
+    for mode in ("sync", "queue"):
+        print(json.dumps(asyncio.run(run(mode, args.requests, args.concurrency, args.sample_rate, args.fsync))))
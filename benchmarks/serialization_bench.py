@@ -0,0 +1,94 @@
+"""
+Per call cost of the timer request/response serialization path and of loading timer documents.
+
+`request` covers request body bytes through response body bytes for `POST /timer/`: the previous path parsed
+with stdlib json and rendered a `JSONResponse`, the current one parses and renders with orjson. `get` covers
+building and rendering the `GET /timer/{id}` response. `load` compares loading a full timer document with
+loading the projection the dispatcher claims with.
+
+    python -m benchmarks.serialization_bench --iterations 100000
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from src.models.timer import GetTimerResponse, SetTimerRequest, SetTimerResponse
+from src.models.timer_db import TimerDB
+
+BODY = b'{"hours": 1, "minutes": 30, "seconds": 15, "url": "http://example.com/webhook"}'
+
+DOCUMENT = {
+    "_id": ObjectId(),
+    "eta": datetime(2024, 1, 1, 12, 0, 0),
+    "url": "http://example.com/webhook",
+    "status": "fired",
+    "due_bucket": 1704110400,
+    "claim_id": str(ObjectId()),
+    "dispatched_at": datetime(2024, 1, 1, 12, 0, 0),
+    "response": "ok" * 64,
+    "success": True,
+    "status_code": 200,
+    "created": datetime(2024, 1, 1, 11, 0, 0),
+    "updated": datetime(2024, 1, 1, 12, 0, 1),
+}
+
+PROJECTED = {key: DOCUMENT[key] for key in ("_id", "eta", "url", "claim_id")}
+
+
+def request_before() -> bytes:
+    data = json.loads(BODY)
+    timer_data = SetTimerRequest(**data)
+    time_left = timer_data.hours * 3600 + timer_data.minutes * 60 + timer_data.seconds
+    response = SetTimerResponse(id=str(DOCUMENT["_id"]), time_left=time_left)
+    return JSONResponse(content=response.model_dump(), status_code=201).body
+
+
+def request_after() -> bytes:
+    data = orjson.loads(BODY)
+    timer_data = SetTimerRequest.model_validate(data)
+    time_left = timer_data.hours * 3600 + timer_data.minutes * 60 + timer_data.seconds
+    response = SetTimerResponse(id=str(DOCUMENT["_id"]), time_left=time_left)
+    return ORJSONResponse(content=response.model_dump(), status_code=201).body
+
+
+def get_before() -> bytes:
+    return JSONResponse(content=GetTimerResponse(id=str(DOCUMENT["_id"]), time_left=5415).model_dump()).body
+
+
+def get_after() -> bytes:
+    return ORJSONResponse(content=GetTimerResponse(id=str(DOCUMENT["_id"]), time_left=5415).model_dump()).body
+
+
+def load_before() -> TimerDB:
+    return TimerDB(**{**DOCUMENT, "_id": str(DOCUMENT["_id"])})
+
+
+def load_after() -> TimerDB:
+    return TimerDB.from_document(PROJECTED)
+
+
+def per_call_us(func, iterations: int) -> float:
+    return min(timeit.repeat(func, number=iterations, repeat=3)) / iterations * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+    assert orjson.loads(request_before()) == orjson.loads(request_after())
+    paths = (("request", request_before, request_after), ("get", get_before, get_after), ("load", load_before, load_after))
+    for name, before, after in paths:
+        before_us = per_call_us(before, args.iterations)
+        after_us = per_call_us(after, args.iterations)
+        print(json.dumps({
+            "path": name,
+            "iterations": args.iterations,
+            "before_us": before_us,
+            "after_us": after_us,
+            "speedup": before_us / after_us,
+        }))
@@ -0,0 +1,31 @@
+"""Summary statistics and run metadata shared by the benchmarks."""
+import subprocess
+from typing import Dict, Sequence
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(int(len(ordered) * pct / 100), len(ordered) - 1)
+    return ordered[index]
+
+
+def distribution(samples: Sequence[float], unit: str) -> Dict[str, float]:
+    """p50/p90/p99/max of `samples`, keyed like `latency_ms_p99` when `unit` is `latency_ms`."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {
+        f"{unit}_p50": percentile(ordered, 50),
+        f"{unit}_p90": percentile(ordered, 90),
+        f"{unit}_p99": percentile(ordered, 99),
+        f"{unit}_max": ordered[-1],
+    }
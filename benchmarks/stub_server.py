@@ -0,0 +1,61 @@
+"""Minimal keep-alive HTTP/1.1 webhook receiver used by the benchmarks."""
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n\r\nok"
+
+
+class StubWebhookServer:
+    """
+    Accepts any request, optionally waits `delay` seconds, and answers `200 ok`.
+
+    Counts the requests and connections it has seen so benchmarks can check keep-alive reuse. With `record`
+    it also keeps the wall clock arrival time and body of every request.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0, record: bool = False) -> None:
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.record = record
+        self.requests = 0
+        self.connections = 0
+        self.received: List[Tuple[float, bytes]] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/webhook"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                arrived = time.time()
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                body = await reader.readexactly(length) if length else b""
+                if self.record:
+                    self.received.append((arrived, body))
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                self.requests += 1
+                writer.write(RESPONSE)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def __aenter__(self) -> "StubWebhookServer":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._server.close()
+        await self._server.wait_closed()
@@ -0,0 +1,64 @@
+"""
+Firing lateness of the scheduler timing wheel with many concurrently armed timers.
+
+Arms `--timers` timers spread uniformly over `--spread` seconds, starting one second out so arming has
+finished before the first deadline, and records how long after its deadline each callback actually ran.
+
+    python -m benchmarks.timing_wheel_bench --timers 100000 --spread 2
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from src.scheduler.timing_wheel import TimingWheel
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(int(len(ordered) * pct / 100), len(ordered) - 1)
+    return ordered[index]
+
+
+async def run(timers: int, spread: float, tick: float) -> dict:
+    wheel = TimingWheel(tick_seconds=tick, wheel_size=512)
+    lateness = []
+    deadlines = {}
+
+    def fire(key: int) -> None:
+        lateness.append(time.monotonic() - deadlines[key])
+
+    armed_at = time.perf_counter()
+    for key in range(timers):
+        delay = 1.0 + random.uniform(0, spread)
+        deadlines[key] = time.monotonic() + delay
+        wheel.schedule(key, delay, fire, key)
+    arm_seconds = time.perf_counter() - armed_at
+
+    stopped = asyncio.Event()
+    runner = asyncio.create_task(wheel.run(stopped))
+    while len(lateness) < timers:
+        await asyncio.sleep(0.05)
+    stopped.set()
+    await runner
+
+    lateness_ms = [value * 1000 for value in lateness]
+    return {
+        "timers": timers,
+        "tick_ms": tick * 1000,
+        "arm_us_per_timer": arm_seconds / timers * 1e6,
+        "lateness_ms_p50": statistics.median(lateness_ms),
+        "lateness_ms_p99": percentile(lateness_ms, 99),
+        "lateness_ms_max": max(lateness_ms),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--timers", type=int, default=100_000)
+    parser.add_argument("--spread", type=float, default=2.0)
+    parser.add_argument("--tick", type=float, default=0.01)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.timers, args.spread, args.tick)), indent=2))
@@ -24,14 +24,19 @@ class CeleryApp(Singleton, Celery):
 
         :param name: Optional name for the Celery app instance.
         """
-        
-        print(hasattr(self, '_initialized'))
         if not hasattr(self, '_initialized'):
             # Initialize Celery with the provided name and broker URL
-            print(settings.CELERY_APP_NAME, name, settings.CELERY_BROKER_URL)
             super().__init__(main=name or settings.CELERY_APP_NAME, broker=settings.CELERY_BROKER_URL)
             self._initialized = True  # Ensure Singleton behavior by tracking initialization
 
+    def after_fork(self) -> None:
+        """
+        Drop the broker connection and producer pools inherited from the parent process.
+
+        The app itself is kept, tasks and configuration are registered on it.
+        """
+        self._after_fork()
+
     @classmethod
     def create_app(cls, name: Optional[str] = None) -> CeleryApp:
         """
@@ -45,11 +50,27 @@ class CeleryApp(Singleton, Celery):
 
 celery_app = CeleryApp.create_app()
 
+# Keep the queue based logging pipeline instead of Celery's own root logger handlers
+celery_app.conf.worker_hijack_root_logger = False
+
+
+def shard_queue(shard: Optional[int]) -> str:
+    """Name of the webhook queue of a timer shard; timers without a shard belong to shard 0."""
+    return f"webhook_queue.{shard or 0}"
+
+
+# One queue per timer shard, so sharded worker nodes only consume the shards they lease. The plain
+# `webhook_queue` stays declared for messages published before sharding.
 celery_app.conf.task_queues = (
     Queue('webhook_queue', routing_key='webhook.#'),
+    *(Queue(shard_queue(shard), routing_key=f'webhook.{shard}') for shard in range(settings.SCHEDULER_SHARDS)),
 )
 
 celery_app.conf.task_routes = {
     'src.celery_workers.timer.fire_webhook': {'queue': 'webhook_queue'},
+    'src.celery_workers.timer.fire_webhook_batch': {'queue': 'webhook_queue'},
 }
 celery_app.autodiscover_tasks(['src.celery_workers.timer'])
+
+import src.celery_workers.monitoring  # noqa: E402,F401  (connects the worker metrics exporter signals)
+import src.celery_workers.sharding  # noqa: E402,F401  (connects the worker shard lease signals)
@@ -0,0 +1,425 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from typing import Any, Coroutine, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from src.celery_workers.persistence import result_writer
+from src.celery_workers.retry import RetryPolicy, parse_retry_after
+from src.celery_workers.runtime import run_coroutine
+from src.celery_workers.throttle import HostThrottle
+from src.database.dead_letter import dead_letter
+from src.database.timer import due_bucket, timer
+from src.database.timer_archive import compact_response
+from src.models.timer_db import Occurrence, TimerDB, TimerStatus, WebhookAttempt
+from src.settings import settings
+from src.utilities.metrics import (
+    FIRING_LATENESS_SECONDS,
+    WEBHOOK_DEAD_LETTERED,
+    WEBHOOK_DEFERRED,
+    WEBHOOK_IN_FLIGHT,
+    WEBHOOK_RETRIES,
+    WEBHOOK_SECONDS,
+    WEBHOOK_THROTTLED_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookResult(NamedTuple):
+    """Outcome of a single webhook POST."""
+
+    status_code: Optional[int]
+    response: str
+    retry_after: Optional[float] = None
+
+    @property
+    def success(self) -> bool:
+        return self.status_code == 200
+
+
+class _HostPool:
+    """Keep-alive connection pool and concurrency slot for a single destination host."""
+
+    def __init__(self, limit: int, timeout: float, transport: Optional[httpx.AsyncBaseTransport]) -> None:
+        self.slot = asyncio.Semaphore(limit)
+        # POSTs holding the pool, a pool in use is never closed
+        self.users = 0
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            transport=transport,
+            limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+        )
+
+
+class WebhookDeliveryEngine:
+    """
+    Asyncio webhook delivery for the Celery worker.
+
+    POSTs run on the worker's shared event loop, so thousands of requests can be in flight per process
+    and a slow endpoint only holds one of its host's slots, never a worker process. Each destination
+    host gets its own keep-alive `httpx.AsyncClient` sized to the per-host limit: connections are reused
+    across timers and pool bookkeeping stays proportional to one host's connections rather than all of
+    them. At most `max_hosts` host pools are kept, the least recently used idle ones are closed beyond that.
+    Submitting blocks once `max_in_flight` deliveries are pending, which pushes back on prefetch.
+
+    Every host is also throttled (`HostThrottle`): a burst of timers for one host is spaced out at the host's
+    rate limit, and timers that would have to wait too long are handed back to the scheduler.
+
+    Failed deliveries are retried according to the `RetryPolicy`. A retry is not awaited in the worker:
+    the timer goes back to the scheduler under the due bucket of its backoff. Timers that fail for good
+    are dead-lettered.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        per_host_limit: Optional[int] = None,
+        timeout: Optional[float] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        throttle: Optional[HostThrottle] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        max_hosts: Optional[int] = None,
+    ) -> None:
+        """
+        :param max_in_flight: max pending deliveries, defaults to `WEBHOOK_MAX_IN_FLIGHT`
+        :param per_host_limit: max concurrent POSTs per host, defaults to `WEBHOOK_MAX_CONNECTIONS_PER_HOST`
+        :param timeout: POST timeout in seconds, defaults to `WEBHOOK_TIMEOUT_SECONDS`
+        :param transport: optional httpx transport, used by tests and benchmarks
+        :param throttle: per host rate limit and shared concurrency cap, configured from settings by default
+        :param retry_policy: retry and backoff policy, configured from settings by default
+        :param max_hosts: host pools kept open, defaults to `WEBHOOK_MAX_HOST_POOLS`
+        """
+        self.max_in_flight = max_in_flight or settings.WEBHOOK_MAX_IN_FLIGHT
+        self.per_host_limit = per_host_limit or settings.WEBHOOK_MAX_CONNECTIONS_PER_HOST
+        self.timeout = timeout or settings.WEBHOOK_TIMEOUT_SECONDS
+        self._transport = transport
+        self.throttle = throttle or HostThrottle()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.max_hosts = max_hosts or settings.WEBHOOK_MAX_HOST_POOLS
+        self._hosts: OrderedDict[str, _HostPool] = OrderedDict()
+        self._closing: set[asyncio.Task] = set()
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+
+    def _host(self, url: str) -> _HostPool:
+        """Connection pool and concurrency slot for the destination host of `url`, created on first use."""
+        host = urlsplit(url).netloc
+        pool = self._hosts.get(host)
+        if pool is None:
+            pool = self._hosts[host] = _HostPool(self.per_host_limit, self.timeout, self._transport)
+            self._evict()
+        else:
+            self._hosts.move_to_end(host)
+        return pool
+
+    def _evict(self) -> None:
+        """Close the least recently used idle host pools beyond `max_hosts`, busy ones are kept until idle."""
+        excess = len(self._hosts) - self.max_hosts
+        for host in list(self._hosts)[:-1]:
+            if excess <= 0:
+                break
+            if self._hosts[host].users:
+                continue
+            task = asyncio.get_running_loop().create_task(self._hosts.pop(host).client.aclose())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+            excess -= 1
+
+    async def aclose(self) -> None:
+        """Close every host pool."""
+        hosts, self._hosts = self._hosts, OrderedDict()
+        for pool in hosts.values():
+            await pool.client.aclose()
+        if self._closing:
+            await asyncio.gather(*self._closing)
+
+    async def deliver(self, timer_id: str, url: str) -> WebhookResult:
+        """
+        POST the timer id to `url`.
+
+        :param timer_id: the unique identifier of the timer, sent as the `id` form field
+        :param url: the URL to which the POST request should be sent
+        :return: the outcome, without a status code if no response was received
+        """
+        return await self._post(url, timer_id, data={"id": timer_id})
+
+    async def deliver_batch(self, timer_ids: List[str], url: str) -> WebhookResult:
+        """
+        POST the ids of coalesced timers to `url` in one request, as the JSON body `{"ids": [...]}`.
+
+        :param timer_ids: the timers sharing the request
+        :param url: the URL to which the POST request should be sent
+        :return: the outcome, shared by every timer of the batch
+        """
+        return await self._post(url, f"{len(timer_ids)} coalesced timers", json={"ids": timer_ids})
+
+    async def _post(self, url: str, description: str, **request: Any) -> WebhookResult:
+        host = urlsplit(url).netloc
+        started = time.perf_counter()
+        status = "error"
+        try:
+            logger.info("Triggering request to %s, for timer_id %s", url, description)
+            pool = self._host(url)
+            pool.users += 1
+            try:
+                queued = time.perf_counter()
+                async with self.throttle.slot(host), pool.slot:
+                    started = time.perf_counter()
+                    WEBHOOK_THROTTLED_SECONDS.labels(host=host, limit="concurrency").observe(started - queued)
+                    response = await pool.client.post(url, **request)
+            finally:
+                pool.users -= 1
+            status = str(response.status_code)
+            if response.status_code == 200:
+                logger.info("Webhook for %s triggered successfully.", description)
+            else:
+                logger.info("Webhook for %s failed with status %s", description, response.status_code)
+            return WebhookResult(
+                response.status_code, response.text, parse_retry_after(response.headers.get("Retry-After"))
+            )
+        except httpx.HTTPError as e:
+            logger.warning("Error triggering webhook for %s: %s", description, e)
+            return WebhookResult(None, str(e))
+        finally:
+            WEBHOOK_SECONDS.labels(host=host, status=status).observe(time.perf_counter() - started)
+
+    @staticmethod
+    def outcome_update(result: WebhookResult) -> dict:
+        """
+        Update dict recording a final webhook outcome on the timer document.
+
+        The attempt is counted and appended to the capped `attempt_history`. Long response bodies are cut,
+        see `compact_response`.
+        """
+        attempt = WebhookAttempt(
+            at=datetime.now(tz=timezone.utc),
+            status_code=result.status_code,
+            error=None if result.status_code is not None else result.response[:200],
+        )
+        update_dict = {
+            "$set": {"success": result.success, "status": TimerStatus.FIRED},
+            "$unset": {"lease_expires_at": ""},
+            "$inc": {"attempts": 1},
+            "$push": {"attempt_history": {
+                "$each": [attempt.model_dump(exclude_none=True)], "$slice": -settings.WEBHOOK_ATTEMPT_HISTORY,
+            }},
+        }
+        for field, value in compact_response(result.response).items():
+            if value is None:
+                update_dict["$unset"][field] = ""
+            else:
+                update_dict["$set"][field] = value
+        if result.status_code is not None:
+            update_dict["$set"]["status_code"] = result.status_code
+        return update_dict
+
+    async def _throttle(self, timers: List[Tuple[str, str]], url: str, claimed: bool) -> bool:
+        """
+        Wait for the next send slot of the host of `url`.
+
+        :param timers: (timer_id, claim_id) of the timers sharing the request
+        :return: False if the claimed timers were handed back to the scheduler instead
+        """
+        host = urlsplit(url).netloc
+        wait = await self.throttle.reserve(host, max_delay=None if claimed else float("inf"))
+        if claimed and wait > self.throttle.max_delay:
+            until = datetime.now(tz=timezone.utc) + timedelta(seconds=wait)
+            for timer_id, claim_id in timers:
+                if await timer.defer_timer(timer_id, claim_id, until):
+                    WEBHOOK_DEFERRED.labels(host=host).inc()
+                    logger.info("Host %s is throttled for %.1fs, deferred timer %s", host, wait, timer_id)
+            return False
+        if wait > 0:
+            WEBHOOK_THROTTLED_SECONDS.labels(host=host, limit="rate").observe(wait)
+            await asyncio.sleep(wait)
+        return True
+
+    @staticmethod
+    def _observe_lateness(timer_db: TimerDB) -> None:
+        """Record how late a timer's first attempt is, retries are late by design."""
+        if timer_db.attempts:
+            return
+        eta = timer_db.eta if timer_db.eta.tzinfo else timer_db.eta.replace(tzinfo=timezone.utc)
+        FIRING_LATENESS_SECONDS.observe(max((datetime.now(tz=timezone.utc) - eta).total_seconds(), 0.0))
+
+    @staticmethod
+    def _advance_recurrence(update_dict: dict, timer_db: TimerDB, result: WebhookResult) -> None:
+        """
+        Turn the final outcome update of one occurrence of a recurring timer into the next occurrence.
+
+        The occurrence is appended to the capped `occurrence_history` and, unless `max_occurrences` is
+        reached, the same document goes back to pending under the eta and due bucket of the next occurrence
+        with a fresh attempt count. Only that next occurrence ever exists in the `timer` collection.
+        """
+        now = datetime.now(tz=timezone.utc)
+        recurrence = timer_db.recurrence
+        occurrence = Occurrence(eta=timer_db.eta, fired_at=now, success=result.success, status_code=result.status_code)
+        del update_dict["$inc"]["attempts"]
+        update_dict["$inc"]["recurrence.occurrences"] = 1
+        update_dict["$push"]["occurrence_history"] = {
+            "$each": [occurrence.model_dump(exclude_none=True)], "$slice": -settings.TIMER_OCCURRENCE_HISTORY,
+        }
+        if recurrence.max_occurrences and recurrence.occurrences + 1 >= recurrence.max_occurrences:
+            return
+        eta = recurrence.next_after(timer_db.eta, now)
+        update_dict["$set"].update({"status": TimerStatus.PENDING, "eta": eta, "due_bucket": due_bucket(eta), "attempts": 0})
+        update_dict["$unset"].update({"claim_id": "", "dispatched_at": ""})
+
+    async def _settle(
+        self,
+        timer_id: str,
+        url: str,
+        attempts: int,
+        result: WebhookResult,
+        claimed: bool,
+        timer_db: Optional[TimerDB] = None,
+    ) -> None:
+        """
+        Buffer the update recording `result` on a timer.
+
+        A retryable failure of a claimed timer with attempts left puts it back to pending under the due bucket
+        of its backoff. Any other failure is final and the timer is dead-lettered. Once an occurrence of a
+        recurring timer is final, the timer moves on to its next occurrence. Final outcomes are counted in the
+        timer counters of the user.
+
+        :param attempts: attempts made before this one
+        :param claimed: whether the timer was acquired under a claim, unclaimed timers are never retried
+        :param timer_db: the acquired timer, needed to reschedule a recurring one and to count the outcome
+        """
+        update_dict = self.outcome_update(result)
+        attempt = attempts + 1
+        if not result.success:
+            if claimed and attempt < self.retry_policy.max_attempts and self.retry_policy.is_retryable(result.status_code):
+                retry_at = datetime.now(tz=timezone.utc) + timedelta(
+                    seconds=self.retry_policy.backoff(attempt, result.retry_after)
+                )
+                update_dict["$set"].update({"status": TimerStatus.PENDING, "due_bucket": due_bucket(retry_at)})
+                update_dict["$unset"].update({"claim_id": "", "dispatched_at": ""})
+                WEBHOOK_RETRIES.labels(host=urlsplit(url).netloc).inc()
+                await result_writer.add(timer_id, update_dict)
+                return
+            await self.dead_letter(timer_id, url, attempt, result)
+        if timer_db is None:
+            await result_writer.add(timer_id, update_dict)
+            return
+        if timer_db.recurrence is not None:
+            self._advance_recurrence(update_dict, timer_db, result)
+        counters = {"fired" if result.success else "failed": 1}
+        if update_dict["$set"]["status"] != TimerStatus.PENDING:
+            counters["pending"] = -1
+        await result_writer.add(timer_id, update_dict, user_id=timer_db.user_id, counters=counters)
+
+    async def fire(self, timer_id: str, url: str, claim_id: Optional[str] = None) -> None:
+        """
+        Deliver the webhook and buffer the outcome for the next bulk write to the timer document.
+
+        With a `claim_id` the timer is first acquired, and a stale or duplicate dispatch is dropped without
+        taking a send slot of the host. The send then waits for its slot under the host's rate limit. A claimed
+        timer whose slot is further away than the throttle's `max_delay` is handed back to the scheduler
+        instead of waiting. Failures are retried or dead-lettered, see `_settle`.
+        """
+        attempts = 0
+        timer_db = None
+        if claim_id:
+            timer_db = await timer.acquire_timer(timer_id, claim_id)
+            if timer_db is None:
+                logger.info("Timer %s is no longer held by claim %s, skipping", timer_id, claim_id)
+                return
+            attempts = timer_db.attempts
+            result_writer.hold([(timer_id, claim_id)])
+
+        try:
+            if not await self._throttle([(timer_id, claim_id)], url, claimed=bool(claim_id)):
+                result_writer.release([timer_id])
+                return
+            if timer_db is not None:
+                self._observe_lateness(timer_db)
+            result = await self.deliver(timer_id, url)
+            await self._settle(timer_id, url, attempts, result, claimed=bool(claim_id), timer_db=timer_db)
+        except BaseException:
+            # Let the lease run out, the sweeper dispatches the timer again
+            result_writer.release([timer_id])
+            raise
+
+    async def fire_batch(self, url: str, timers: List[Tuple[str, str]]) -> None:
+        """
+        Deliver one batched webhook for coalesced timers and fan the outcome out to each of them.
+
+        Works like `fire` for the whole batch: one acquire for every timer, one rate limit slot and one POST
+        carrying the ids of the timers still held by their claim. The per timer results go through the result
+        writer, so they reach Mongo in a single `bulk_write`.
+
+        :param url: the URL shared by the timers
+        :param timers: (timer_id, claim_id) pairs
+        """
+        acquired = await timer.acquire_timers(timers)
+        if len(acquired) < len(timers):
+            logger.info("%s coalesced timers are no longer held by their claim, skipping them",
+                        len(timers) - len(acquired))
+        if not acquired:
+            return
+        held = [(str(timer_db.id), timer_db.claim_id) for timer_db in acquired]
+        result_writer.hold(held)
+
+        try:
+            if not await self._throttle(held, url, claimed=True):
+                result_writer.release(timer_id for timer_id, _ in held)
+                return
+            for timer_db in acquired:
+                self._observe_lateness(timer_db)
+            result = await self.deliver_batch([timer_id for timer_id, _ in held], url)
+            for timer_db in acquired:
+                await self._settle(str(timer_db.id), url, timer_db.attempts, result, claimed=True, timer_db=timer_db)
+        except BaseException:
+            result_writer.release(timer_id for timer_id, _ in held)
+            raise
+
+    @staticmethod
+    async def dead_letter(timer_id: str, url: str, attempts: int, result: WebhookResult) -> None:
+        """Record a timer that failed for good in the dead-letter collection."""
+        WEBHOOK_DEAD_LETTERED.labels(host=urlsplit(url).netloc).inc()
+        try:
+            await dead_letter.add(timer_id, url, attempts, status_code=result.status_code, response=result.response)
+        except Exception as e:
+            logger.warning("Dead-lettering timer %s failed: %s", timer_id, e)
+
+    def submit(self, timer_id: str, url: str, claim_id: Optional[str] = None) -> Future:
+        """
+        Schedule a delivery on the worker loop without waiting for it.
+
+        Blocks the calling thread while `max_in_flight` deliveries are already pending.
+        """
+        return self._submit(self.fire(timer_id, url, claim_id))
+
+    def submit_batch(self, url: str, timers: List[Tuple[str, str]]) -> Future:
+        """Schedule a batched delivery of coalesced timers like `submit`, it takes a single in-flight slot."""
+        return self._submit(self.fire_batch(url, timers))
+
+    def _submit(self, delivery: Coroutine[Any, Any, None]) -> Future:
+        self._in_flight.acquire()
+        WEBHOOK_IN_FLIGHT.inc()
+        try:
+            future = run_coroutine(delivery)
+        except BaseException:
+            # Never scheduled, so `_on_done` will not give the slot back
+            delivery.close()
+            self._in_flight.release()
+            WEBHOOK_IN_FLIGHT.dec()
+            raise
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future) -> None:
+        self._in_flight.release()
+        WEBHOOK_IN_FLIGHT.dec()
+        if not future.cancelled() and future.exception():
+            logger.warning("Webhook delivery failed: %s", future.exception())
+
+
+delivery_engine = WebhookDeliveryEngine()
@@ -0,0 +1,43 @@
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+from celery.signals import worker_process_shutdown, worker_ready
+from prometheus_client import multiprocess, start_http_server
+
+from src.settings import settings
+from src.utilities.metrics import WEBHOOK_QUEUE_DEPTH, metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+def _poll_queue_depth(app: Any) -> None:
+    """Sample the number of ready messages of every worker queue, forever."""
+    while True:
+        time.sleep(settings.WORKER_QUEUE_DEPTH_POLL_SECONDS)
+        try:
+            with app.connection_for_read() as connection:
+                channel = connection.default_channel
+                for queue in app.conf.task_queues or ():
+                    declared = channel.queue_declare(queue=queue.name, passive=True)
+                    WEBHOOK_QUEUE_DEPTH.labels(queue=queue.name).set(declared.message_count)
+        except Exception as e:
+            logger.warning("Sampling queue depth failed: %s", e)
+
+
+@worker_ready.connect
+def _start_exporter(sender: Any = None, **_: Any) -> None:
+    """Serve worker metrics from the main worker process, aggregating prefork children when enabled."""
+    start_http_server(settings.WORKER_METRICS_PORT, registry=metrics_registry())
+    threading.Thread(
+        target=_poll_queue_depth, args=(sender.app,), name="queue-depth", daemon=True
+    ).start()
+
+
+@worker_process_shutdown.connect
+def _mark_process_dead(pid: Any = None, **_: Any) -> None:
+    """Drop the live gauges of an exiting prefork child from the multiprocess aggregate."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
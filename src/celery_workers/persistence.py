@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from typing import Any, Iterable, Mapping, Optional, Tuple
+
+from bson import ObjectId
+from celery.signals import worker_process_shutdown
+
+from src.celery_workers.runtime import run_coroutine
+from src.database.timer import timer
+from src.database.timer_counters import timer_counters
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TimerResultWriter:
+    """
+    Buffers webhook results on the worker loop and writes them to the `timer` collection in bulk.
+
+    Results are flushed as one unordered `bulk_write` once `batch_size` of them are pending or the oldest
+    has waited `flush_seconds`, whichever comes first. All access happens on the worker's single event
+    loop, so the buffer needs no locking, and every write goes through the one Motor client of the process.
+
+    The per user counter changes of the results are buffered alongside and written right after their timers.
+
+    Timers acquired for firing are held from their acquire until their result is written: their lease is
+    renewed every third of `WEBHOOK_LEASE_SECONDS`, so the sweeper only takes over timers of a process that
+    died, and their result only applies while they are still firing under the held claim.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, flush_seconds: Optional[float] = None) -> None:
+        """
+        :param batch_size: results per bulk write, defaults to `WEBHOOK_RESULT_BATCH_SIZE`
+        :param flush_seconds: max buffering delay, defaults to `WEBHOOK_RESULT_FLUSH_SECONDS`
+        """
+        self.batch_size = batch_size or settings.WEBHOOK_RESULT_BATCH_SIZE
+        self.flush_seconds = flush_seconds or settings.WEBHOOK_RESULT_FLUSH_SECONDS
+        self._buffer: list[tuple[str, dict[str, Any]]] = []
+        self._counters: list[tuple[ObjectId, Mapping[str, int]]] = []
+        self._timer_handle: Optional[asyncio.TimerHandle] = None
+        # Claim id by timer id of the timers this process fires and has not written the result of yet
+        self._leases: dict[str, str] = {}
+        self._renewal: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    async def add(
+        self,
+        timer_id: str,
+        update_obj: dict[str, Any],
+        user_id: Optional[ObjectId] = None,
+        counters: Optional[Mapping[str, int]] = None,
+    ) -> None:
+        """
+        Queue the update recording a webhook outcome.
+
+        :param timer_id: the id of the timer document that needs to be updated
+        :param update_obj: the update dict
+        :param user_id: the user of the timer, whose counters change by `counters`
+        :param counters: {counter: delta} changes of the user's timer counters
+        """
+        self._buffer.append((timer_id, update_obj))
+        if user_id is not None and counters:
+            self._counters.append((user_id, counters))
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+        elif self._timer_handle is None:
+            loop = asyncio.get_running_loop()
+            self._timer_handle = loop.call_later(self.flush_seconds, lambda: loop.create_task(self.flush()))
+
+    def hold(self, timers: Iterable[Tuple[str, str]]) -> None:
+        """
+        Keep renewing the lease of acquired timers until their result is written.
+
+        :param timers: (timer_id, claim_id) pairs
+        """
+        self._leases.update(timers)
+        if self._renewal is None and self._leases:
+            self._renewal = asyncio.get_running_loop().create_task(self._renew_leases())
+
+    def release(self, timer_ids: Iterable[str]) -> None:
+        """Stop renewing the lease of timers whose result this process will not write."""
+        for timer_id in timer_ids:
+            self._leases.pop(timer_id, None)
+
+    async def _renew_leases(self) -> None:
+        try:
+            while self._leases:
+                await asyncio.sleep(settings.WEBHOOK_LEASE_SECONDS / 3)
+                if not self._leases:
+                    break
+                try:
+                    await timer.renew_leases(list(self._leases.items()))
+                except Exception as e:
+                    logger.warning("Renewing the leases of %s firing timers failed: %s", len(self._leases), e)
+        finally:
+            self._renewal = None
+
+    async def flush(self) -> int:
+        """
+        Write every buffered result now.
+
+        A failed write puts its batch back at the front of the buffer so the next flush retries it.
+
+        :return: number of results written
+        """
+        if self._timer_handle is not None:
+            self._timer_handle.cancel()
+            self._timer_handle = None
+        if not self._buffer:
+            return 0
+
+        batch, self._buffer = self._buffer, []
+        counters, self._counters = self._counters, []
+        claims = {timer_id: self._leases[timer_id] for timer_id, _ in batch if timer_id in self._leases}
+        try:
+            await timer.bulk_update_timer_requests(batch, claims=claims)
+        except Exception as e:
+            logger.warning("Writing %s webhook results failed, keeping them buffered: %s", len(batch), e)
+            self._buffer[:0] = batch
+            self._counters[:0] = counters
+            loop = asyncio.get_running_loop()
+            self._timer_handle = loop.call_later(self.flush_seconds, lambda: loop.create_task(self.flush()))
+            return 0
+        self.release(claims)
+        try:
+            await timer_counters.add(counters)
+        except Exception as e:
+            logger.warning("Updating timer counters of %s webhook results failed: %s", len(batch), e)
+        return len(batch)
+
+
+result_writer = TimerResultWriter()
+
+
+@worker_process_shutdown.connect
+def _flush_results(**_: Any) -> None:
+    """Write buffered results before the worker process exits."""
+    try:
+        run_coroutine(result_writer.flush()).result(timeout=settings.WEBHOOK_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.warning("Flushing webhook results on shutdown failed: %s", e)
@@ -0,0 +1,68 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Optional
+
+from src.settings import settings
+
+
+class RetryPolicy:
+    """
+    Which failed webhooks are retried, how often, and how long to back off in between.
+
+    Backoff doubles with every attempt up to `max_seconds`, with equal jitter (a random point in the upper
+    half of the window) so timers that failed together against the same host do not come back together.
+    A `Retry-After` from the host is honoured when it asks for longer.
+    """
+
+    def __init__(
+        self,
+        max_attempts: Optional[int] = None,
+        base_seconds: Optional[float] = None,
+        max_seconds: Optional[float] = None,
+        status_codes: Optional[Iterable[int]] = None,
+    ) -> None:
+        """
+        :param max_attempts: attempts per timer including the first, defaults to `WEBHOOK_MAX_ATTEMPTS`
+        :param base_seconds: backoff before the first retry, defaults to `WEBHOOK_RETRY_BASE_SECONDS`
+        :param max_seconds: backoff upper bound, defaults to `WEBHOOK_RETRY_MAX_SECONDS`
+        :param status_codes: retryable response codes, defaults to `WEBHOOK_RETRY_STATUS_CODES`
+        """
+        self.max_attempts = max_attempts or settings.WEBHOOK_MAX_ATTEMPTS
+        self.base_seconds = base_seconds or settings.WEBHOOK_RETRY_BASE_SECONDS
+        self.max_seconds = max_seconds or settings.WEBHOOK_RETRY_MAX_SECONDS
+        self.status_codes = frozenset(settings.WEBHOOK_RETRY_STATUS_CODES if status_codes is None else status_codes)
+
+    def is_retryable(self, status_code: Optional[int]) -> bool:
+        """A response with a retryable status code, or no response at all (connection error, timeout)."""
+        return status_code is None or status_code in self.status_codes
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Seconds to wait before the next attempt.
+
+        :param attempt: number of the attempt that just failed, starting at 1
+        :param retry_after: delay the host asked for, if any
+        """
+        window = min(self.max_seconds, self.base_seconds * 2 ** (attempt - 1))
+        delay = random.uniform(window / 2, window)
+        if retry_after:
+            delay = max(delay, min(retry_after, self.max_seconds))
+        return delay
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a `Retry-After` header given as delay seconds or as an HTTP date, None if absent or invalid."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(tz=timezone.utc)).total_seconds(), 0.0)
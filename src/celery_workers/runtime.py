@@ -0,0 +1,34 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Optional
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def worker_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the event loop shared by all async work of the current worker process.
+
+    The loop runs forever in a daemon thread and is started on first use. It is keyed by pid, so a
+    prefork child never reuses the (thread-less) loop object inherited from its parent.
+    """
+    global _loop, _loop_pid
+
+    if _loop is not None and _loop_pid == os.getpid():
+        return _loop
+
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="worker-loop", daemon=True).start()
+            _loop, _loop_pid = loop, os.getpid()
+    return _loop
+
+
+def run_coroutine(coro: Coroutine[Any, Any, Any]) -> Future:
+    """Schedule `coro` on the worker loop from any thread and return a concurrent future for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, worker_loop())
@@ -0,0 +1,65 @@
+import logging
+from concurrent.futures import Future
+from typing import Any, Optional, Set
+
+from celery.signals import worker_ready, worker_shutdown
+
+from src.celery_workers.celery_app import shard_queue
+from src.celery_workers.runtime import run_coroutine, worker_loop
+from src.scheduler.sharding import ShardCoordinator
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_coordinator: Optional[ShardCoordinator] = None
+_leasing: Optional[Future] = None
+
+
+class ShardConsumers:
+    """Points a worker node's consumers at the queues of the shards it leases."""
+
+    def __init__(self, app: Any, hostname: str) -> None:
+        """
+        :param app: the Celery app
+        :param hostname: the worker node name, as given with `celery worker -n`
+        """
+        self.app = app
+        self.hostname = hostname
+
+    def __call__(self, gained: Set[int], lost: Set[int]) -> None:
+        for shard in sorted(gained):
+            self.app.control.add_consumer(shard_queue(shard), destination=[self.hostname])
+        for shard in sorted(lost):
+            self.app.control.cancel_consumer(shard_queue(shard), destination=[self.hostname])
+
+
+@worker_ready.connect
+def _start_shard_leases(sender: Any = None, **_: Any) -> None:
+    """
+    With `WORKER_SHARD_LEASES`, lease shards for this worker node and consume only their queues.
+
+    The worker is expected to start on `-Q webhook_queue`; shard queues are added and cancelled as leases
+    are gained and lost. Which worker sends a webhook does not affect correctness, the acquire
+    compare-and-set does, so a message consumed just before a handoff is still fired exactly once.
+    """
+    global _coordinator, _leasing
+    if not settings.WORKER_SHARD_LEASES:
+        return
+    _coordinator = ShardCoordinator(
+        role="worker",
+        node_id=settings.NODE_ID or sender.hostname,
+        on_change=ShardConsumers(sender.app, sender.hostname),
+    )
+    _leasing = run_coroutine(_coordinator.run())
+
+
+@worker_shutdown.connect
+def _stop_shard_leases(**_: Any) -> None:
+    """Stop leasing and hand the worker node's shards to the other nodes."""
+    if _coordinator is None or _leasing is None:
+        return
+    worker_loop().call_soon_threadsafe(_coordinator.stop)
+    try:
+        _leasing.result(timeout=settings.SHARD_LEASE_SECONDS)
+    except Exception as e:
+        logger.warning("Releasing the worker shard leases failed: %s", e)
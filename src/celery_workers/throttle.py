@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Optional
+
+from bson import ObjectId
+
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# GCRA reservation: KEYS[1] holds the host's theoretical arrival time (TAT).
+# ARGV: now, emission interval, burst tolerance, max delay. Returns the wait as a string (Lua numbers are
+# truncated to integers on the way out); the slot is only reserved when the wait is within max delay.
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local tolerance = tonumber(ARGV[3])
+local max_delay = tonumber(ARGV[4])
+local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+if tat < now then tat = now end
+local wait = tat - tolerance - now
+if wait < 0 then wait = 0 end
+if wait <= max_delay then
+    tat = tat + interval
+    redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000) + 1000)
+end
+return tostring(wait)
+"""
+
+# Concurrency slot: KEYS[1] is a sorted set of slot tokens scored by their expiry, so slots of a crashed
+# process free themselves. ARGV: now, expiry, token, limit. Returns 1 if the slot was taken.
+ACQUIRE_SLOT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+    redis.call('PEXPIREAT', KEYS[1], math.ceil(tonumber(ARGV[2]) * 1000))
+    return 1
+end
+return 0
+"""
+
+# Lua has no infinity literal, waits are capped to this instead
+_NO_MAX_DELAY = 1e12
+
+
+class HostThrottle:
+    """
+    Per destination host rate limit and concurrency cap for outgoing webhooks.
+
+    The rate limit is a token bucket in its GCRA form: every webhook reserves the next free send slot of its
+    host and waits for it, so a burst of timers for one host is spread out at the host's rate instead of
+    being sent at once. A webhook whose slot is more than `max_delay` away reserves nothing and the caller
+    hands it back to the scheduler. With a Redis url the bucket state and the concurrency slots are shared
+    by every worker process using that Redis, typically one instance local to the worker node. Redis
+    failures are logged and fall back to the per process state.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        host_rates: Optional[dict[str, float]] = None,
+        concurrency: Optional[int] = None,
+        max_delay: Optional[float] = None,
+        redis_url: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+        client: Any = None,
+    ) -> None:
+        """
+        :param rate: webhooks per second per host, defaults to `WEBHOOK_RATE_LIMIT_PER_HOST`, 0 disables
+        :param burst: webhooks a host may receive back to back, defaults to `WEBHOOK_RATE_LIMIT_BURST`
+        :param host_rates: per host rate overrides, defaults to `WEBHOOK_HOST_RATE_LIMITS`
+        :param concurrency: shared concurrent POSTs per host, defaults to `WEBHOOK_MAX_CONNECTIONS_PER_HOST`
+        :param max_delay: longest wait `reserve` commits to, defaults to `WEBHOOK_THROTTLE_MAX_DELAY_SECONDS`
+        :param redis_url: shared state url, defaults to `WEBHOOK_THROTTLE_REDIS_URL`, empty keeps it per process
+        :param clock: wall clock in seconds, shared with the other processes through Redis
+        :param client: an existing `redis.asyncio` client to share state through instead, e.g. fakeredis in tests
+        """
+        self.rate = settings.WEBHOOK_RATE_LIMIT_PER_HOST if rate is None else rate
+        self.burst = burst or settings.WEBHOOK_RATE_LIMIT_BURST
+        self.host_rates = settings.WEBHOOK_HOST_RATE_LIMITS if host_rates is None else host_rates
+        self.concurrency = concurrency or settings.WEBHOOK_MAX_CONNECTIONS_PER_HOST
+        self.max_delay = settings.WEBHOOK_THROTTLE_MAX_DELAY_SECONDS if max_delay is None else max_delay
+        self.clock = clock
+        self._tat: dict[str, float] = {}
+        self._redis = client
+        redis_url = settings.WEBHOOK_THROTTLE_REDIS_URL if redis_url is None else redis_url
+        if self._redis is None and redis_url:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(redis_url)
+        if self._redis is not None:
+            self._reserve_script = self._redis.register_script(RESERVE_SCRIPT)
+            self._acquire_slot_script = self._redis.register_script(ACQUIRE_SLOT_SCRIPT)
+
+    def rate_for(self, host: str) -> float:
+        """Webhooks per second allowed to `host`, 0 for no limit."""
+        return self.host_rates.get(host, self.rate)
+
+    def _reserve_local(self, host: str, now: float, interval: float, tolerance: float, max_delay: float) -> float:
+        tat = max(self._tat.get(host, now), now)
+        wait = max(tat - tolerance - now, 0.0)
+        if wait <= max_delay:
+            self._tat[host] = tat + interval
+        return wait
+
+    async def reserve(self, host: str, max_delay: Optional[float] = None) -> float:
+        """
+        Reserve the next send slot of `host`.
+
+        :param host: destination host, as `host[:port]`
+        :param max_delay: only reserve a slot this close, defaults to the throttle's `max_delay`,
+            `float("inf")` always reserves
+        :return: seconds to wait before sending; a wait above `max_delay` means nothing was reserved
+        """
+        rate = self.rate_for(host)
+        if rate <= 0:
+            return 0.0
+        max_delay = min(self.max_delay if max_delay is None else max_delay, _NO_MAX_DELAY)
+        interval = 1.0 / rate
+        tolerance = interval * (self.burst - 1)
+        now = self.clock()
+        if self._redis is not None:
+            try:
+                wait = await self._reserve_script(
+                    keys=[f"webhook:rate:{host}"], args=[now, interval, tolerance, max_delay]
+                )
+                return float(wait)
+            except Exception as e:
+                logger.warning("Shared rate limit for %s unavailable, using the process limit: %s", host, e)
+        return self._reserve_local(host, now, interval, tolerance, max_delay)
+
+    @asynccontextmanager
+    async def slot(self, host: str) -> AsyncIterator[None]:
+        """
+        Hold one of the shared concurrency slots of `host` while sending.
+
+        Without Redis this is a no-op, the host pool of each process caps its own concurrency.
+        Slots expire after the webhook timeout in case their holder dies.
+        """
+        if self._redis is None:
+            yield
+            return
+
+        key = f"webhook:slots:{host}"
+        token = str(ObjectId())
+        acquired = False
+        while not acquired:
+            now = self.clock()
+            try:
+                acquired = bool(await self._acquire_slot_script(
+                    keys=[key], args=[now, now + settings.WEBHOOK_TIMEOUT_SECONDS + 5, token, self.concurrency]
+                ))
+            except Exception as e:
+                logger.warning("Shared concurrency cap for %s unavailable, using the process cap: %s", host, e)
+                break
+            if not acquired:
+                await asyncio.sleep(random.uniform(0.01, 0.05))
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    await self._redis.zrem(key, token)
+                except Exception as e:
+                    logger.warning("Releasing a concurrency slot of %s failed: %s", host, e)
@@ -1,12 +1,14 @@
 from datetime import datetime, timezone
-from typing import Any, Generic, Mapping, Tuple, TypeVar, Union, Optional, List
+from typing import Any, ClassVar, Generic, Mapping, Sequence, Tuple, TypeVar, Union, Optional, List
 
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorCollection
-from pymongo import DESCENDING, ReturnDocument
-from pymongo.results import DeleteResult, UpdateResult
+from pymongo import DESCENDING, IndexModel, ReturnDocument
+from pymongo.operations import UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, UpdateResult
 
 from src.database.db import Database
+from src.database.query_plans import HotQuery
 from src.models.base import BaseDBModel
 
 
@@ -24,6 +26,7 @@ class BaseCrud(Generic[ModelType]):
         _model_class (type[ModelType]): The model class that defines the structure 
                                         and validation for the data in the MongoDB collection.
         _collection_name (str): The name of the MongoDB collection associated with the model.
+        _indexes (list[IndexModel]): Indexes the collection needs, created idempotently by `ensure_indexes`.
     
     Properties:
         _collection (AsyncIOMotorCollection): Provides an async interface to the MongoDB collection 
@@ -32,6 +35,7 @@ class BaseCrud(Generic[ModelType]):
 
     _model_class: type[ModelType]
     _collection_name: str
+    _indexes: ClassVar[List[IndexModel]] = []
 
     def __init__(self) -> None:
         """
@@ -49,3 +53,29 @@ class BaseCrud(Generic[ModelType]):
     def _collection(self) -> AsyncIOMotorCollection:
         return Database().db[self._collection_name]
 
+    async def ensure_indexes(self) -> List[str]:
+        """
+        Create the declared indexes of the collection.
+
+        Safe to run on every startup: Mongo leaves an index alone when one with the same name and
+        definition already exists, and fails loudly when a definition changed under the same name.
+
+        :return: the names of the declared indexes
+        """
+        if not self._indexes:
+            return []
+        return await self._collection.create_indexes(self._indexes)
+
+    def hot_queries(self) -> List[HotQuery]:
+        """Query shapes that must stay index backed, checked by `src.database.query_plans`."""
+        return []
+
+    async def bulk_write(self, operations: Sequence[UpdateOne], ordered: bool = False) -> BulkWriteResult:
+        """
+        Send many write operations to the collection in a single round-trip.
+
+        :param operations: pymongo write operations
+        :param ordered: stop at the first failing operation instead of applying the rest
+        :return: the pymongo bulk write result
+        """
+        return await self._collection.bulk_write(list(operations), ordered=ordered)
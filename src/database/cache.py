@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timezone
+from typing import Any, Iterable, NamedTuple, Optional
+
+from cachetools import TTLCache
+
+from src.settings import settings
+from src.utilities.metrics import TIMER_CACHE_LOOKUP_SECONDS, TIMER_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Ids of invalidated timers are published here, so every process drops them from its local tier
+INVALIDATION_CHANNEL = "timer:eta:invalidated"
+
+
+class TimerEtaCache:
+    """
+    Two-tier cache of timer etas keyed by timer id.
+
+    The first tier is a bounded in-process LRU with a short TTL. The optional second tier is a Redis
+    instance shared by every process, enabled by `TIMER_CACHE_REDIS_URL`. Redis failures are logged and
+    treated as misses so the cache can never take reads down with it. Etas are stored as naive UTC
+    datetimes, the same shape Mongo returns them in.
+
+    Invalidations are published on the shared tier, and every process following them with `start` drops the
+    timers from its local tier. A read-through fill racing an invalidation is not stored: it carries the
+    `generation` read before Mongo was queried, and the shared tier keeps a short-lived tombstone that fills
+    do not overwrite.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        ttl: Optional[float] = None,
+        redis_url: Optional[str] = None,
+        redis_ttl: Optional[int] = None,
+    ) -> None:
+        """
+        :param maxsize: max entries kept in process, defaults to `TIMER_CACHE_MAXSIZE`
+        :param ttl: seconds an entry lives in process, defaults to `TIMER_CACHE_TTL_SECONDS`
+        :param redis_url: shared tier url, defaults to `TIMER_CACHE_REDIS_URL`, empty disables the tier
+        :param redis_ttl: seconds an entry lives in the shared tier, defaults to `TIMER_CACHE_REDIS_TTL_SECONDS`
+        """
+        self.ttl = ttl or settings.TIMER_CACHE_TTL_SECONDS
+        self._local: TTLCache = TTLCache(maxsize=maxsize or settings.TIMER_CACHE_MAXSIZE, ttl=self.ttl)
+        # Generation each recently invalidated timer was dropped at, kept as long as a local entry would live
+        self._invalidated: TTLCache = TTLCache(maxsize=maxsize or settings.TIMER_CACHE_MAXSIZE, ttl=self.ttl)
+        self.generation = 0
+        self._listener: Optional[asyncio.Task] = None
+        self.redis_ttl = redis_ttl or settings.TIMER_CACHE_REDIS_TTL_SECONDS
+        self._redis = None
+        redis_url = settings.TIMER_CACHE_REDIS_URL if redis_url is None else redis_url
+        if redis_url:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(redis_url)
+
+    @staticmethod
+    def _key(timer_id: str) -> str:
+        return f"timer:eta:{timer_id}"
+
+    def _stale(self, timer_id: str, generation: int) -> bool:
+        """Whether the timer was invalidated after `generation`."""
+        return self._invalidated.get(timer_id, 0) > generation
+
+    def _drop(self, timer_ids: Iterable[str]) -> None:
+        self.generation += 1
+        for timer_id in timer_ids:
+            self._local.pop(timer_id, None)
+            self._invalidated[timer_id] = self.generation
+
+    async def start(self) -> None:
+        """Follow the invalidations published by other processes, a no-op without the shared tier."""
+        if self._redis is not None and self._listener is None:
+            pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+            except Exception as e:
+                logger.warning("Subscribing to timer cache invalidations failed: %s", e)
+            self._listener = asyncio.get_running_loop().create_task(self._listen(pubsub))
+
+    async def _listen(self, pubsub: Any) -> None:
+        try:
+            while True:
+                try:
+                    if not pubsub.subscribed:
+                        await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    async for message in pubsub.listen():
+                        self._drop(message["data"].decode().split(","))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Following timer cache invalidations failed: %s", e)
+                    # Invalidations published meanwhile are lost, forget everything they may have covered
+                    self._drop(list(self._local.keys()))
+                    await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+    async def get(self, timer_id: str) -> Optional[datetime]:
+        """
+        Look a timer eta up in process first, then in the shared tier.
+
+        :return: the cached eta, or None on a miss in every tier
+        """
+        started = time.perf_counter()
+        eta = self._local.get(timer_id)
+        if eta is not None:
+            TIMER_CACHE_REQUESTS.labels(tier="local", result="hit").inc()
+            TIMER_CACHE_LOOKUP_SECONDS.labels(source="local").observe(time.perf_counter() - started)
+            return eta
+        TIMER_CACHE_REQUESTS.labels(tier="local", result="miss").inc()
+
+        if self._redis is None:
+            return None
+
+        generation = self.generation
+        try:
+            raw = await self._redis.get(self._key(timer_id))
+        except Exception as e:
+            logger.warning("Timer cache read failed: %s", e)
+            return None
+
+        # An empty value is the tombstone of an invalidation
+        if not raw:
+            TIMER_CACHE_REQUESTS.labels(tier="redis", result="miss").inc()
+            return None
+
+        TIMER_CACHE_REQUESTS.labels(tier="redis", result="hit").inc()
+        eta = datetime.fromtimestamp(float(raw), tz=timezone.utc).replace(tzinfo=None)
+        if not self._stale(timer_id, generation):
+            self._local[timer_id] = eta
+        TIMER_CACHE_LOOKUP_SECONDS.labels(source="redis").observe(time.perf_counter() - started)
+        return eta
+
+    async def set(self, timer_id: str, eta: datetime, generation: Optional[int] = None) -> None:
+        """
+        Store a timer eta in every tier.
+
+        :param generation: for a read-through fill, the `generation` read before the eta was. The eta is then
+            dropped if the timer was invalidated since, and it never overwrites an entry of the shared tier.
+        """
+        if generation is not None and self._stale(timer_id, generation):
+            return
+        if eta.tzinfo is not None:
+            eta = eta.astimezone(timezone.utc).replace(tzinfo=None)
+        self._local[timer_id] = eta
+        if self._redis is None:
+            return
+        try:
+            await self._redis.set(
+                self._key(timer_id),
+                eta.replace(tzinfo=timezone.utc).timestamp(),
+                ex=self.redis_ttl,
+                nx=generation is not None,
+            )
+        except Exception as e:
+            logger.warning("Timer cache write failed: %s", e)
+
+    async def invalidate(self, *timer_ids: str) -> None:
+        """Drop timers from every tier, and from the local tier of every process following the invalidations."""
+        if not timer_ids:
+            return
+        self._drop(timer_ids)
+        if self._redis is None:
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for timer_id in timer_ids:
+                    pipe.set(self._key(timer_id), b"", ex=math.ceil(self.ttl))
+                pipe.publish(INVALIDATION_CHANNEL, ",".join(timer_ids))
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("Timer cache invalidation failed: %s", e)
+
+    async def aclose(self) -> None:
+        """Stop following invalidations and close the connection pool of the shared tier."""
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            listener.cancel()
+            try:
+                await listener
+            except asyncio.CancelledError:
+                pass
+        if self._redis is not None:
+            await self._redis.aclose()
+
+
+class IdempotentTimer(NamedTuple):
+    """What a replayed timer creation answers with: the timer the first request created."""
+
+    id: str
+    eta: datetime
+    url: str
+
+
+class IdempotencyKeyCache:
+    """
+    Bounded in-process TTL cache of recently used idempotency keys and the timer each of them created.
+
+    Retries of a timer creation usually land on the process that served the first attempt, which then answers
+    them without a Mongo round-trip. Other processes fall back to the unique `idempotency_key` index. Only the
+    id, eta and url of a timer are kept, and a key is forgotten before its timer can be archived.
+    """
+
+    def __init__(self, maxsize: Optional[int] = None, ttl: Optional[float] = None) -> None:
+        """
+        :param maxsize: max keys kept, defaults to `TIMER_IDEMPOTENCY_CACHE_SIZE`
+        :param ttl: seconds a key is kept, defaults to `TIMER_IDEMPOTENCY_CACHE_TTL_SECONDS`, and is capped at
+            half of `TIMER_ARCHIVE_AFTER_SECONDS` when archiving is enabled
+        """
+        ttl = ttl or settings.TIMER_IDEMPOTENCY_CACHE_TTL_SECONDS
+        if settings.TIMER_ARCHIVE_AFTER_SECONDS:
+            ttl = min(ttl, settings.TIMER_ARCHIVE_AFTER_SECONDS / 2)
+        self._keys: TTLCache = TTLCache(maxsize=maxsize or settings.TIMER_IDEMPOTENCY_CACHE_SIZE, ttl=ttl)
+
+    def get(self, user_id: Any, idempotency_key: str) -> Optional[IdempotentTimer]:
+        """The timer created with the key by the user, None if the key was not seen recently."""
+        return self._keys.get((user_id, idempotency_key))
+
+    def set(self, user_id: Any, idempotency_key: str, timer_id: str, eta: datetime, url: str) -> None:
+        self._keys[(user_id, idempotency_key)] = IdempotentTimer(timer_id, eta, url)
@@ -1,6 +1,7 @@
 from motor import motor_asyncio
 
 from src.settings import settings
+from src.utilities.metrics import MongoCommandMetrics
 from src.utilities.singleton import SingletonMeta
 
 
@@ -9,7 +10,10 @@ class Database(metaclass=SingletonMeta):
 
     def __init__(self) -> None:
         """Instance the db connection."""
-        
-        print("MONGO URL", settings.MONGO_URI)
-        self.client = motor_asyncio.AsyncIOMotorClient(settings.MONGO_URI)
+        self.client = motor_asyncio.AsyncIOMotorClient(settings.MONGO_URI, event_listeners=[MongoCommandMetrics()])
         self.db = self.client[settings.MONGO_DBNAME]
+
+    def close(self) -> None:
+        """Close the connection pool of this process, the next `Database()` opens a new one."""
+        self.client.close()
+        type(self)._instance = None
@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+
+from src.database.base import BaseCrud
+from src.database.query_plans import HotQuery
+from src.database.timer import timer
+from src.models.dead_letter_db import DeadLetterDB
+
+
+class DeadLetter(BaseCrud[DeadLetterDB]):
+    """
+    Dead-letter store of timers whose webhook kept failing until the retry policy gave up.
+
+    The timer itself stays `fired` with `success: False`; the dead letter records why, and `replay`
+    puts the timers back in line for a fresh round of attempts.
+    """
+
+    _model_class = DeadLetterDB
+    _collection_name = "timer_dead_letter"
+    _indexes = [
+        IndexModel([("timer_id", ASCENDING)], name="timer_id", unique=True),
+        IndexModel([("failed_at", ASCENDING)], name="failed_at"),
+    ]
+
+    def hot_queries(self) -> List[HotQuery]:
+        return [HotQuery("replay", {}, [("failed_at", ASCENDING)])]
+
+    async def add(
+        self,
+        timer_id: str,
+        url: str,
+        attempts: int,
+        status_code: Optional[int] = None,
+        response: Optional[str] = None,
+    ) -> None:
+        """
+        Record a timer whose attempts are exhausted; dead-lettering it again overwrites the entry.
+
+        :param timer_id: the id of the timer
+        :param url: the webhook url that kept failing
+        :param attempts: attempts made
+        :param status_code: status code of the last attempt, None if it did not get a response
+        :param response: response body or error of the last attempt
+        """
+        dead_letter = DeadLetterDB(
+            timer_id=timer_id,
+            url=url,
+            attempts=attempts,
+            status_code=status_code,
+            response=response,
+            failed_at=datetime.now(tz=timezone.utc),
+        )
+        document = dead_letter.model_dump(by_alias=True, exclude_none=True)
+        document.pop("_id")
+        await self._collection.update_one({"timer_id": timer_id}, {"$set": document}, upsert=True)
+
+    async def replay(self, limit: Optional[int] = None, batch_size: int = 500) -> int:
+        """
+        Requeue dead-lettered timers, oldest first, and remove their dead letters.
+
+        The dead letter of a recurring timer that moved on to its next occurrence is removed too: the failed
+        occurrence cannot be fired again and stays recorded in the timer's `occurrence_history`. Any other
+        dead letter whose timer could not be requeued, because it is no longer fired or no longer in the
+        `timer` collection, is kept.
+
+        :param limit: replay at most this many, all of them by default
+        :param batch_size: timers requeued per round-trip
+        :return: number of timers requeued
+        """
+        cursor = self._collection.find({}, projection={"timer_id": 1}, sort=[("failed_at", ASCENDING)])
+        if limit:
+            cursor = cursor.limit(limit)
+        cursor = cursor.batch_size(batch_size)
+
+        replayed = 0
+        batch: List[ObjectId] = []
+        async for doc in cursor:
+            batch.append(ObjectId(doc["timer_id"]))
+            if len(batch) >= batch_size:
+                replayed += await self._replay_batch(batch)
+                batch = []
+        if batch:
+            replayed += await self._replay_batch(batch)
+        return replayed
+
+    async def discard(self, timer_ids: List[str], failed_before: datetime) -> int:
+        """
+        Remove the dead letters of timers that were archived without a replay.
+
+        A timer that was replayed and failed again since has a newer dead letter, which is kept.
+
+        :param timer_ids: the ids of the archived timers
+        :param failed_before: the cutoff the timers were archived with
+        :return: number of dead letters removed
+        """
+        result = await self._collection.delete_many(
+            {"timer_id": {"$in": timer_ids}, "failed_at": {"$lt": failed_before}}
+        )
+        return result.deleted_count
+
+    async def _replay_batch(self, ids: List[ObjectId]) -> int:
+        requeued = await timer.requeue_timers(ids)
+        moved_on = await timer.moved_on_recurring_timers([timer_id for timer_id in ids if timer_id not in requeued])
+        settled = requeued + moved_on
+        if settled:
+            await self._collection.delete_many({"timer_id": {"$in": [str(timer_id) for timer_id in settled]}})
+        return len(requeued)
+
+
+dead_letter = DeadLetter()
+
+
+async def main(limit: Optional[int]) -> None:
+    replayed = await dead_letter.replay(limit=limit)
+    print(f"Replayed {replayed} dead-lettered timers")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Requeue dead-lettered timers for a fresh round of webhook attempts.")
+    parser.add_argument("--limit", type=int, default=None, help="Replay at most this many timers, oldest first")
+    asyncio.run(main(parser.parse_args().limit))
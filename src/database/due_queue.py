@@ -0,0 +1,124 @@
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Claim of due timers: KEYS[1] is the due set of a shard, KEYS[2] its in-flight set.
+# ARGV: due bucket bound, limit, now, in-flight deadline, due bucket of now. Claimed members move to the
+# in-flight set until acknowledged; members whose deadline passed are first put back as due, unless they
+# were scheduled again meanwhile.
+CLAIM_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])
+for _, member in ipairs(expired) do
+    redis.call('ZADD', KEYS[1], 'NX', ARGV[5], member)
+    redis.call('ZREM', KEYS[2], member)
+end
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, member in ipairs(due) do
+    redis.call('ZREM', KEYS[1], member)
+    redis.call('ZADD', KEYS[2], ARGV[4], member)
+end
+return due
+"""
+
+
+class RedisDueQueue:
+    """
+    Pending timers of the redis scheduler backend, one Redis sorted set per shard.
+
+    Members are the 12 byte binary timer ids scored by due bucket, so a pending timer costs Redis a few dozen
+    bytes and no broker message. The timer document in Mongo stays the source of truth: `Timer` adds a timer
+    here whenever it becomes pending under a due bucket, and a claimed id only fires once the timer is claimed
+    in Mongo too. Like the eta cache, Redis failures on the write path are logged rather than raised; the
+    scheduler backend re-adds overdue timers missing from Redis.
+    """
+
+    def __init__(self, redis_url: Optional[str] = None, client: Any = None) -> None:
+        """
+        :param redis_url: defaults to `SCHEDULER_REDIS_URL`
+        :param client: an existing `redis.asyncio` client to use instead, e.g. fakeredis in tests
+        """
+        if client is None:
+            import redis.asyncio as aioredis
+
+            client = aioredis.from_url(redis_url or settings.SCHEDULER_REDIS_URL)
+        self._redis = client
+        self._claim_script = self._redis.register_script(CLAIM_SCRIPT)
+
+    @staticmethod
+    def _keys(shard: int) -> Tuple[str, str]:
+        """Due and in-flight set of a shard, hash tagged into the same cluster slot for the claim script."""
+        return f"timer:due:{{{shard}}}", f"timer:inflight:{{{shard}}}"
+
+    async def add(self, timers: Iterable[Tuple[Any, int, int]]) -> None:
+        """
+        Schedule timers under their due bucket, moving those already scheduled, in one pipelined round-trip.
+
+        :param timers: (timer_id, shard, due bucket) triples
+        """
+        by_shard: Dict[int, Dict[bytes, int]] = defaultdict(dict)
+        for timer_id, shard, bucket in timers:
+            by_shard[shard][ObjectId(timer_id).binary] = bucket
+        if not by_shard:
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for shard, members in by_shard.items():
+                    pipe.zadd(self._keys(shard)[0], members)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("Adding %s timers to the due queue failed: %s", sum(map(len, by_shard.values())), e)
+
+    async def discard(self, timers: Iterable[Tuple[Any, int]]) -> None:
+        """
+        Unschedule timers that will never fire, e.g. cancelled ones.
+
+        :param timers: (timer_id, shard) pairs
+        """
+        by_shard: Dict[int, List[bytes]] = defaultdict(list)
+        for timer_id, shard in timers:
+            by_shard[shard].append(ObjectId(timer_id).binary)
+        if not by_shard:
+            return
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for shard, members in by_shard.items():
+                    pipe.zrem(self._keys(shard)[0], *members)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning("Removing timers from the due queue failed: %s", e)
+
+    async def claim(self, shard: int, until_bucket: int, limit: int, lease_seconds: float) -> List[ObjectId]:
+        """
+        Atomically take up to `limit` timers of a shard due at or before `until_bucket`, oldest bucket first.
+
+        Taken timers stay in flight for `lease_seconds`: unless `ack` drops them by then, the next claim of the
+        shard puts them back.
+
+        :return: the ids of the taken timers
+        """
+        now = time.time()
+        members = await self._claim_script(
+            keys=list(self._keys(shard)),
+            args=[until_bucket, limit, now, now + lease_seconds, int(now) // settings.SCHEDULER_BUCKET_SECONDS],
+        )
+        return [ObjectId(member) for member in members]
+
+    async def ack(self, shard: int, timer_ids: Iterable[ObjectId]) -> None:
+        """Drop claimed timers from the in-flight set of their shard once Mongo settled their claim."""
+        members = [ObjectId(timer_id).binary for timer_id in timer_ids]
+        if members:
+            await self._redis.zrem(self._keys(shard)[1], *members)
+
+    async def size(self, shard: int) -> int:
+        """Number of timers waiting in the due set of a shard."""
+        return await self._redis.zcard(self._keys(shard)[0])
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
@@ -0,0 +1,87 @@
+"""Explain-based checks that the hot queries of every collection are served by an index."""
+
+import asyncio
+import sys
+from typing import Any, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+
+class HotQuery(NamedTuple):
+    """A query shape that must never fall back to a collection scan."""
+
+    name: str
+    filter: Mapping[str, Any]
+    sort: Optional[Sequence[Tuple[str, int]]] = None
+
+
+class QueryPlanError(RuntimeError):
+    """Raised when a hot query is no longer served by an index."""
+
+
+def plan_stages(plan: Mapping[str, Any]) -> Iterator[Mapping[str, Any]]:
+    """
+    Walk every stage of an explain `winningPlan`, classic or slot based engine.
+
+    :param plan: the `queryPlanner.winningPlan` document of an explain result
+    """
+    yield plan
+    for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+        if isinstance(plan.get(key), Mapping):
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+
+def index_used(explain: Mapping[str, Any]) -> Optional[str]:
+    """
+    Name of the index a winning plan scans, None if it scans the collection.
+
+    :param explain: the result of `cursor.explain()`
+    """
+    stages = list(plan_stages(explain["queryPlanner"]["winningPlan"]))
+    if any(stage.get("stage") == "COLLSCAN" for stage in stages):
+        return None
+    for stage in stages:
+        if stage.get("stage") in ("IXSCAN", "DISTINCT_SCAN", "COUNT_SCAN", "IDHACK", "EXPRESS_IXSCAN"):
+            return stage.get("indexName", "_id_")
+    return None
+
+
+async def check_query_plans(cruds: Sequence[Any]) -> List[str]:
+    """
+    Explain every hot query of the given CRUD interfaces.
+
+    :param cruds: `BaseCrud` instances
+    :return: one line per hot query naming the index that served it
+    :raises QueryPlanError: listing every hot query that was planned as a collection scan
+    """
+    report, failures = [], []
+    for crud in cruds:
+        for query in crud.hot_queries():
+            explain = await crud._collection.find(query.filter, sort=query.sort).explain()
+            index = index_used(explain)
+            line = f"{crud._collection_name}.{query.name}: {index or 'COLLSCAN'}"
+            (report if index else failures).append(line)
+
+    if failures:
+        raise QueryPlanError("Hot queries without an index: " + ", ".join(failures))
+    return report
+
+
+async def main() -> None:
+    from src.database.dead_letter import dead_letter
+    from src.database.shard_lease import shard_lease, shard_node
+    from src.database.timer import timer
+    from src.database.timer_archive import timer_archive
+
+    cruds = [timer, dead_letter, shard_lease, shard_node, timer_archive]
+    for crud in cruds:
+        await crud.ensure_indexes()
+    for line in await check_query_plans(cruds):
+        print(line)
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except QueryPlanError as e:
+        sys.exit(str(e))
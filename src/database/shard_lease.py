@@ -0,0 +1,115 @@
+from datetime import datetime
+from typing import Collection, List, Set
+
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from src.database.base import BaseCrud
+from src.database.query_plans import HotQuery
+from src.models.shard_lease_db import ShardLeaseDB, ShardNodeDB
+
+
+class ShardLease(BaseCrud[ShardLeaseDB]):
+    """
+    One lease document per (role, shard) naming the node that owns the shard.
+
+    Every change of ownership is a compare-and-set on the current owner or an expired lease, so two nodes
+    never hold the same shard at once as seen by Mongo. `epoch` counts the handoffs of a shard.
+    """
+
+    _model_class = ShardLeaseDB
+    _collection_name = "shard_lease"
+    _indexes = [
+        IndexModel([("role", ASCENDING), ("shard", ASCENDING)], name="role_shard", unique=True),
+        IndexModel([("role", ASCENDING), ("owner", ASCENDING)], name="role_owner"),
+    ]
+
+    def hot_queries(self) -> List[HotQuery]:
+        return [
+            HotQuery("owned", {"role": "dispatcher", "owner": "node"}),
+            HotQuery("taken", {"role": "dispatcher", "lease_expires_at": {"$gte": datetime.now()}}, [("shard", ASCENDING)]),
+        ]
+
+    async def renew(self, role: str, node_id: str, now: datetime, expires_at: datetime) -> Set[int]:
+        """
+        Extend every unexpired lease `node_id` holds.
+
+        :param role: the role the node leases shards for
+        :param node_id: the node renewing
+        :param now: leases that expired before this instant are lost, someone else may have taken them
+        :param expires_at: new expiry of the renewed leases
+        :return: the shards the node still owns
+        """
+        query = {"role": role, "owner": node_id, "lease_expires_at": {"$gte": now}}
+        await self._collection.update_many(query, {"$set": {"lease_expires_at": expires_at}})
+        cursor = self._collection.find(query, projection={"shard": 1})
+        return {doc["shard"] async for doc in cursor}
+
+    async def taken(self, role: str, now: datetime) -> Set[int]:
+        """Shards of `role` with an unexpired lease, whoever holds it."""
+        cursor = self._collection.find(
+            {"role": role, "lease_expires_at": {"$gte": now}}, projection={"shard": 1}, sort=[("shard", ASCENDING)]
+        )
+        return {doc["shard"] async for doc in cursor}
+
+    async def acquire(self, role: str, shard: int, node_id: str, now: datetime, expires_at: datetime) -> bool:
+        """
+        Take over `shard` if it is unowned or its lease expired.
+
+        :return: True if `node_id` now owns the shard
+        """
+        try:
+            document = await self._collection.find_one_and_update(
+                {
+                    "role": role,
+                    "shard": shard,
+                    "$or": [{"owner": None}, {"lease_expires_at": {"$lt": now}}, {"owner": node_id}],
+                },
+                {"$set": {"owner": node_id, "lease_expires_at": expires_at}, "$inc": {"epoch": 1}},
+                projection={"_id": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The upsert lost against a lease document another node holds
+            return False
+        return document is not None
+
+    async def release(self, role: str, node_id: str, shards: Collection[int]) -> None:
+        """Give up the leases `node_id` holds on `shards` so other nodes can take them right away."""
+        await self._collection.update_many(
+            {"role": role, "owner": node_id, "shard": {"$in": list(shards)}},
+            {"$set": {"owner": None, "lease_expires_at": None}},
+        )
+
+
+class ShardNode(BaseCrud[ShardNodeDB]):
+    """Heartbeats of the nodes sharing the shards of a role; stale ones are removed by a TTL index."""
+
+    _model_class = ShardNodeDB
+    _collection_name = "shard_node"
+    _indexes = [
+        IndexModel([("role", ASCENDING), ("node_id", ASCENDING)], name="role_node_id", unique=True),
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ]
+
+    def hot_queries(self) -> List[HotQuery]:
+        return [HotQuery("live", {"role": "dispatcher", "expires_at": {"$gt": datetime.now()}})]
+
+    async def heartbeat(self, role: str, node_id: str, expires_at: datetime) -> None:
+        """Record that `node_id` is alive until `expires_at`."""
+        await self._collection.update_one(
+            {"role": role, "node_id": node_id}, {"$set": {"expires_at": expires_at}}, upsert=True
+        )
+
+    async def count_live(self, role: str, now: datetime) -> int:
+        """Number of nodes of `role` whose heartbeat has not expired, the TTL monitor only runs every minute."""
+        return await self._collection.count_documents({"role": role, "expires_at": {"$gt": now}})
+
+    async def leave(self, role: str, node_id: str) -> None:
+        """Drop the heartbeat of a node that is shutting down."""
+        await self._collection.delete_one({"role": role, "node_id": node_id})
+
+
+shard_lease = ShardLease()
+shard_node = ShardNode()
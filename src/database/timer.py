@@ -1,9 +1,70 @@
-from datetime import datetime, timezone
-from typing import Any, Optional, Union
+import logging
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Collection, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.results import BulkWriteResult
 
 from src.database.base import BaseCrud
-from src.models.timer_db import TimerDB
+from src.database.cache import IdempotencyKeyCache, TimerEtaCache
+from src.database.due_queue import RedisDueQueue
+from src.database.query_plans import HotQuery
+from src.database.timer_archive import timer_archive
+from src.database.timer_counters import timer_counters
+from src.database.timer_journal import TimerJournal
+from src.models.timer_db import Recurrence, TimerDB, TimerStatus
+from src.settings import SchedulerBackendKind, settings
+from src.utilities.metrics import TIMER_CACHE_LOOKUP_SECONDS, TIMER_IDEMPOTENT_REPLAYS
+
+logger = logging.getLogger(__name__)
+
+# Mongo write error code of a unique index violation
+DUPLICATE_KEY = 11000
+
+# Statuses after which a timer never changes again
+TERMINAL_STATUSES = (TimerStatus.FIRED.value, TimerStatus.CANCELLED.value)
+
+
+def due_bucket(eta: datetime) -> int:
+    """
+    Map an eta onto the scheduler bucket it belongs to.
+
+    Buckets are `SCHEDULER_BUCKET_SECONDS` wide and keyed by epoch seconds, so every timer due in the
+    same window shares one small integer that the dispatcher can range-scan in order.
+
+    :param eta: ETA for timer trigger, naive values are treated as UTC
+    :return: the due bucket number
+    """
+    if eta.tzinfo is None:
+        eta = eta.replace(tzinfo=timezone.utc)
+    return int(eta.timestamp()) // settings.SCHEDULER_BUCKET_SECONDS
+
+
+def shard_of(timer_id: Any) -> int:
+    """
+    Map a timer id onto one of the `SCHEDULER_SHARDS` scheduling partitions.
+
+    :param timer_id: the timer id, as ObjectId or string
+    :return: the shard number
+    """
+    return zlib.crc32(ObjectId(timer_id).binary) % settings.SCHEDULER_SHARDS
+
+
+def shard_filter(shards: Optional[Collection[int]]) -> dict[str, Any]:
+    """
+    Filter on the timers of `shards`, None for every shard.
+
+    Timers written before sharding have no `shard` and belong to shard 0.
+    """
+    if shards is None:
+        return {}
+    values: List[Any] = sorted(shards)
+    if 0 in shards:
+        values.append(None)
+    return {"shard": {"$in": values}}
 
 
 class Timer(BaseCrud[TimerDB]):
@@ -11,12 +72,127 @@ class Timer(BaseCrud[TimerDB]):
 
     _model_class = TimerDB
     _collection_name = "timer"
+    # Fields the dispatcher and the webhook task need from a claimed timer
+    _dispatch_fields = {"eta": 1, "url": 1, "claim_id": 1, "coalesce": 1, "shard": 1}
+    # Keyset order of the timers of a user, unique thanks to `_id`
+    _user_sort = [("eta", ASCENDING), ("_id", ASCENDING)]
+    _indexes = [
+        IndexModel([("status", ASCENDING), ("due_bucket", ASCENDING)], name="status_due_bucket"),
+        IndexModel([("status", ASCENDING), ("shard", ASCENDING), ("due_bucket", ASCENDING)], name="status_shard_due_bucket"),
+        IndexModel([("lease_expires_at", ASCENDING)], name="unfired_lease", sparse=True),
+        IndexModel(
+            [("updated", DESCENDING)],
+            name="failed_updated",
+            partialFilterExpression={"success": False},
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("eta", ASCENDING), ("_id", ASCENDING)],
+            name="user_eta_id",
+            partialFilterExpression={"user_id": {"$exists": True}},
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("status", ASCENDING), ("eta", ASCENDING), ("_id", ASCENDING)],
+            name="user_status_eta_id",
+            partialFilterExpression={"user_id": {"$exists": True}},
+        ),
+        IndexModel([("status", ASCENDING), ("shard", ASCENDING), ("updated", ASCENDING)], name="status_shard_updated"),
+        IndexModel(
+            [("idempotency_key", ASCENDING), ("user_id", ASCENDING)],
+            name="idempotency_key",
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$exists": True}},
+        ),
+    ]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.cache = TimerEtaCache()
+        self.idempotency_keys = IdempotencyKeyCache()
+        # Set by the API lifespan in write-behind mode, new timers are then journaled instead of inserted
+        self.journal: Optional[TimerJournal] = None
+        # Timers waiting for the redis scheduler backend, kept in step with every write making a timer pending
+        self.due_queue: Optional[RedisDueQueue] = (
+            RedisDueQueue() if settings.SCHEDULER_BACKEND == SchedulerBackendKind.REDIS else None
+        )
+
+    @staticmethod
+    def _load(result: Mapping[str, Any]) -> TimerDB:
+        """Build a TimerDB from a raw document of this collection."""
+        return TimerDB.from_document(result)
+
+    @staticmethod
+    def _prepare_update(update_obj: dict[str, Any], user_id: Optional[ObjectId] = None) -> dict[str, Any]:
+        """Stamp the `updated` field (and the acting user) onto an update dict, in place."""
+        update_obj["$set"] = {**update_obj.get("$set", {}), **{"updated": datetime.now(tz=timezone.utc)}}
+
+        if user_id:
+            update_obj["$set"]["user_id"] = user_id
+        return update_obj
+
+    async def _enqueue_due(self, timers: Iterable[Tuple[Any, Optional[int]]]) -> None:
+        """Hand timers that became pending under a due bucket to the redis scheduler backend, if it is used."""
+        if self.due_queue is not None:
+            await self.due_queue.add((timer_id, shard_of(timer_id), bucket) for timer_id, bucket in timers)
+
+    @staticmethod
+    def _new_timer(
+        eta: datetime,
+        url: str,
+        user_id: Optional[ObjectId] = None,
+        coalesce: bool = False,
+        recurrence: Optional[Recurrence] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> TimerDB:
+        """Build a pending timer document filed under its due bucket and shard."""
+        timer_data = TimerDB(
+            eta=eta,
+            url=url,
+            coalesce=coalesce or None,
+            recurrence=recurrence,
+            idempotency_key=idempotency_key,
+            created=datetime.now(tz=timezone.utc),
+            updated=datetime.now(tz=timezone.utc),
+            user_id=user_id,
+            status=TimerStatus.PENDING,
+            due_bucket=due_bucket(eta),
+        )
+        timer_data.shard = shard_of(timer_data.id)
+        return timer_data
+
+    @staticmethod
+    def _due_filter(until: datetime, shards: Optional[Collection[int]] = None) -> dict[str, Any]:
+        """Pending timers of `shards` whose due bucket is at or before the one containing `until`."""
+        return {"status": TimerStatus.PENDING, **shard_filter(shards), "due_bucket": {"$lte": due_bucket(until)}}
+
+    def hot_queries(self) -> List[HotQuery]:
+        now = datetime.now(tz=timezone.utc)
+        return [
+            HotQuery("claim_due", self._due_filter(now), [("due_bucket", ASCENDING)]),
+            HotQuery("expired_leases", {"lease_expires_at": {"$lt": now}}, [("lease_expires_at", ASCENDING)]),
+            HotQuery("failed_deliveries", {"success": False}, [("updated", DESCENDING)]),
+            HotQuery("by_user", self._user_filter(ObjectId(), after=(now, ObjectId())), self._user_sort),
+            HotQuery("claim_due_shards", self._due_filter(now, shards=[0, 1]), [("due_bucket", ASCENDING)]),
+            HotQuery(
+                "archivable",
+                self._archivable_filter(now, shards=[0, 1], failed_before=now),
+                [("updated", ASCENDING)],
+            ),
+            HotQuery(
+                "by_user_status",
+                self._user_filter(ObjectId(), TimerStatus.PENDING, after=(now, ObjectId())),
+                self._user_sort,
+            ),
+            HotQuery("idempotency_key", {"idempotency_key": "key", "user_id": None}),
+        ]
 
     async def insert_timer_request(
         self,
         eta: datetime,
         url: str,
         user_id: Optional[ObjectId] = None,
+        coalesce: bool = False,
+        recurrence: Optional[Recurrence] = None,
+        idempotency_key: Optional[str] = None,
     ) -> TimerDB:
         """
         Inserts a new timer request into the database.
@@ -24,26 +200,141 @@ class Timer(BaseCrud[TimerDB]):
         :param eta: ETA for timer trigger
         :param url: The URL that should be called when the timer expires
         :param user_id: Optional user ID associated with this timer request
+        :param coalesce: let the scheduler merge this timer into one batched POST with others for the same url
+        :param recurrence: repeat the timer, `eta` being its first occurrence
+        :param idempotency_key: key unique per user, such timers skip the write-behind journal so the unique
+            index is checked right away
         :return: The inserted TimerDB object
+        :raises DuplicateKeyError: when the user already created a timer with `idempotency_key`
         
         user_id is a future scope when authorization is enabled.
         """
-        timer_data = TimerDB(
-            eta=eta,
-            url=url,
-            created=datetime.now(tz=timezone.utc),
-            updated=datetime.now(tz=timezone.utc),
-            user_id=user_id,
+        timer_data = self._new_timer(
+            eta=eta, url=url, user_id=user_id, coalesce=coalesce, recurrence=recurrence, idempotency_key=idempotency_key
         )
 
-        await self._collection.insert_one(timer_data.model_dump(by_alias=True, exclude_none=True))
+        if self.journal is not None and idempotency_key is None:
+            await self._journal_timers([timer_data])
+        else:
+            await self._collection.insert_one(timer_data.model_dump(by_alias=True, exclude_none=True))
+            await self._enqueue_due([(timer_data.id, timer_data.due_bucket)])
+        await timer_counters.record(user_id, pending=1)
         return timer_data
 
+    async def insert_idempotent_timer_request(
+        self,
+        idempotency_key: str,
+        eta: datetime,
+        url: str,
+        user_id: Optional[ObjectId] = None,
+        coalesce: bool = False,
+        recurrence: Optional[Recurrence] = None,
+    ) -> Tuple[TimerDB, bool]:
+        """
+        Insert a timer once per idempotency key of a user, a retried request gets the timer the first one created.
+
+        Keys used recently by this process are answered from memory, others are settled by the unique
+        `idempotency_key` index. A key stays taken until its timer is archived.
+
+        :param idempotency_key: the key of the request
+        :return: the timer and whether this call created it, the original timer has at least its id, eta and url
+        """
+        cached = self.idempotency_keys.get(user_id, idempotency_key)
+        if cached is not None:
+            TIMER_IDEMPOTENT_REPLAYS.labels(source="cache").inc()
+            return self._load({"_id": cached.id, "eta": cached.eta, "url": cached.url}), False
+
+        created = True
+        try:
+            timer_db = await self.insert_timer_request(
+                eta=eta,
+                url=url,
+                user_id=user_id,
+                coalesce=coalesce,
+                recurrence=recurrence,
+                idempotency_key=idempotency_key,
+            )
+        except DuplicateKeyError:
+            result = await self._collection.find_one(
+                {"idempotency_key": idempotency_key, "user_id": user_id}, projection={"eta": 1, "url": 1}
+            )
+            if not result:
+                raise
+            timer_db, created = self._load(result), False
+            TIMER_IDEMPOTENT_REPLAYS.labels(source="mongo").inc()
+        self.idempotency_keys.set(user_id, idempotency_key, str(timer_db.id), timer_db.eta, timer_db.url)
+        return timer_db, created
+
+    async def insert_timer_requests(
+        self,
+        requests: Sequence[Tuple[datetime, str, bool, Optional[Recurrence]]],
+        user_id: Optional[ObjectId] = None,
+    ) -> List[Optional[TimerDB]]:
+        """
+        Inserts many timer requests with a single unordered `insert_many`.
+
+        :param requests: (eta, url, coalesce, recurrence) tuples, one per timer
+        :param user_id: Optional user ID associated with these timer requests
+        :return: the inserted TimerDB objects in request order, None where that document failed to insert
+        """
+        timers: List[Optional[TimerDB]] = [
+            self._new_timer(eta=eta, url=url, user_id=user_id, coalesce=coalesce, recurrence=recurrence)
+            for eta, url, coalesce, recurrence in requests
+        ]
+        if not timers:
+            return timers
+
+        if self.journal is not None:
+            await self._journal_timers(timers)
+        else:
+            try:
+                await self._collection.insert_many(
+                    [timer_data.model_dump(by_alias=True, exclude_none=True) for timer_data in timers], ordered=False
+                )
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    timers[error["index"]] = None
+            await self._enqueue_due(
+                (timer_data.id, timer_data.due_bucket) for timer_data in timers if timer_data is not None
+            )
+        await timer_counters.record(user_id, pending=sum(timer_data is not None for timer_data in timers))
+        return timers
+
+    async def _journal_timers(self, timers: Sequence[TimerDB]) -> None:
+        """
+        Acknowledge new timers once they are durable in the write-behind journal.
+
+        Their etas are cached, so `GET /timer/{id}` answers before the group commit inserted them.
+        """
+        await self.journal.append([timer_data.model_dump(by_alias=True, exclude_none=True) for timer_data in timers])
+        for timer_data in timers:
+            await self.cache.set(str(timer_data.id), timer_data.eta)
+
+    async def insert_journaled(self, documents: List[Mapping[str, Any]]) -> None:
+        """
+        Insert timers group-committed or replayed from the write-behind journal.
+
+        Ids already in the collection were committed before, they are skipped rather than duplicated. A
+        document the collection rejects for any other reason is dropped with a warning, since retrying it
+        would block the journal behind it. Timers only reach the due queue once inserted.
+
+        :param documents: timer documents, with their `_id`
+        :raises PyMongoError: on connection or server errors, the caller retries the whole batch
+        """
+        try:
+            await self._collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                if error["code"] != DUPLICATE_KEY:
+                    logger.warning("Dropping journaled timer %s: %s", documents[error["index"]]["_id"], error["errmsg"])
+        await self._enqueue_due((document["_id"], document.get("due_bucket")) for document in documents)
+
     async def update_timer_request(
         self,
         timer_id: ObjectId,
         update_obj: dict[str, Any],
         user_id: Optional[ObjectId] = None,
+        match: Optional[dict[str, Any]] = None,
     ) -> Union[TimerDB, None]:
         """
         Update a delivery job with the given update. This function both ensures the updated field is updated as well,
@@ -52,40 +343,587 @@ class Timer(BaseCrud[TimerDB]):
         :param timer_id: the id of the timer document that needs to be updated (used for filter)
         :param updateObj: the update dict
         :param user_id: the id of the user that triggered a change 
+        :param match: extra conditions the document must meet for the update to apply
         :return: updated delivery job in case everything went fine, otherwise None
         
         user_id is a future scope when authorization is enabled.
         """
-        update_obj["$set"] = {**update_obj.get("$set", {}), **{"updated": datetime.now(tz=timezone.utc)}}
-        
-        if user_id:
-            update_obj["$set"]["user_id"] = user_id
+        self._prepare_update(update_obj, user_id)
 
         result = await self._collection.find_one_and_update(
-            filter={"_id": timer_id}, update=update_obj, return_document=True
+            filter={**(match or {}), "_id": ObjectId(timer_id)}, update=update_obj, return_document=True
         )
-        return TimerDB(**result) if result else None
+        await self.cache.invalidate(str(timer_id))
+        return self._load(result) if result else None
     
+    async def bulk_update_timer_requests(
+        self,
+        updates: Sequence[Tuple[Any, dict[str, Any]]],
+        claims: Optional[Mapping[str, str]] = None,
+    ) -> BulkWriteResult:
+        """
+        Apply many `update_timer_request`-style updates with one unordered `bulk_write`.
+
+        :param updates: (timer_id, update dict) pairs
+        :param claims: claim id by timer id, the update of such a timer only applies while it is still firing
+            under that claim, so a worker that lost its timer to the sweeper cannot overwrite a newer outcome
+        :return: the pymongo bulk write result
+        """
+        claims = claims or {}
+        operations = []
+        for timer_id, update_obj in updates:
+            query: dict[str, Any] = {"_id": ObjectId(timer_id)}
+            if str(timer_id) in claims:
+                query.update(status=TimerStatus.FIRING, claim_id=claims[str(timer_id)])
+            operations.append(UpdateOne(query, self._prepare_update(update_obj)))
+        result = await self.bulk_write(operations)
+        await self.cache.invalidate(*(str(timer_id) for timer_id, _ in updates))
+
+        pending = [
+            ObjectId(timer_id) for timer_id, update_obj in updates if update_obj["$set"].get("status") == TimerStatus.PENDING
+        ]
+        if self.due_queue is not None and pending:
+            # Read back the timers the writes made pending, an update whose claim was lost did not apply
+            cursor = self._collection.find(
+                {"_id": {"$in": pending}, "status": TimerStatus.PENDING}, projection={"due_bucket": 1}
+            )
+            await self._enqueue_due([(doc["_id"], doc["due_bucket"]) async for doc in cursor])
+        return result
+
+    async def cancel_timer(
+        self,
+        timer_id: ObjectId,
+    ) -> Optional[TimerDB]:
+        """
+        Cancel a timer that has not started firing yet.
+
+        Dropping the claim doubles as a tombstone: a dispatch already in flight for this timer fails its
+        acquire compare-and-set at fire time, so it costs one indexed `_id` lookup and never a webhook.
+
+        :param timer_id: the id of the timer to cancel
+        :return: the cancelled timer, None if it does not exist or already fired
+        """
+        cancelled = await self.update_timer_request(
+            timer_id=timer_id,
+            update_obj={
+                "$set": {"status": TimerStatus.CANCELLED},
+                "$unset": {"claim_id": "", "lease_expires_at": ""},
+            },
+            match={"status": {"$in": [TimerStatus.PENDING, TimerStatus.DISPATCHED]}},
+        )
+        if cancelled is not None:
+            await timer_counters.record(cancelled.user_id, pending=-1, cancelled=1)
+            if self.due_queue is not None:
+                await self.due_queue.discard([(timer_id, shard_of(timer_id))])
+        return cancelled
+
+    async def reschedule_timer(
+        self,
+        timer_id: ObjectId,
+        eta: datetime,
+    ) -> Optional[TimerDB]:
+        """
+        Move a timer that has not started firing yet to a new eta.
+
+        The timer goes back to pending under its new due bucket. Its old claim is dropped, so a dispatch
+        already in flight for the old eta is rejected at fire time exactly like a cancelled one.
+
+        :param timer_id: the id of the timer to move
+        :param eta: the new ETA for timer trigger
+        :return: the rescheduled timer, None if it does not exist or already fired
+        """
+        rescheduled = await self.update_timer_request(
+            timer_id=timer_id,
+            update_obj={
+                "$set": {"status": TimerStatus.PENDING, "eta": eta, "due_bucket": due_bucket(eta)},
+                "$unset": {"claim_id": "", "lease_expires_at": ""},
+            },
+            match={"status": {"$in": [TimerStatus.PENDING, TimerStatus.DISPATCHED]}},
+        )
+        if rescheduled is not None:
+            await self._enqueue_due([(timer_id, due_bucket(eta))])
+        return rescheduled
+
     async def get_timer_by_id(
         self,
         timer_id: ObjectId,
+        projection: Optional[dict[str, Any]] = None,
     ) -> Union[TimerDB, None]:
         """
-        Update a timer request in db with the given update. This function both ensures the updated field is updated as well.
-        
-        :param timer_id: the id of the timer that needs to be updated (used for filter
-        :param updateObj: the update dict
-        :param user_id: the id of the user that triggered a change 
-        :return: updated timer document in case everything went fine, otherwise None
-        
-        user_id is a future scope when authorization is enabled.
+        Read a timer document by id.
+
+        :param timer_id: the id of the timer
+        :param projection: only read these fields, they must include the required `eta` and `url`
+        :return: the timer, None if it does not exist
         """
-        result = await self._collection.find_one({"_id": timer_id})
+        result = await self._collection.find_one({"_id": timer_id}, projection=projection)
+        if not result:
+            result = await timer_archive.find_one(timer_id, projection=projection)
 
-        if result:
-            result['_id'] = str(result['_id'])
+        return self._load(result) if result else None
 
-        return TimerDB(**result) if result else None
+    async def get_timers(
+        self,
+        timer_ids: Sequence[ObjectId],
+        projection: Optional[dict[str, Any]] = None,
+    ) -> List[TimerDB]:
+        """
+        Read many timer documents by id with one query.
+
+        :param timer_ids: the ids of the timers
+        :param projection: only read these fields, they must include the required `eta` and `url`
+        :return: the timers found, in no particular order
+        """
+        cursor = self._collection.find({"_id": {"$in": list(timer_ids)}}, projection=projection)
+        docs = [doc async for doc in cursor]
+        if len(docs) < len(timer_ids):
+            found = {doc["_id"] for doc in docs}
+            docs += await timer_archive.find_many(
+                [timer_id for timer_id in timer_ids if timer_id not in found], projection=projection
+            )
+        return [self._load(doc) for doc in docs]
 
+    async def get_timer_eta(
+        self,
+        timer_id: ObjectId,
+    ) -> Optional[datetime]:
+        """
+        Read-through lookup of a timer eta, all `GET /timer/{id}` needs to compute `time_left`.
+
+        Served from the eta cache when possible, otherwise read from Mongo with an eta-only projection
+        and cached for the next poll.
+
+        :param timer_id: the id of the timer
+        :return: the eta as naive UTC datetime, None if the timer does not exist
+        """
+        eta = await self.cache.get(str(timer_id))
+        if eta is not None:
+            return eta
+
+        generation = self.cache.generation
+        started = time.perf_counter()
+        result = await self._collection.find_one({"_id": timer_id}, projection={"eta": 1})
+        if not result:
+            result = await timer_archive.find_one(timer_id, projection={"eta": 1})
+        TIMER_CACHE_LOOKUP_SECONDS.labels(source="mongo").observe(time.perf_counter() - started)
+        if not result:
+            return None
+
+        await self.cache.set(str(timer_id), result["eta"], generation=generation)
+        return result["eta"]
+
+    @staticmethod
+    def _user_filter(
+        user_id: ObjectId,
+        status: Optional[TimerStatus] = None,
+        after: Optional[Tuple[datetime, ObjectId]] = None,
+    ) -> dict[str, Any]:
+        """
+        Timers of a user, optionally in one status, that come after the (eta, _id) keyset position `after`.
+
+        The eta bound opens the index range at the position, the `$or` only skips the timers sharing its eta.
+        """
+        query: dict[str, Any] = {"user_id": user_id}
+        if status is not None:
+            query["status"] = status
+        if after is not None:
+            eta, timer_id = after
+            query["eta"] = {"$gte": eta}
+            query["$or"] = [{"eta": {"$gt": eta}}, {"_id": {"$gt": timer_id}}]
+        return query
+
+    async def iter_user_timers(
+        self,
+        user_id: ObjectId,
+        limit: int,
+        status: Optional[TimerStatus] = None,
+        after: Optional[Tuple[datetime, ObjectId]] = None,
+        projection: Optional[dict[str, Any]] = None,
+    ) -> AsyncIterator[TimerDB]:
+        """
+        Stream one page of the timers of a user, ordered by eta then id.
+
+        Pages are cut by keyset rather than skip, so reading deep pages costs the same as the first one. Timers
+        moved to the archive are not listed.
+
+        :param user_id: the id of the user
+        :param limit: timers in the page
+        :param status: only list timers in this status
+        :param after: (eta, _id) of the last timer of the previous page, None for the first page
+        :param projection: only read these fields, they must include the required `eta` and `url`
+        """
+        cursor = self._collection.find(
+            self._user_filter(user_id, status, after), projection=projection, sort=self._user_sort, limit=limit
+        ).batch_size(min(limit, 1000))
+        async for doc in cursor:
+            yield self._load(doc)
+
+    async def _claim(self, ids: List[ObjectId], match: dict[str, Any], lease_until: datetime) -> List[TimerDB]:
+        """
+        Flip the given timers to DISPATCHED under a fresh claim id and lease.
+
+        Only documents still matching `match` at update time get the claim, so concurrent dispatchers
+        and sweepers racing for the same timers never hand one out twice.
+        """
+        if not ids:
+            return []
+
+        claim_id = str(ObjectId())
+        now = datetime.now(tz=timezone.utc)
+        await self._collection.update_many(
+            {**match, "_id": {"$in": ids}},
+            {"$set": {
+                "status": TimerStatus.DISPATCHED,
+                "claim_id": claim_id,
+                "dispatched_at": now,
+                "lease_expires_at": lease_until,
+                "updated": now,
+            }},
+        )
+        claimed = self._collection.find({"_id": {"$in": ids}, "claim_id": claim_id}, projection=self._dispatch_fields)
+        return [self._load(doc) async for doc in claimed]
+
+    async def claim_due_timers(
+        self,
+        until: datetime,
+        limit: int,
+        shards: Optional[Collection[int]] = None,
+    ) -> List[TimerDB]:
+        """
+        Claim pending timers whose due bucket is at or before `until`, oldest bucket first.
+
+        Candidates are read as bare ids from the (status, due_bucket) range, then claimed with a lease
+        that runs `SCHEDULER_LEASE_SECONDS` past `until`. A timer whose lease runs out before a worker
+        fires it is picked up again by the sweeper.
+
+        :param until: claim every bucket up to and including the one containing this instant
+        :param limit: maximum number of timers to claim in one pass
+        :param shards: only claim timers of these shards, all of them by default
+        :return: the timers claimed by this call
+        """
+        cursor = self._collection.find(
+            self._due_filter(until, shards),
+            projection={"_id": 1},
+            sort=[("due_bucket", ASCENDING)],
+            limit=limit,
+        )
+        ids = [doc["_id"] async for doc in cursor]
+        lease_until = until + timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        return await self._claim(ids, {"status": TimerStatus.PENDING}, lease_until)
+
+    async def claim_timers(self, ids: List[ObjectId], until: datetime) -> List[TimerDB]:
+        """
+        Claim the given timers if they are still pending and due by `until`, like `claim_due_timers` does.
+
+        Used when the candidates come from the redis due queue instead of the due bucket index: a stale
+        candidate (cancelled, already claimed or moved to a later bucket) is simply not claimed.
+
+        :param ids: candidate timer ids
+        :param until: only timers whose due bucket is at or before the one containing this instant are claimed
+        :return: the timers claimed by this call
+        """
+        lease_until = until + timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        return await self._claim(ids, self._due_filter(until), lease_until)
+
+    async def iter_pending(
+        self,
+        until: Optional[datetime],
+        batch_size: int,
+        shards: Optional[Collection[int]] = None,
+    ) -> AsyncIterator[List[Tuple[ObjectId, int]]]:
+        """
+        Stream the (id, due bucket) of pending timers in chunks of `batch_size`, to fill the redis due queue.
+
+        :param until: only timers whose due bucket is at or before the one containing this instant, None for all
+        :param batch_size: timers per chunk and per cursor batch
+        :param shards: only stream timers of these shards, all of them by default
+        """
+        query = self._due_filter(until, shards) if until else {"status": TimerStatus.PENDING, **shard_filter(shards)}
+        cursor = self._collection.find(query, projection={"due_bucket": 1}).batch_size(batch_size)
+
+        chunk: List[Tuple[ObjectId, int]] = []
+        async for doc in cursor:
+            chunk.append((doc["_id"], doc["due_bucket"]))
+            if len(chunk) >= batch_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def iter_expired_leases(
+        self,
+        now: datetime,
+        batch_size: int,
+        shards: Optional[Collection[int]] = None,
+    ) -> AsyncIterator[List[ObjectId]]:
+        """
+        Stream the ids of dispatched or firing timers whose lease ran out before `now`.
+
+        A single cursor is read with `batch_size` documents per round-trip and handed out in chunks
+        of the same size, so memory stays flat however large the backlog is.
+
+        :param now: leases that expired before this instant are returned
+        :param batch_size: ids per chunk and per cursor batch
+        :param shards: only stream timers of these shards, all of them by default
+        """
+        cursor = self._collection.find(
+            {"lease_expires_at": {"$lt": now}, **shard_filter(shards)},
+            projection={"_id": 1},
+            sort=[("lease_expires_at", ASCENDING)],
+        ).batch_size(batch_size)
+
+        chunk: List[ObjectId] = []
+        async for doc in cursor:
+            chunk.append(doc["_id"])
+            if len(chunk) >= batch_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _archivable_filter(
+        before: datetime,
+        shards: Optional[Collection[int]] = None,
+        failed_before: Optional[datetime] = None,
+    ) -> dict[str, Any]:
+        """
+        Fired and cancelled timers last updated before `before`, except dead-lettered ones awaiting a replay.
+
+        Dead-lettered timers are included once last updated before `failed_before`, if given.
+        """
+        replayable: dict[str, Any] = {"success": {"$ne": False}}
+        if failed_before is not None:
+            replayable = {"$or": [replayable, {"updated": {"$lt": failed_before}}]}
+        return {
+            "status": {"$in": list(TERMINAL_STATUSES)},
+            **shard_filter(shards),
+            "updated": {"$lt": before},
+            **replayable,
+        }
+
+    async def iter_archivable(
+        self,
+        before: datetime,
+        batch_size: int,
+        shards: Optional[Collection[int]] = None,
+        failed_before: Optional[datetime] = None,
+    ) -> AsyncIterator[List[Mapping[str, Any]]]:
+        """
+        Stream fired and cancelled timers last updated before `before`, oldest first, in chunks of `batch_size`.
+
+        Timers whose delivery failed for good stay in `timer` until `failed_before`, so replaying their dead
+        letters can requeue them.
+
+        :param before: timers updated since are left alone
+        :param batch_size: documents per chunk and per cursor batch
+        :param shards: only stream timers of these shards, all of them by default
+        :param failed_before: also stream failed timers last updated before, none of them by default
+        """
+        cursor = self._collection.find(
+            self._archivable_filter(before, shards, failed_before), sort=[("updated", ASCENDING)]
+        ).batch_size(batch_size)
+
+        chunk: List[Mapping[str, Any]] = []
+        async for doc in cursor:
+            chunk.append(doc)
+            if len(chunk) >= batch_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def delete_archived(
+        self,
+        ids: List[ObjectId],
+        before: datetime,
+        failed_before: Optional[datetime] = None,
+    ) -> int:
+        """
+        Delete timers that were copied to the archive.
+
+        A timer updated since it was read, e.g. a dead letter put back in line, is kept.
+
+        :param ids: ids of the archived timers
+        :param before: the cutoff the timers were read with
+        :param failed_before: the cutoff failed timers were read with
+        :return: number of timers deleted
+        """
+        result = await self._collection.delete_many(
+            {"_id": {"$in": ids}, **self._archivable_filter(before, failed_before=failed_before)}
+        )
+        return result.deleted_count
+
+    async def reclaim_timers(
+        self,
+        ids: List[ObjectId],
+        now: datetime,
+    ) -> List[TimerDB]:
+        """
+        Claim timers again whose lease expired, so they can be dispatched a second time.
+
+        :param ids: candidate timer ids, typically a chunk of `iter_expired_leases`
+        :param now: only leases that expired before this instant are taken over
+        :return: the timers claimed by this call
+        """
+        lease_until = now + timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        return await self._claim(ids, {"lease_expires_at": {"$lt": now}}, lease_until)
+
+    async def acquire_timer(
+        self,
+        timer_id: Any,
+        claim_id: str,
+    ) -> Optional[TimerDB]:
+        """
+        Take a dispatched timer for firing, right before its webhook is sent.
+
+        Succeeds for exactly one holder of the current claim: a message left over from an older claim
+        (the timer was re-dispatched by the sweeper) or a duplicate delivery of the same message loses.
+
+        :param timer_id: the id of the timer to fire
+        :param claim_id: the claim id the timer was dispatched with
+        :return: the timer (eta, url, attempts so far, recurrence and user) if the caller now owns it and should fire it, otherwise None
+        """
+        result = await self._collection.find_one_and_update(
+            {"_id": ObjectId(timer_id), "status": TimerStatus.DISPATCHED, "claim_id": claim_id},
+            {"$set": {
+                "status": TimerStatus.FIRING,
+                "lease_expires_at": datetime.now(tz=timezone.utc) + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS),
+            }},
+            projection={"eta": 1, "url": 1, "attempts": 1, "recurrence": 1, "user_id": 1},
+        )
+        return self._load(result) if result else None
+
+    async def acquire_timers(
+        self,
+        timers: Sequence[Tuple[Any, str]],
+    ) -> List[TimerDB]:
+        """
+        Take many dispatched timers for firing at once, the batch counterpart of `acquire_timer`.
+
+        The timers still held by their claim are moved to FIRING under one fresh claim id with a single
+        `update_many`, and read back by that claim id.
+
+        :param timers: (timer_id, claim_id) pairs
+        :return: the timers (eta, url, attempts so far, recurrence, user and new claim id) the caller now owns, the others lost their claim
+        """
+        if not timers:
+            return []
+        claim_id = str(ObjectId())
+        await self._collection.update_many(
+            {
+                "$or": [{"_id": ObjectId(timer_id), "claim_id": held_by} for timer_id, held_by in timers],
+                "status": TimerStatus.DISPATCHED,
+            },
+            {"$set": {
+                "status": TimerStatus.FIRING,
+                "claim_id": claim_id,
+                "lease_expires_at": datetime.now(tz=timezone.utc) + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS),
+            }},
+        )
+        acquired = self._collection.find(
+            {"_id": {"$in": [ObjectId(timer_id) for timer_id, _ in timers]}, "claim_id": claim_id},
+            projection={"eta": 1, "url": 1, "attempts": 1, "recurrence": 1, "user_id": 1, "claim_id": 1},
+        )
+        return [self._load(doc) async for doc in acquired]
+
+    async def renew_leases(self, timers: Sequence[Tuple[Any, str]]) -> int:
+        """
+        Push the lease of timers being fired out by `WEBHOOK_LEASE_SECONDS` again, so the sweeper leaves them alone.
+
+        :param timers: (timer_id, claim_id) pairs, a timer no longer firing under its claim is left alone
+        :return: number of leases renewed
+        """
+        if not timers:
+            return 0
+        lease_until = datetime.now(tz=timezone.utc) + timedelta(seconds=settings.WEBHOOK_LEASE_SECONDS)
+        result = await self.bulk_write([
+            UpdateOne(
+                {"_id": ObjectId(timer_id), "status": TimerStatus.FIRING, "claim_id": claim_id},
+                {"$set": {"lease_expires_at": lease_until}},
+            )
+            for timer_id, claim_id in timers
+        ])
+        return result.modified_count
+
+    async def defer_timer(
+        self,
+        timer_id: Any,
+        claim_id: str,
+        until: datetime,
+    ) -> bool:
+        """
+        Hand a timer acquired for firing back to the scheduler to be dispatched again around `until`.
+
+        Only the due bucket moves, the eta the user asked for is kept. It only succeeds for the holder of the
+        current claim, and the claim is dropped so the old message can no longer fire.
+
+        :param timer_id: the id of the firing timer
+        :param claim_id: the claim id the timer was acquired under
+        :param until: earliest time the timer should be dispatched again
+        :return: True if the timer was handed back, False if the claim no longer holds it
+        """
+        result = await self._collection.update_one(
+            {"_id": ObjectId(timer_id), "status": TimerStatus.FIRING, "claim_id": claim_id},
+            {
+                "$set": {
+                    "status": TimerStatus.PENDING,
+                    "due_bucket": due_bucket(until),
+                    "updated": datetime.now(tz=timezone.utc),
+                },
+                "$unset": {"claim_id": "", "dispatched_at": "", "lease_expires_at": ""},
+            },
+        )
+        if result.modified_count != 1:
+            return False
+        await self._enqueue_due([(timer_id, due_bucket(until))])
+        return True
+
+    async def moved_on_recurring_timers(self, ids: List[ObjectId]) -> List[ObjectId]:
+        """
+        Ids of the recurring timers among `ids` that are no longer fired, having moved on to a later occurrence.
+
+        :param ids: candidate timer ids
+        """
+        if not ids:
+            return []
+        cursor = self._collection.find(
+            {"_id": {"$in": ids}, "recurrence": {"$exists": True}, "status": {"$ne": TimerStatus.FIRED}},
+            projection={"_id": 1},
+        )
+        return [doc["_id"] async for doc in cursor]
+
+    async def requeue_timers(self, ids: List[ObjectId]) -> List[ObjectId]:
+        """
+        Put fired timers back in line to be fired again right away, with a fresh attempt count.
+
+        :param ids: the ids of the timers to requeue
+        :return: ids of the timers requeued, those no longer fired or no longer in the collection are left out
+        """
+        if not ids:
+            return []
+        cursor = self._collection.find({"_id": {"$in": ids}, "status": TimerStatus.FIRED}, projection={"user_id": 1})
+        fired = {doc["_id"]: doc.get("user_id") async for doc in cursor}
+        if not fired:
+            return []
+        now = datetime.now(tz=timezone.utc)
+        result = await self._collection.update_many(
+            {"_id": {"$in": list(fired)}, "status": TimerStatus.FIRED},
+            {
+                "$set": {"status": TimerStatus.PENDING, "due_bucket": due_bucket(now), "attempts": 0, "updated": now},
+                "$unset": {"success": "", "status_code": "", "response": "", "claim_id": "", "dispatched_at": ""},
+            },
+        )
+        requeued = list(fired)
+        if result.modified_count < len(requeued):
+            # Some timers changed between the read and the update, keep the ones this update moved
+            moved = self._collection.find(
+                {"_id": {"$in": requeued}, "status": TimerStatus.PENDING, "updated": now}, projection={"_id": 1}
+            )
+            moved_ids = {doc["_id"] async for doc in moved}
+            requeued = [timer_id for timer_id in requeued if timer_id in moved_ids]
+        await timer_counters.add((fired[timer_id], {"pending": 1, "failed": -1}) for timer_id in requeued)
+        await self._enqueue_due((timer_id, due_bucket(now)) for timer_id in requeued)
+        return requeued
 
 timer = Timer()
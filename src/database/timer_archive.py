@@ -0,0 +1,96 @@
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, ReplaceOne
+from pymongo.errors import CollectionInvalid
+
+from src.database.base import BaseCrud
+from src.models.timer_archive_db import TimerArchiveDB
+from src.settings import settings
+
+# Fields only the scheduler needs while a timer is live, dropped when it is archived
+_LIVE_FIELDS = ("due_bucket", "shard", "claim_id", "dispatched_at", "lease_expires_at")
+
+
+def compact_response(response: Optional[str]) -> Dict[str, Any]:
+    """
+    Fields storing a webhook response body: at most `TIMER_RESPONSE_MAX_CHARS` of it and, when it was cut,
+    the length and sha256 of the whole body. A None value means the field must be unset.
+    """
+    if response is None or len(response) <= settings.TIMER_RESPONSE_MAX_CHARS:
+        return {"response": response, "response_length": None, "response_sha256": None}
+    return {
+        "response": response[:settings.TIMER_RESPONSE_MAX_CHARS],
+        "response_length": len(response),
+        "response_sha256": hashlib.sha256(response.encode()).hexdigest(),
+    }
+
+
+class TimerArchive(BaseCrud[TimerArchiveDB]):
+    """
+    Cold store of fired and cancelled timers, so the hot `timer` collection only holds live ones.
+
+    The collection is zstd compressed and a TTL index expires archived timers `TIMER_ARCHIVE_TTL_SECONDS`
+    after they were archived.
+    """
+
+    _model_class = TimerArchiveDB
+    _collection_name = "timer_archive"
+    _indexes = [
+        IndexModel(
+            [("archived_at", ASCENDING)], name="archived_at_ttl", expireAfterSeconds=settings.TIMER_ARCHIVE_TTL_SECONDS
+        ),
+    ]
+
+    async def ensure_indexes(self) -> List[str]:
+        """Create the collection with zstd block compression on first use, then its indexes."""
+        try:
+            await self._collection.database.create_collection(
+                self._collection_name, storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}}
+            )
+        except CollectionInvalid:
+            pass
+        return await super().ensure_indexes()
+
+    async def archive(self, documents: Sequence[Mapping[str, Any]]) -> int:
+        """
+        Store timer documents read from the `timer` collection, with live-only fields dropped and responses compacted.
+
+        Documents are upserted by `_id`, so archiving the same timer again after an interrupted run is harmless.
+
+        :param documents: full timer documents
+        :return: number of documents written
+        """
+        if not documents:
+            return 0
+        archived_at = datetime.now(tz=timezone.utc)
+        operations = []
+        for document in documents:
+            archived = {field: value for field, value in document.items() if field not in _LIVE_FIELDS}
+            if "response_sha256" not in archived:
+                archived.update(
+                    (field, value) for field, value in compact_response(archived.get("response")).items()
+                    if value is not None
+                )
+            archived["archived_at"] = archived_at
+            operations.append(ReplaceOne({"_id": document["_id"]}, archived, upsert=True))
+        result = await self.bulk_write(operations)
+        return result.upserted_count + result.modified_count
+
+    async def find_one(self, timer_id: ObjectId, projection: Optional[dict[str, Any]] = None) -> Optional[Mapping[str, Any]]:
+        """The raw archived document of a timer, None if it is not archived."""
+        return await self._collection.find_one({"_id": timer_id}, projection=projection)
+
+    async def find_many(
+        self, timer_ids: Sequence[ObjectId], projection: Optional[dict[str, Any]] = None
+    ) -> List[Mapping[str, Any]]:
+        """The raw archived documents of the given timers that are archived."""
+        if not timer_ids:
+            return []
+        cursor = self._collection.find({"_id": {"$in": list(timer_ids)}}, projection=projection)
+        return [doc async for doc in cursor]
+
+
+timer_archive = TimerArchive()
@@ -0,0 +1,66 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from src.database.base import BaseCrud
+from src.models.timer_counters_db import TimerCountersDB
+
+
+class TimerCounters(BaseCrud[TimerCountersDB]):
+    """
+    Per user counts of timers, maintained incrementally so stats never scan the `timer` collection.
+
+    `pending` counts timers that have not fired for the last time yet. `fired` and `failed` count deliveries,
+    one per occurrence of a recurring timer, `failed` being the dead-lettered ones. `cancelled` counts
+    cancelled timers. Timers without a user are not counted.
+
+    Counters are bumped after the state change they record was written, so a process dying in between
+    (or the sweeper firing a timer a second time) can leave them slightly off.
+    """
+
+    _model_class = TimerCountersDB
+    _collection_name = "timer_counters"
+
+    async def add(self, changes: Iterable[Tuple[Optional[ObjectId], Mapping[str, int]]]) -> None:
+        """
+        Apply counter changes, merged per user into one upsert each and sent in a single `bulk_write`.
+
+        :param changes: (user id, {counter: delta}) pairs, pairs without a user are skipped
+        """
+        totals: Dict[ObjectId, Counter] = defaultdict(Counter)
+        for user_id, deltas in changes:
+            if user_id is not None:
+                totals[user_id].update(deltas)
+
+        now = datetime.now(tz=timezone.utc)
+        operations = []
+        for user_id, deltas in totals.items():
+            increments = {counter: delta for counter, delta in deltas.items() if delta}
+            if increments:
+                operations.append(UpdateOne(
+                    {"_id": user_id},
+                    {"$inc": increments, "$set": {"updated": now}, "$setOnInsert": {"created": now}},
+                    upsert=True,
+                ))
+        if operations:
+            await self.bulk_write(operations)
+
+    async def record(self, user_id: Optional[ObjectId], **deltas: int) -> None:
+        """Apply the counter changes of one user, e.g. `record(user_id, pending=-1, cancelled=1)`."""
+        await self.add([(user_id, deltas)])
+
+    async def get_counters(self, user_id: ObjectId) -> TimerCountersDB:
+        """
+        Read the counters of a user.
+
+        :param user_id: the id of the user
+        :return: the counters, all zero for a user without timers
+        """
+        result = await self._collection.find_one({"_id": user_id})
+        return TimerCountersDB.from_document(result) if result else TimerCountersDB(_id=str(user_id))
+
+
+timer_counters = TimerCounters()
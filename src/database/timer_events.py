@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Collection, Dict, List, Mapping, Optional, Set
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from src.database.timer import TERMINAL_STATUSES, timer
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Returned by a standalone mongod, change streams need a replica set or sharded cluster
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+def completion_event(timer_id: Any, fields: Mapping[str, Any]) -> Dict[str, Any]:
+    """The completion event of a timer from its terminal status fields."""
+    return {
+        "id": str(timer_id),
+        "status": fields["status"],
+        "success": fields.get("success"),
+        "status_code": fields.get("status_code"),
+    }
+
+
+class TimerEvents:
+    """
+    In-process fan out of timer completions to the streaming subscribers of an API process.
+
+    One Mongo change stream per process watches timers turning `fired` or `cancelled`, whichever worker or
+    API process wrote it, and hands each completion to the queues subscribed to that timer id. Against a
+    standalone mongod, which has no change streams, the subscribed ids are polled with one query every
+    `poll_seconds` instead, still a single query for every connected client.
+    """
+
+    def __init__(self, poll_seconds: Optional[float] = None) -> None:
+        """
+        :param poll_seconds: poll interval without change streams, defaults to `TIMER_EVENTS_POLL_SECONDS`
+        """
+        self.poll_seconds = poll_seconds or settings.TIMER_EVENTS_POLL_SECONDS
+        self.change_streams = True
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._resume_after: Optional[Mapping[str, Any]] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @asynccontextmanager
+    async def subscribe(self, timer_ids: Collection[str]) -> AsyncIterator[asyncio.Queue]:
+        """
+        Receive the completion events of `timer_ids` on a queue while the context is open.
+
+        Waits for the watch to be open first, so a snapshot read after subscribing misses no completion.
+        """
+        self._ensure_running()
+        queue: asyncio.Queue = asyncio.Queue()
+        for timer_id in timer_ids:
+            self._subscribers[timer_id].add(queue)
+        try:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                logger.warning("Timer event watch is not ready, subscribing anyway")
+            yield queue
+        finally:
+            for timer_id in timer_ids:
+                queues = self._subscribers.get(timer_id)
+                if queues is not None:
+                    queues.discard(queue)
+                    if not queues:
+                        del self._subscribers[timer_id]
+
+    def publish(self, event: Mapping[str, Any]) -> None:
+        """Hand a completion event to every queue subscribed to its timer."""
+        for queue in self._subscribers.get(event["id"], ()):
+            queue.put_nowait(event)
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def _watch(self) -> None:
+        pipeline = [{"$match": {
+            "operationType": "update",
+            "updateDescription.updatedFields.status": {"$in": list(TERMINAL_STATUSES)},
+        }}]
+        async with timer._collection.watch(pipeline, resume_after=self._resume_after) as stream:
+            self._ready.set()
+            async for change in stream:
+                self._resume_after = change["_id"]
+                self.publish(completion_event(change["documentKey"]["_id"], change["updateDescription"]["updatedFields"]))
+
+    async def _poll(self) -> None:
+        self._ready.set()
+        while True:
+            timer_ids: List[ObjectId] = [ObjectId(timer_id) for timer_id in self._subscribers]
+            if timer_ids:
+                cursor = timer._collection.find(
+                    {"_id": {"$in": timer_ids}, "status": {"$in": list(TERMINAL_STATUSES)}},
+                    projection={"status": 1, "success": 1, "status_code": 1},
+                )
+                async for doc in cursor:
+                    self.publish(completion_event(doc["_id"], doc))
+            await asyncio.sleep(self.poll_seconds)
+
+    async def run(self) -> None:
+        """Feed subscribers from the change stream, or by polling where change streams are unsupported."""
+        while True:
+            try:
+                if self.change_streams:
+                    await self._watch()
+                else:
+                    await self._poll()
+            except OperationFailure as e:
+                if e.code != CHANGE_STREAMS_UNSUPPORTED:
+                    # Also covers a resume token that fell off the oplog, start over from now
+                    self._resume_after = None
+                    logger.warning("Timer event watch failed: %s", e)
+                    await asyncio.sleep(self.poll_seconds)
+                    continue
+                logger.info("Change streams are unsupported, polling subscribed timers every %ss", self.poll_seconds)
+                self.change_streams = False
+            except Exception as e:
+                logger.warning("Timer event watch failed: %s", e)
+                await asyncio.sleep(self.poll_seconds)
+
+    async def stop(self) -> None:
+        """Stop watching, on application shutdown."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+timer_events = TimerEvents()
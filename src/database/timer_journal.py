@@ -0,0 +1,354 @@
+import asyncio
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from itertools import islice
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Mapping, Optional, Tuple
+
+import bson
+
+from src.settings import settings
+from src.utilities.metrics import TIMER_JOURNAL_BACKLOG, TIMER_JOURNAL_SYNC_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Offset up to which the records of a segment are known to be in Mongo
+_HEADER = struct.Struct("<Q")
+# Payload length and crc32 in front of every BSON record, a zero length marks the end of the records
+_RECORD = struct.Struct("<II")
+_SUFFIX = ".journal"
+# A segment is prepared under this extra suffix and renamed once initialized
+_TEMP_SUFFIX = ".tmp"
+# Age after which an unlocked temporary segment is known to be left by a crash
+_TEMP_MAX_AGE_SECONDS = 60
+
+InsertDocuments = Callable[[List[Mapping[str, Any]]], Awaitable[None]]
+
+
+class JournalSegment:
+    """
+    One preallocated, memory-mapped journal file: a committed offset header followed by the records.
+
+    The file is zero filled when created and never reused, so the first zero length or bad checksum ends the
+    records, which drops a record torn by a crash. An open segment holds an exclusive `flock`, so a replaying
+    process never touches the segment of a live one. A new segment is preallocated and initialized under a
+    temporary name and only then renamed, so a replaying process never sees a half created one.
+    """
+
+    def __init__(self, path: Path, size: int = 0) -> None:
+        """
+        :param path: the segment file
+        :param size: create the file with this many bytes, 0 opens an existing one
+        :raises BlockingIOError: if another process holds the segment
+        :raises EOFError: if an existing file is too short to be a segment
+        """
+        self.path = path
+        temp = path.with_name(path.name + _TEMP_SUFFIX)
+        self._fd = os.open(temp, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644) if size else os.open(path, os.O_RDWR)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if size:
+                # Reserve the blocks up front, a full disk must fail here rather than fault a write to the map
+                os.posix_fallocate(self._fd, 0, size)
+            self.size = os.fstat(self._fd).st_size
+            if self.size < _HEADER.size:
+                raise EOFError(f"Journal segment {path} was never initialized")
+            self._map = mmap.mmap(self._fd, self.size)
+            if size:
+                try:
+                    _HEADER.pack_into(self._map, 0, _HEADER.size)
+                    # The lock is held by the open file, it moves along with the name
+                    os.rename(temp, path)
+                except BaseException:
+                    self._map.close()
+                    raise
+        except BaseException:
+            if size:
+                temp.unlink(missing_ok=True)
+            os.close(self._fd)
+            raise
+        self.committed: int = _HEADER.unpack_from(self._map, 0)[0]
+        self.end = self.committed
+
+    def append(self, payload: bytes) -> Optional[Tuple[int, int]]:
+        """
+        Copy one record into the map, it is durable once `sync` covered it.
+
+        :return: (start, end) offsets of the record, None if it does not fit in the segment
+        """
+        start, end = self.end, self.end + _RECORD.size + len(payload)
+        if end > self.size:
+            return None
+        _RECORD.pack_into(self._map, start, len(payload), zlib.crc32(payload))
+        self._map[start + _RECORD.size:end] = payload
+        self.end = end
+        return start, end
+
+    def sync(self, start: int, end: int) -> None:
+        """msync the pages holding bytes `start` to `end`, blocking."""
+        page_start = start - start % mmap.ALLOCATIONGRANULARITY
+        self._map.flush(page_start, end - page_start)
+
+    def mark_committed(self, offset: int) -> None:
+        """Record that every record up to `offset` is in Mongo, blocking."""
+        self.committed = offset
+        _HEADER.pack_into(self._map, 0, offset)
+        self._map.flush(0, min(mmap.ALLOCATIONGRANULARITY, self.size))
+
+    def records(self) -> Iterator[Tuple[int, bytes]]:
+        """The (end offset, payload) of every record after the committed offset that is intact."""
+        offset = self.committed
+        while offset + _RECORD.size <= self.size:
+            length, crc = _RECORD.unpack_from(self._map, offset)
+            end = offset + _RECORD.size + length
+            if not length or end > self.size:
+                return
+            payload = self._map[offset + _RECORD.size:end]
+            if zlib.crc32(payload) != crc:
+                logger.warning("Torn record at offset %s of %s, ignoring the rest", offset, self.path)
+                return
+            yield end, payload
+            offset = self.end = end
+
+    def close(self, delete: bool = False) -> None:
+        """Unmap and unlock the segment, deleting the file first if asked so no other process opens it."""
+        if delete:
+            self.path.unlink(missing_ok=True)
+        self._map.close()
+        os.close(self._fd)
+
+
+class TimerJournal:
+    """
+    Write-behind path for new timers: a durable local append-only journal group-committed to Mongo.
+
+    `append` copies the timer documents into the memory-mapped active segment and returns once a group
+    msync, shared by every append of the last `sync_seconds`, made them durable. A background task then
+    inserts them into Mongo with unordered `insert_many` calls of up to `commit_batch_size` documents and
+    advances the committed offset of their segment. Segments whose records are all in Mongo are deleted.
+
+    On `start`, records of segments left behind by a process that died are inserted again from their
+    committed offset. Documents carry their `_id` from the journal, and `insert` skips ids that are already
+    in Mongo, so a record committed just before the crash is not duplicated.
+    """
+
+    def __init__(
+        self,
+        insert: InsertDocuments,
+        directory: Optional[str] = None,
+        segment_bytes: Optional[int] = None,
+        sync_seconds: Optional[float] = None,
+        commit_batch_size: Optional[int] = None,
+        commit_seconds: Optional[float] = None,
+    ) -> None:
+        """
+        :param insert: inserts documents into Mongo, skipping those already there
+        :param directory: where the segments live, defaults to `TIMER_JOURNAL_DIR`
+        :param segment_bytes: size of one segment file, defaults to `TIMER_JOURNAL_SEGMENT_BYTES`
+        :param sync_seconds: group commit window of the msync, defaults to `TIMER_JOURNAL_SYNC_SECONDS`
+        :param commit_batch_size: documents per `insert_many`, defaults to `TIMER_JOURNAL_COMMIT_BATCH_SIZE`
+        :param commit_seconds: max delay before synced records go to Mongo, defaults to `TIMER_JOURNAL_COMMIT_SECONDS`
+        """
+        self.insert = insert
+        self.directory = Path(directory or settings.TIMER_JOURNAL_DIR)
+        self.segment_bytes = segment_bytes or settings.TIMER_JOURNAL_SEGMENT_BYTES
+        self.sync_seconds = sync_seconds if sync_seconds is not None else settings.TIMER_JOURNAL_SYNC_SECONDS
+        self.commit_batch_size = commit_batch_size or settings.TIMER_JOURNAL_COMMIT_BATCH_SIZE
+        self.commit_seconds = commit_seconds or settings.TIMER_JOURNAL_COMMIT_SECONDS
+        self._segment: Optional[JournalSegment] = None
+        # (segment, start, end, document) appended but not synced, then synced but not in Mongo
+        self._unsynced: List[Tuple[JournalSegment, int, int, Mapping[str, Any]]] = []
+        self._pending: Deque[Tuple[JournalSegment, int, int, Mapping[str, Any]]] = deque()
+        self._waiters: List[asyncio.Future] = []
+        self._sync_lock = asyncio.Lock()
+        self._sync_handle: Optional[asyncio.TimerHandle] = None
+        self._syncs: set = set()
+        self._wakeup = asyncio.Event()
+        self._commit_task: Optional[asyncio.Task] = None
+
+    def _new_segment(self) -> JournalSegment:
+        return JournalSegment(self.directory / f"{time.time_ns()}-{os.getpid()}{_SUFFIX}", self.segment_bytes)
+
+    async def start(self) -> int:
+        """
+        Replay what dead processes left in the journal, then open a fresh segment and start committing.
+
+        :return: number of replayed timers
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        replayed = await self.replay()
+        self._segment = self._new_segment()
+        self._commit_task = asyncio.create_task(self._commit_loop())
+        return replayed
+
+    async def replay(self) -> int:
+        """
+        Insert the uncommitted records of every segment no live process holds, then delete those segments.
+
+        :return: number of replayed timers
+        """
+        self._remove_abandoned_temp_segments()
+        replayed = 0
+        for path in sorted(self.directory.glob(f"*{_SUFFIX}")):
+            try:
+                segment = JournalSegment(path)
+            except (BlockingIOError, FileNotFoundError):
+                continue
+            except EOFError:
+                # Segments are only renamed into place once initialized, this one was damaged otherwise
+                logger.warning("Skipping journal segment %s, it is too short to hold a header", path.name)
+                continue
+            try:
+                documents = [bson.decode(payload) for _, payload in segment.records()]
+                for start in range(0, len(documents), self.commit_batch_size):
+                    await self.insert(documents[start:start + self.commit_batch_size])
+            except BaseException:
+                segment.close()
+                raise
+            segment.close(delete=True)
+            replayed += len(documents)
+            if documents:
+                logger.info("Replayed %s timers from %s", len(documents), path.name)
+        return replayed
+
+    def _remove_abandoned_temp_segments(self) -> None:
+        """Delete segments a crash left half created, nothing was acknowledged from them."""
+        for path in self.directory.glob(f"*{_SUFFIX}{_TEMP_SUFFIX}"):
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                # A young one may belong to a process that created it but did not lock it yet
+                if time.time() - os.fstat(fd).st_mtime < _TEMP_MAX_AGE_SECONDS:
+                    continue
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                path.unlink(missing_ok=True)
+            except BlockingIOError:
+                continue
+            finally:
+                os.close(fd)
+
+    async def append(self, documents: List[Mapping[str, Any]]) -> None:
+        """Journal new timer documents, returning once they are durable."""
+        if self._segment is None:
+            raise RuntimeError("The timer journal is not started")
+        for document in documents:
+            payload = bson.encode(document)
+            offsets = self._segment.append(payload)
+            if offsets is None:
+                self._segment = self._new_segment()
+                offsets = self._segment.append(payload)
+                if offsets is None:
+                    raise ValueError(f"A {len(payload)} byte timer does not fit in a journal segment")
+            self._unsynced.append((self._segment, *offsets, document))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if self._sync_handle is None:
+            self._sync_handle = asyncio.get_running_loop().call_later(self.sync_seconds, self._start_sync)
+        await waiter
+
+    def _start_sync(self) -> None:
+        self._sync_handle = None
+        task = asyncio.create_task(self._sync())
+        self._syncs.add(task)
+        task.add_done_callback(self._syncs.discard)
+
+    async def _sync(self) -> None:
+        """Make every record appended so far durable with one msync per segment, then acknowledge them."""
+        async with self._sync_lock:
+            batch, self._unsynced = self._unsynced, []
+            waiters, self._waiters = self._waiters, []
+            ranges: Dict[JournalSegment, List[int]] = {}
+            for segment, start, end, _ in batch:
+                ranges.setdefault(segment, [start, end])[1] = end
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(lambda: [segment.sync(*span) for segment, span in ranges.items()])
+            except Exception as e:
+                logger.error("Syncing %s journaled timers failed: %s", len(batch), e)
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                # The records may still reach the disk and be replayed, commit them rather than leave it to chance
+                self._pending.extend(batch)
+                TIMER_JOURNAL_BACKLOG.inc(len(batch))
+                return
+            TIMER_JOURNAL_SYNC_SECONDS.observe(time.perf_counter() - started)
+            self._pending.extend(batch)
+            TIMER_JOURNAL_BACKLOG.inc(len(batch))
+            if len(self._pending) >= self.commit_batch_size:
+                self._wakeup.set()
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def _commit_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.commit_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.commit()
+            except Exception as e:
+                logger.warning("Committing journaled timers failed, retrying: %s", e)
+
+    async def commit(self) -> int:
+        """
+        Insert the synced records into Mongo in batches and advance the committed offset of their segments.
+
+        :return: number of timers committed
+        """
+        committed = 0
+        while self._pending:
+            batch = list(islice(self._pending, self.commit_batch_size))
+            await self.insert([document for *_, document in batch])
+            for _ in batch:
+                self._pending.popleft()
+            committed += len(batch)
+            TIMER_JOURNAL_BACKLOG.dec(len(batch))
+
+            offsets: Dict[JournalSegment, int] = {}
+            for segment, _, end, _ in batch:
+                offsets[segment] = end
+            await asyncio.to_thread(lambda: [segment.mark_committed(end) for segment, end in offsets.items()])
+            for segment in offsets:
+                if segment is not self._segment and segment.committed >= segment.end:
+                    segment.close(delete=True)
+        return committed
+
+    async def stop(self) -> None:
+        """Sync and commit everything journaled, on shutdown. What cannot be committed is replayed on next start."""
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+            self._sync_handle = None
+        await self._sync()
+        if self._commit_task is not None:
+            self._commit_task.cancel()
+            try:
+                await self._commit_task
+            except asyncio.CancelledError:
+                pass
+            self._commit_task = None
+        try:
+            await self.commit()
+        except Exception as e:
+            logger.warning("Committing journaled timers on shutdown failed, they are replayed on next start: %s", e)
+        segments = {segment for segment, *_ in self._pending}
+        if self._segment is not None:
+            self._segment.close(delete=self._segment not in segments)
+            segments.discard(self._segment)
+            self._segment = None
+        for segment in segments:
+            segment.close()
+        TIMER_JOURNAL_BACKLOG.dec(len(self._pending))
+        self._pending.clear()
@@ -1,6 +1,6 @@
 
 from datetime import datetime, timezone
-from typing import Any, Dict, Generic, Optional, TYPE_CHECKING, Tuple, Type, TypeVar, Union
+from typing import Any, Dict, Mapping, Generic, Optional, TYPE_CHECKING, Tuple, Type, TypeVar, Union
 
 from bson import ObjectId
 from pydantic import Field
@@ -23,14 +23,26 @@ class BaseDBModel(BaseModel):
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str, datetime: lambda x: x.strftime(DATE_TIME_FORMAT)}
 
+    @classmethod
+    def from_document(cls, document: Mapping[str, Any]):
+        """
+        Build the model from a document read back from its own collection.
+
+        Validation runs in pydantic-core straight from the document, which measured cheaper than `model_construct`
+        (that fills defaults and aliases field by field in Python), so reads keep full validation. A projection
+        must keep the required fields.
+
+        :param document: the raw Mongo document
+        :return: the model, with `_id` stringified as the model holds it
+        """
+        return cls.model_validate({**document, "_id": str(document["_id"])})
+
     def dict(
         self,
         *,
         by_alias: bool = False,
     ) -> dict:
         output_dict = super().model_dump(by_alias=by_alias)
-        
-        print(output_dict)
 
         # Override the `_id` field in MongoDB and remove the Pydantic `id` field
         if "id" in output_dict:
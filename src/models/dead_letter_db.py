@@ -0,0 +1,15 @@
+from datetime import datetime
+from typing import Optional
+
+from src.database.base import BaseDBModel
+
+
+class DeadLetterDB(BaseDBModel):
+    """A timer whose webhook still failed after its last retry, kept until it is replayed."""
+
+    timer_id: str
+    url: str
+    attempts: int
+    status_code: Optional[int] = None
+    response: Optional[str] = None
+    failed_at: datetime
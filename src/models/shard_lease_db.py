@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Optional
+
+from src.database.base import BaseDBModel
+
+
+class ShardLeaseDB(BaseDBModel):
+    """Ownership of one scheduling shard by one node of a role, valid until the lease expires."""
+
+    role: str
+    shard: int
+    owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    epoch: int = 0
+
+
+class ShardNodeDB(BaseDBModel):
+    """Heartbeat of a live node of a role, shards are spread over the nodes with a current heartbeat."""
+
+    role: str
+    node_id: str
+    expires_at: datetime
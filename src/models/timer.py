@@ -1,13 +1,73 @@
-from pydantic import BaseModel, HttpUrl, Field, ConfigDict
-from typing import Optional
+import hashlib
+from datetime import datetime, timedelta
+from pydantic import BaseModel, HttpUrl, Field, ConfigDict, model_validator
+from typing import Any, List, Optional, Tuple
+
+from src.models.timer_db import Recurrence
+from src.utilities.cron import CronExpression
 
 
 class SetTimerRequest(BaseModel):
     """Validation model for  set timer request"""
-    hours: Optional[int] = Field(0, ge=0)  
-    minutes: Optional[int] = Field(0, ge=0)  
-    seconds: Optional[int] = Field(0, ge=0) 
+    hours: int = Field(0, ge=0)
+    minutes: int = Field(0, ge=0)
+    seconds: int = Field(0, ge=0)
     url: HttpUrl  # Validate that it's a valid URL
+    coalesce: bool = False  # Opt in to sharing one batched POST with other timers for the same url
+    # Repeat every `interval_seconds` or on a UTC `cron` expression, the hours/minutes/seconds delay the first one
+    interval_seconds: Optional[int] = Field(None, ge=1)
+    cron: Optional[str] = None
+    max_occurrences: Optional[int] = Field(None, ge=1)
+    # Client side reference: retries with the same reference, url and delay get the timer created first
+    client_ref: Optional[str] = Field(None, min_length=1, max_length=255)
+
+    @model_validator(mode="after")
+    def check_recurrence(self) -> "SetTimerRequest":
+        if self.interval_seconds and self.cron:
+            raise ValueError("Set either interval_seconds or cron, not both")
+        if self.max_occurrences and not (self.interval_seconds or self.cron):
+            raise ValueError("max_occurrences needs interval_seconds or cron")
+        if self.cron:
+            CronExpression(self.cron)
+        return self
+
+    def dedup_key(self) -> Optional[str]:
+        """
+        Idempotency key derived from the `client_ref`, url and requested schedule, None without a `client_ref`.
+
+        The requested delay is used rather than the eta, which moves on with every retry.
+        """
+        if self.client_ref is None:
+            return None
+        fields = (
+            self.client_ref, str(self.url), self.hours, self.minutes, self.seconds,
+            self.interval_seconds, self.cron, self.max_occurrences,
+        )
+        return "ref:" + hashlib.sha256("\x1f".join(map(str, fields)).encode()).hexdigest()
+
+    def schedule(self, now: datetime) -> Tuple[datetime, Optional[Recurrence]]:
+        """
+        The eta of the timer, or of the first occurrence of a recurring one, and its recurrence.
+
+        An interval timer first fires after the requested delay, or after one interval without a delay.
+        A cron timer first fires on the first matching minute after the delay.
+        """
+        delay = timedelta(hours=self.hours, minutes=self.minutes, seconds=self.seconds)
+        if not (self.interval_seconds or self.cron):
+            return now + delay, None
+        recurrence = Recurrence(
+            interval_seconds=self.interval_seconds, cron=self.cron, max_occurrences=self.max_occurrences
+        )
+        if self.cron:
+            return CronExpression(self.cron).next_after(now + delay), recurrence
+        return now + (delay or timedelta(seconds=self.interval_seconds)), recurrence
+
+
+class RescheduleTimerRequest(BaseModel):
+    """Validation model for reschedule timer request, the new eta is counted from now."""
+    hours: int = Field(0, ge=0)
+    minutes: int = Field(0, ge=0)
+    seconds: int = Field(0, ge=0)
 
 
 class SetTimerResponse(BaseModel):
@@ -26,3 +86,50 @@ class GetTimerResponse(BaseModel):
 
     # Configure Pydantic to allow arbitrary types
     model_config = ConfigDict(arbitrary_types_allowed=True)
+
+
+class SetTimerBatchItemResponse(BaseModel):
+    """One entry of a batch set timer response, either the created timer or the validation errors."""
+    id: Optional[str] = None
+    time_left: Optional[int] = None
+    errors: Optional[List[dict[str, Any]]] = None
+
+
+class SetTimerBatchResponse(BaseModel):
+    """Validation model for batch set timer response, entries follow the request order."""
+    timers: List[SetTimerBatchItemResponse]
+
+
+class TimerSnapshotEvent(BaseModel):
+    """First event of a streamed timer, its countdown at subscription time."""
+    id: str
+    time_left: int
+    status: str
+
+
+class TimerListItem(BaseModel):
+    """One timer of a `GET /timer` page."""
+    id: str
+    url: str
+    eta: datetime
+    status: str
+    time_left: int
+    success: Optional[bool] = None
+    status_code: Optional[int] = None
+
+
+class TimerStatsResponse(BaseModel):
+    """Validation model for timer stats response, the counters of one user."""
+    user_id: str
+    pending: int
+    fired: int
+    failed: int
+    cancelled: int
+
+
+class TimerCompletedEvent(BaseModel):
+    """Last event of a streamed timer, sent once it fired or was cancelled."""
+    id: str
+    status: str
+    success: Optional[bool] = None
+    status_code: Optional[int] = None
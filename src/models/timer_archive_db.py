@@ -0,0 +1,9 @@
+from datetime import datetime
+
+from src.models.timer_db import TimerDB
+
+
+class TimerArchiveDB(TimerDB):
+    """A fired or cancelled timer moved out of the hot `timer` collection, expired `TIMER_ARCHIVE_TTL_SECONDS` after `archived_at`."""
+
+    archived_at: datetime
@@ -0,0 +1,10 @@
+from src.database.base import BaseDBModel
+
+
+class TimerCountersDB(BaseDBModel):
+    """Timer counts of one user, keyed by the user id and kept up to date as their timers change state."""
+
+    pending: int = 0
+    fired: int = 0
+    failed: int = 0
+    cancelled: int = 0
@@ -1,8 +1,65 @@
-from datetime import datetime
-from typing import Optional
+import enum
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 from bson import ObjectId
+from pydantic import BaseModel
 
 from src.database.base import BaseDBModel
+from src.utilities.cron import CronExpression
+
+
+class TimerStatus(str, enum.Enum):
+    """Lifecycle of a timer document as it moves through the scheduler."""
+
+    PENDING = "pending"
+    DISPATCHED = "dispatched"
+    FIRING = "firing"
+    FIRED = "fired"
+    CANCELLED = "cancelled"
+
+
+class WebhookAttempt(BaseModel):
+    """One webhook attempt as kept in the capped attempt history of a timer."""
+
+    at: datetime
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+
+
+class Recurrence(BaseModel):
+    """How a recurring timer repeats: every `interval_seconds`, or on a cron expression evaluated in UTC."""
+
+    interval_seconds: Optional[int] = None
+    cron: Optional[str] = None
+    max_occurrences: Optional[int] = None
+    occurrences: int = 0
+
+    def next_after(self, previous: datetime, now: datetime) -> datetime:
+        """
+        The first occurrence after `previous` that is not in the past.
+
+        Occurrences missed while the scheduler was down or the webhook kept failing are skipped rather
+        than fired in a burst.
+
+        :param previous: eta of the occurrence that just fired
+        :param now: the current time
+        """
+        previous = previous if previous.tzinfo else previous.replace(tzinfo=timezone.utc)
+        if self.cron:
+            return CronExpression(self.cron).next_after(max(previous, now))
+        interval = timedelta(seconds=self.interval_seconds)
+        if previous + interval > now:
+            return previous + interval
+        return previous + interval * ((now - previous) // interval + 1)
+
+
+class Occurrence(BaseModel):
+    """One fired occurrence of a recurring timer, kept in its capped occurrence history."""
+
+    eta: datetime
+    fired_at: datetime
+    success: bool
+    status_code: Optional[int] = None
 
 
 class TimerDB(BaseDBModel):
@@ -12,5 +69,21 @@ class TimerDB(BaseDBModel):
     url: str
     user_id: Optional[ObjectId] = None
     response: Optional[str] = None
+    # Set when `response` was cut: length and sha256 of the whole body
+    response_length: Optional[int] = None
+    response_sha256: Optional[str] = None
     success: Optional[bool] = None
     status_code: Optional[int] = None
+    status: TimerStatus = TimerStatus.PENDING
+    due_bucket: Optional[int] = None
+    shard: Optional[int] = None
+    claim_id: Optional[str] = None
+    dispatched_at: Optional[datetime] = None
+    lease_expires_at: Optional[datetime] = None
+    coalesce: Optional[bool] = None
+    # Set when the timer was created with an Idempotency-Key header or a client_ref, unique per user
+    idempotency_key: Optional[str] = None
+    attempts: int = 0
+    attempt_history: List[WebhookAttempt] = []
+    recurrence: Optional[Recurrence] = None
+    occurrence_history: List[Occurrence] = []
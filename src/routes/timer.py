@@ -1,86 +1,411 @@
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from http import HTTPStatus
 from datetime import datetime, timedelta, timezone
 from pydantic import ValidationError
 from bson import ObjectId
 from bson.errors import InvalidId
+from typing import Any, AsyncIterator, List, Optional, Tuple
+import asyncio
+import base64
+import binascii
 import logging
 import math
-from src.models.timer import SetTimerRequest, SetTimerResponse, GetTimerResponse
-from src.celery_workers import timer as timer_celery
+import struct
+import orjson
+from src.models.timer import (
+    SetTimerRequest,
+    SetTimerResponse,
+    GetTimerResponse,
+    SetTimerBatchItemResponse,
+    SetTimerBatchResponse,
+    RescheduleTimerRequest,
+    TimerSnapshotEvent,
+    TimerCompletedEvent,
+    TimerListItem,
+    TimerStatsResponse,
+)
 from src.database.timer import timer
+from src.database.timer_counters import timer_counters
+from src.database.timer_events import TERMINAL_STATUSES, timer_events
+from src.models.timer_db import TimerStatus
+from src.settings import settings
 
 
 logger = logging.getLogger(__name__)
 
 timerRoutes = APIRouter()
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+
+def parse_timer_id(timer_id: str) -> ObjectId:
+    """Convert a timer id path parameter, rejecting malformed ids with 400."""
+    try:
+        return ObjectId(timer_id)
+    except InvalidId as exc:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Invalid timer ID format."
+        ) from exc
+
+
+def parse_user_id(user_id: Optional[str]) -> Optional[ObjectId]:
+    """Convert a user id query parameter or `X-User-Id` header, rejecting malformed ids with 400."""
+    if user_id is None:
+        return None
+    try:
+        return ObjectId(user_id)
+    except InvalidId as exc:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid user ID format.") from exc
+
+
+def encode_cursor(eta: datetime, timer_id: Any) -> str:
+    """Opaque `GET /timer` page cursor of the (eta, _id) keyset position of a timer, eta in milliseconds like Mongo."""
+    eta = eta if eta.tzinfo else eta.replace(tzinfo=timezone.utc)
+    millis = (eta - EPOCH) // timedelta(milliseconds=1)
+    return base64.urlsafe_b64encode(struct.pack(">q", millis) + ObjectId(timer_id).binary).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """The (eta, _id) keyset position of a page cursor, rejecting malformed cursors with 400."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        if len(raw) != 20:
+            raise ValueError("cursor has the wrong length")
+        (millis,) = struct.unpack(">q", raw[:8])
+        return EPOCH + timedelta(milliseconds=millis), ObjectId(raw[8:])
+    except (binascii.Error, ValueError, OverflowError) as exc:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid cursor.") from exc
+
+
+async def read_json(request: Request) -> Any:
+    """Parse a JSON request body with orjson, rejecting other content types and malformed bodies with 400."""
+    if not request.headers.get('Content-Type') == 'application/json':
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Request must be in JSON format")
+    try:
+        return orjson.loads(await request.body())
+    except orjson.JSONDecodeError as exc:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Request body is not valid JSON") from exc
+
+
+async def raise_not_modifiable(timer_id: ObjectId) -> None:
+    """Raise 404 for an unknown timer, 409 for one that already fired or was cancelled."""
+    timer_db = await timer.get_timer_by_id(timer_id=timer_id, projection={"eta": 1, "url": 1, "status": 1})
+    if not timer_db:
+        logger.warning("Timer id %s not found in db", str(timer_id))
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Timer not found")
+    raise HTTPException(status_code=HTTPStatus.CONFLICT, detail=f"Timer is already {timer_db.status.value}")
+
+
 @timerRoutes.post('/')
 async def set_timer(request: Request):
     """
     Route to accept timer request.
-    Saves the request in db and triggers celery task to trigger url at calculated eta.
-    """
-    if not request.headers.get('Content-Type') == 'application/json':
-        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Request must be in JSON format")
+    Saves the request in db under its due bucket, the scheduler dispatcher fires the url once it is due.
 
-    data = await request.json()
-    
-    print(data)
+    A request with an `Idempotency-Key` header, or a `client_ref`, creates its timer once: retries get the
+    id of that timer and its current `time_left`, with an `Idempotent-Replayed: true` header.
+    """
+    data = await read_json(request)
+    user_id = parse_user_id(request.headers.get("X-User-Id"))
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if idempotency_key is not None and not 1 <= len(idempotency_key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters",
+        )
 
     try:
-        timer_data = SetTimerRequest(**data)
+        timer_data = SetTimerRequest.model_validate(data)
 
-        hours = timer_data.hours
-        minutes = timer_data.minutes
-        seconds = timer_data.seconds
         url = str(timer_data.url)
-        
-        eta = datetime.now(tz=timezone.utc) + timedelta(hours=hours, minutes=minutes, seconds=seconds)
+        now = datetime.now(tz=timezone.utc)
+        eta, recurrence = timer_data.schedule(now)
+        idempotency_key = idempotency_key or timer_data.dedup_key()
 
-        timer_db = await timer.insert_timer_request(eta=eta, url=url)
+        if idempotency_key is None:
+            timer_db = await timer.insert_timer_request(
+                eta=eta, url=url, user_id=user_id, coalesce=timer_data.coalesce, recurrence=recurrence
+            )
+            created = True
+        else:
+            timer_db, created = await timer.insert_idempotent_timer_request(
+                idempotency_key, eta=eta, url=url, user_id=user_id, coalesce=timer_data.coalesce, recurrence=recurrence
+            )
 
-        timer_celery.fire_webhook.apply_async(args=[str(timer_db.id), url], eta=eta, queue="webhook_queue")
-
-        response = SetTimerResponse(
-            id=str(timer_db.id),
-            time_left=hours * 3600 + minutes * 60 + seconds
-        )
+        if created:
+            time_left = round((eta - now).total_seconds())
+        else:
+            original_eta = timer_db.eta if timer_db.eta.tzinfo else timer_db.eta.replace(tzinfo=timezone.utc)
+            time_left = max(round((original_eta - now).total_seconds()), 0)
+        response = SetTimerResponse(id=str(timer_db.id), time_left=time_left)
 
     except ValidationError as e:
-        raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=e.errors()) from e
+        raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=e.errors(include_url=False, include_context=False)) from e
     
     except Exception as e:
         logger.warning("Unexpected error: %s", e)
         raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="An unexpected error occurred.") from e
 
-    return JSONResponse(content=response.model_dump(), status_code=HTTPStatus.CREATED)
+    if not created and timer_db.url != url:
+        raise HTTPException(status_code=HTTPStatus.CONFLICT, detail="Idempotency-Key was used for another url")
+    headers = None if created else {"Idempotent-Replayed": "true"}
+    return ORJSONResponse(content=response.model_dump(), status_code=HTTPStatus.CREATED, headers=headers)
 
 
-@timerRoutes.get('/{timer_id}')
-async def get_timer(timer_id: str):
+@timerRoutes.post('/batch')
+async def set_timers(request: Request):
+    """
+    Route to accept a batch of timer requests as a JSON array of `SetTimerRequest` objects.
+    Valid timers are saved with a single bulk insert, the response lists the created timer or the
+    validation errors for every entry, in request order.
+    """
+    data = await read_json(request)
+    user_id = parse_user_id(request.headers.get("X-User-Id"))
+
+    if not isinstance(data, list):
+        raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail="Request must be a JSON array of timers")
+
+    if len(data) > settings.TIMER_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+            detail=f"A batch accepts at most {settings.TIMER_BATCH_MAX_SIZE} timers",
+        )
+
+    now = datetime.now(tz=timezone.utc)
+    results = [SetTimerBatchItemResponse() for _ in data]
+    accepted = []
+
+    for index, item in enumerate(data):
+        try:
+            timer_data = SetTimerRequest.model_validate(item)
+        except ValidationError as e:
+            results[index].errors = e.errors(include_url=False, include_context=False)
+            continue
+
+        eta, recurrence = timer_data.schedule(now)
+        accepted.append((index, eta, str(timer_data.url), timer_data.coalesce, recurrence))
+
     try:
-        timer_id = ObjectId(timer_id)
-    except InvalidId as exc:
+        timers = await timer.insert_timer_requests([request for _, *request in accepted], user_id=user_id)
+    except Exception as e:
+        logger.warning("Unexpected error: %s", e)
+        raise HTTPException(status_code=HTTPStatus.INTERNAL_SERVER_ERROR, detail="An unexpected error occurred.") from e
+
+    for (index, eta, *_), timer_db in zip(accepted, timers):
+        if timer_db is None:
+            results[index].errors = [{"type": "insert_failed", "msg": "Timer could not be saved"}]
+        else:
+            results[index].id = str(timer_db.id)
+            results[index].time_left = round((eta - now).total_seconds())
+
+    response = SetTimerBatchResponse(timers=results)
+    return ORJSONResponse(content=response.model_dump(exclude_none=True), status_code=HTTPStatus.CREATED)
+
+
+def sse(event: str, data: Any) -> bytes:
+    """Render one server-sent event with a JSON payload."""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+async def stream_timer_events(timer_ids: List[ObjectId]) -> AsyncIterator[bytes]:
+    """
+    Server-sent events of the given timers: one `snapshot` each, then one `completed` each as they fire.
+
+    Subscribes before reading the snapshot, so a timer completing in between is still reported. Unknown
+    timers get a `not_found` event. The stream ends once every known timer completed.
+    """
+    async with timer_events.subscribe([str(timer_id) for timer_id in timer_ids]) as events:
+        timers = await timer.get_timers(
+            timer_ids, projection={"eta": 1, "url": 1, "status": 1, "success": 1, "status_code": 1}
+        )
+        time_now = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+        pending = set()
+        for timer_db in timers:
+            status = timer_db.status.value
+            time_left = max(math.floor((timer_db.eta.replace(tzinfo=None) - time_now).total_seconds()), 0)
+            yield sse("snapshot", TimerSnapshotEvent(id=timer_db.id, time_left=time_left, status=status).model_dump())
+            if status in TERMINAL_STATUSES:
+                completed = TimerCompletedEvent(
+                    id=timer_db.id, status=status, success=timer_db.success, status_code=timer_db.status_code
+                )
+                yield sse("completed", completed.model_dump())
+            else:
+                pending.add(timer_db.id)
+        for timer_id in {str(timer_id) for timer_id in timer_ids} - {timer_db.id for timer_db in timers}:
+            yield sse("not_found", {"id": timer_id})
+
+        while pending:
+            try:
+                event = await asyncio.wait_for(events.get(), timeout=settings.TIMER_STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if event["id"] in pending:
+                pending.discard(event["id"])
+                yield sse("completed", TimerCompletedEvent.model_validate(event).model_dump())
+
+
+@timerRoutes.get('/stream')
+async def stream_timers(ids: str):
+    """
+    Route to follow many timers over one server-sent events connection instead of polling each of them.
+    `ids` is a comma separated list of timer ids, at most `TIMER_STREAM_MAX_IDS`.
+    """
+    timer_ids = list(dict.fromkeys(parse_timer_id(timer_id.strip()) for timer_id in ids.split(",") if timer_id.strip()))
+    if not timer_ids:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="No timer ids to stream")
+    if len(timer_ids) > settings.TIMER_STREAM_MAX_IDS:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
-            detail="Invalid timer ID format."
-        ) from exc
+            detail=f"A stream follows at most {settings.TIMER_STREAM_MAX_IDS} timers",
+        )
+
+    return StreamingResponse(
+        stream_timer_events(timer_ids),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def stream_timer_page(
+    user_id: ObjectId,
+    limit: int,
+    status: Optional[TimerStatus],
+    after: Optional[Tuple[datetime, ObjectId]],
+) -> AsyncIterator[bytes]:
+    """
+    One `GET /timer` page as a JSON object, rendered timer by timer while the Mongo cursor is read.
+
+    One timer more than the page is read: when it exists, `next_cursor` points after the last listed timer.
+    """
+    time_now = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    yield b'{"timers":['
+    listed, next_cursor = 0, None
+    async for timer_db in timer.iter_user_timers(
+        user_id,
+        limit + 1,
+        status=status,
+        after=after,
+        projection={"eta": 1, "url": 1, "status": 1, "success": 1, "status_code": 1},
+    ):
+        if listed == limit:
+            next_cursor = encode_cursor(last.eta, last.id)
+            break
+        eta = timer_db.eta.replace(tzinfo=None)
+        item = TimerListItem(
+            id=timer_db.id,
+            url=timer_db.url,
+            eta=eta.replace(tzinfo=timezone.utc),
+            status=timer_db.status.value,
+            time_left=max(math.floor((eta - time_now).total_seconds()), 0),
+            success=timer_db.success,
+            status_code=timer_db.status_code,
+        )
+        yield (b"," if listed else b"") + orjson.dumps(item.model_dump())
+        listed, last = listed + 1, timer_db
+    yield b'],"next_cursor":' + orjson.dumps(next_cursor) + b"}"
+
+
+@timerRoutes.get('/')
+async def list_timers(user_id: str, status: Optional[str] = None, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Route to list the timers of a user ordered by eta, optionally only those in one `status`.
+    Pages hold `limit` timers, `TIMER_LIST_PAGE_SIZE` by default. Pass the `next_cursor` of a page as `cursor`
+    to read the next one, it is null on the last page.
+    """
+    owner = parse_user_id(user_id)
+    limit = limit or settings.TIMER_LIST_PAGE_SIZE
+    if not 1 <= limit <= settings.TIMER_LIST_MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f"A page holds between 1 and {settings.TIMER_LIST_MAX_PAGE_SIZE} timers",
+        )
+    try:
+        timer_status = TimerStatus(status) if status else None
+    except ValueError as exc:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid timer status.") from exc
+    after = decode_cursor(cursor) if cursor else None
+
+    return StreamingResponse(stream_timer_page(owner, limit, timer_status, after), media_type="application/json")
+
+
+@timerRoutes.get('/stats')
+async def get_timer_stats(user_id: str):
+    """
+    Route to read the timer counters of a user: pending timers, fired and failed deliveries and cancelled timers.
+    Counters are maintained as timers change state, reading them never scans the timers.
+    """
+    owner = parse_user_id(user_id)
+    counters = await timer_counters.get_counters(owner)
+    response = TimerStatsResponse(
+        user_id=user_id,
+        pending=counters.pending,
+        fired=counters.fired,
+        failed=counters.failed,
+        cancelled=counters.cancelled,
+    )
+    return ORJSONResponse(content=response.model_dump(), status_code=HTTPStatus.OK)
+
 
-    timer_db = await timer.get_timer_by_id(timer_id=timer_id)
+@timerRoutes.get('/{timer_id}')
+async def get_timer(timer_id: str):
+    timer_id = parse_timer_id(timer_id)
+
+    eta = await timer.get_timer_eta(timer_id=timer_id)
     
-    if not timer_db:
+    if not eta:
         logger.warning("Timer id %s not found in db", str(timer_id))
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Timer not found")
 
     time_now = datetime.now(tz=timezone.utc).replace(tzinfo=None)
-    response = GetTimerResponse(id=timer_db.id, time_left=0)
+    response = GetTimerResponse(id=str(timer_id), time_left=0)
 
-    if time_now > (timer_db.eta).replace(tzinfo=None):
+    if time_now > eta.replace(tzinfo=None):
         logger.info("Trigger time is in past for timer id %s", str(timer_id))
-        return JSONResponse(content=response.model_dump(), status_code=HTTPStatus.OK)
+        return ORJSONResponse(content=response.model_dump(), status_code=HTTPStatus.OK)
+
+    response.time_left = math.floor((eta - time_now).total_seconds())
+
+    return ORJSONResponse(content=response.model_dump(), status_code=HTTPStatus.OK)
+
+
+@timerRoutes.delete('/{timer_id}')
+async def cancel_timer(timer_id: str):
+    """
+    Route to cancel a timer that has not fired yet.
+    A dispatch already on its way is dropped by the worker without calling the url.
+    """
+    timer_id = parse_timer_id(timer_id)
+
+    if not await timer.cancel_timer(timer_id=timer_id):
+        await raise_not_modifiable(timer_id)
+
+    return Response(status_code=HTTPStatus.NO_CONTENT)
+
+
+@timerRoutes.patch('/{timer_id}')
+async def reschedule_timer(timer_id: str, request: Request):
+    """
+    Route to move a timer that has not fired yet to a new eta, counted from now.
+    """
+    timer_id = parse_timer_id(timer_id)
+
+    data = await read_json(request)
+
+    try:
+        timer_data = RescheduleTimerRequest.model_validate(data)
+    except ValidationError as e:
+        raise HTTPException(status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=e.errors(include_url=False, include_context=False)) from e
+
+    time_left = timer_data.hours * 3600 + timer_data.minutes * 60 + timer_data.seconds
+    eta = datetime.now(tz=timezone.utc) + timedelta(seconds=time_left)
 
-    response.time_left = math.floor((timer_db.eta - time_now).total_seconds())
+    if not await timer.reschedule_timer(timer_id=timer_id, eta=eta):
+        await raise_not_modifiable(timer_id)
 
-    return JSONResponse(content=response.model_dump(), status_code=HTTPStatus.OK)
+    response = SetTimerResponse(id=str(timer_id), time_left=time_left)
+    return ORJSONResponse(content=response.model_dump(), status_code=HTTPStatus.OK)
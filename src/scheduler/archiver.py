@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Collection, Optional
+
+from src.database.dead_letter import dead_letter
+from src.database.timer import timer
+from src.database.timer_archive import timer_archive
+from src.settings import settings
+from src.utilities.metrics import TIMERS_ARCHIVED
+
+logger = logging.getLogger(__name__)
+
+
+class Archiver:
+    """
+    Moves fired and cancelled timers out of the hot `timer` collection, dead-lettered ones only after a while.
+
+    Timers last updated more than `after_seconds` ago are streamed in batches, upserted into the
+    `timer_archive` collection with compacted responses, then deleted from `timer` unless they changed in
+    between. Reads by id fall back to the archive, and a TTL index expires archived timers later on. A run
+    interrupted between the two steps is repaired by the next one, the archive upsert being idempotent.
+
+    Dead-lettered timers are kept for `failed_after_seconds` so they can be replayed. Past that they are archived
+    as well and their dead letters removed.
+
+    With `owned_shards` only the shards its node leases are archived, like the sweeper.
+    """
+
+    def __init__(
+        self,
+        after_seconds: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        interval_seconds: Optional[float] = None,
+        failed_after_seconds: Optional[float] = None,
+        owned_shards: Optional[Callable[[], Collection[int]]] = None,
+    ) -> None:
+        """
+        :param after_seconds: age of the last update before a timer is archived, defaults to `TIMER_ARCHIVE_AFTER_SECONDS`
+        :param batch_size: timers moved per batch, defaults to `TIMER_ARCHIVE_BATCH_SIZE`
+        :param interval_seconds: pause between runs, defaults to `TIMER_ARCHIVE_INTERVAL_SECONDS`
+        :param failed_after_seconds: age of the last update before a dead-lettered timer is archived, defaults to
+            `TIMER_DEAD_LETTER_RETENTION_SECONDS`, 0 keeps them
+        :param owned_shards: returns the shards to archive, usually `ShardCoordinator.owned_shards`, every shard by default
+        """
+        self.after_seconds = settings.TIMER_ARCHIVE_AFTER_SECONDS if after_seconds is None else after_seconds
+        self.batch_size = batch_size or settings.TIMER_ARCHIVE_BATCH_SIZE
+        self.interval_seconds = interval_seconds or settings.TIMER_ARCHIVE_INTERVAL_SECONDS
+        self.failed_after_seconds = (
+            settings.TIMER_DEAD_LETTER_RETENTION_SECONDS if failed_after_seconds is None else failed_after_seconds
+        )
+        self.owned_shards = owned_shards
+        self._stopped = asyncio.Event()
+
+    async def archive(self) -> int:
+        """
+        Move every timer that completed long enough ago to the archive.
+
+        :return: number of timers removed from the `timer` collection
+        """
+        shards = self.owned_shards() if self.owned_shards else None
+        if shards is not None and not shards:
+            return 0
+        now = datetime.now(tz=timezone.utc)
+        before = now - timedelta(seconds=self.after_seconds)
+        failed_before = (
+            now - timedelta(seconds=max(self.after_seconds, self.failed_after_seconds))
+            if self.failed_after_seconds else None
+        )
+        archived = 0
+        async for documents in timer.iter_archivable(
+            before=before, batch_size=self.batch_size, shards=shards, failed_before=failed_before
+        ):
+            await timer_archive.archive(documents)
+            deleted = await timer.delete_archived(
+                [document["_id"] for document in documents], before=before, failed_before=failed_before
+            )
+            failed = [str(document["_id"]) for document in documents if document.get("success") is False]
+            if failed and failed_before is not None:
+                await dead_letter.discard(failed, failed_before)
+            TIMERS_ARCHIVED.inc(deleted)
+            archived += deleted
+
+        if archived:
+            logger.info("Archived %s completed timers", archived)
+        return archived
+
+    async def run(self) -> None:
+        """Archive every `interval_seconds` until stopped, unless archiving is disabled."""
+        if not self.after_seconds:
+            return
+        while not self._stopped.is_set():
+            try:
+                await self.archive()
+            except Exception as e:
+                logger.warning("Archiving timers failed: %s", e)
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self) -> None:
+        self._stopped.set()
@@ -0,0 +1,135 @@
+"""
+Where the dispatcher finds due timers.
+
+    python -m src.scheduler.backend --backfill
+
+fills the redis due queue with every pending timer, run it once when switching `SCHEDULER_BACKEND` to redis.
+"""
+import argparse
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Collection, List, Optional
+
+from src.database.due_queue import RedisDueQueue
+from src.database.timer import due_bucket, shard_of, timer
+from src.models.timer_db import TimerDB
+from src.settings import SchedulerBackendKind, settings
+
+
+class SchedulerBackend(ABC):
+    """
+    Source of due timers for the dispatcher.
+
+    Whatever the backend, a timer is only handed out once it is claimed in the `timer` collection, so
+    backends differ in how candidates are found, never in who fires a timer.
+    """
+
+    @abstractmethod
+    async def claim_due(self, until: datetime, limit: int, shards: Optional[Collection[int]] = None) -> List[TimerDB]:
+        """
+        Claim pending timers due at or before `until`, oldest first.
+
+        :param until: claim every bucket up to and including the one containing this instant
+        :param limit: maximum number of timers to claim in one pass
+        :param shards: only claim timers of these shards, all of them by default
+        :return: the timers claimed by this call
+        """
+
+    async def aclose(self) -> None:
+        pass
+
+
+class MongoSchedulerBackend(SchedulerBackend):
+    """Range scans the (status, shard, due_bucket) index of the `timer` collection, the default."""
+
+    async def claim_due(self, until: datetime, limit: int, shards: Optional[Collection[int]] = None) -> List[TimerDB]:
+        return await timer.claim_due_timers(until=until, limit=limit, shards=shards)
+
+
+class RedisSchedulerBackend(SchedulerBackend):
+    """
+    Pops due timer ids from the per shard sorted sets of the redis due queue, then claims them in Mongo by id.
+
+    Pending timers cost Mongo no index range scans and Redis a few dozen bytes each. Popped ids stay in flight
+    in Redis until their Mongo claim is settled, so a dispatcher dying in between loses nothing. Every
+    `reconcile_seconds` the timers overdue by more than a lease are read from Mongo and added again, which
+    repairs timers that never reached Redis.
+    """
+
+    def __init__(self, due_queue: Optional[RedisDueQueue] = None, reconcile_seconds: Optional[float] = None) -> None:
+        """
+        :param due_queue: defaults to the due queue `Timer` keeps in step
+        :param reconcile_seconds: defaults to `SCHEDULER_REDIS_RECONCILE_SECONDS`
+        """
+        self.due_queue = due_queue or timer.due_queue or RedisDueQueue()
+        self.reconcile_seconds = reconcile_seconds or settings.SCHEDULER_REDIS_RECONCILE_SECONDS
+        self._reconciled_at = float("-inf")
+        self._passes = 0
+
+    async def backfill(
+        self,
+        until: Optional[datetime] = None,
+        shards: Optional[Collection[int]] = None,
+        batch_size: int = 1000,
+    ) -> int:
+        """
+        Add pending timers from Mongo to the due queue under the due bucket Mongo holds for them.
+
+        :param until: only timers due by then, all of them by default
+        :param shards: only timers of these shards, all of them by default
+        :param batch_size: timers added per round-trip
+        :return: number of timers added
+        """
+        added = 0
+        async for chunk in timer.iter_pending(until, batch_size, shards=shards):
+            await self.due_queue.add((timer_id, shard_of(timer_id), bucket) for timer_id, bucket in chunk)
+            added += len(chunk)
+        return added
+
+    async def claim_due(self, until: datetime, limit: int, shards: Optional[Collection[int]] = None) -> List[TimerDB]:
+        if time.monotonic() - self._reconciled_at >= self.reconcile_seconds:
+            self._reconciled_at = time.monotonic()
+            overdue = datetime.now(tz=timezone.utc) - timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+            await self.backfill(overdue, shards=shards)
+
+        # Start every pass at another shard, so a busy shard cannot starve the ones after it
+        order = sorted(range(settings.SCHEDULER_SHARDS) if shards is None else shards)
+        self._passes += 1
+        start = self._passes % len(order) if order else 0
+        claimed: List[TimerDB] = []
+        for shard in order[start:] + order[:start]:
+            if len(claimed) >= limit:
+                break
+            ids = await self.due_queue.claim(
+                shard, due_bucket(until), limit - len(claimed), settings.SCHEDULER_LEASE_SECONDS
+            )
+            if ids:
+                claimed += await timer.claim_timers(ids, until)
+                await self.due_queue.ack(shard, ids)
+        return claimed
+
+    async def aclose(self) -> None:
+        await self.due_queue.aclose()
+
+
+def scheduler_backend() -> SchedulerBackend:
+    """The backend configured by `SCHEDULER_BACKEND`."""
+    if settings.SCHEDULER_BACKEND == SchedulerBackendKind.REDIS:
+        return RedisSchedulerBackend()
+    return MongoSchedulerBackend()
+
+
+async def main() -> None:
+    added = await RedisSchedulerBackend().backfill()
+    print(f"Added {added} pending timers to the redis due queue")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the scheduler backend.")
+    parser.add_argument("--backfill", action="store_true", help="Add every pending timer to the redis due queue")
+    if parser.parse_args().backfill:
+        asyncio.run(main())
+    else:
+        parser.print_help()
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import signal
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Collection, Dict, List, Optional
+
+from prometheus_client import start_http_server
+
+from src.celery_workers import timer as timer_celery
+from src.celery_workers.celery_app import celery_app, shard_queue
+from src.database.dead_letter import dead_letter
+from src.database.shard_lease import shard_lease, shard_node
+from src.database.timer import timer
+from src.database.timer_archive import timer_archive
+from src.models.timer_db import TimerDB
+from src.scheduler.archiver import Archiver
+from src.scheduler.backend import SchedulerBackend, scheduler_backend
+from src.scheduler.sharding import ShardCoordinator
+from src.scheduler.sweeper import Sweeper
+from src.scheduler.timing_wheel import TimingWheel
+from src.settings import settings
+from src.utilities.logging_config import setup_logging
+from src.utilities.metrics import TIMERS_CLAIMED, TIMERS_PUBLISHED, WHEEL_ARMED, metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher:
+    """
+    Owns due-time ordering for timers.
+
+    Timers wait in the `timer` collection keyed by their due bucket instead of sitting in the broker as
+    ETA messages. The dispatcher repeatedly claims the buckets due within the lookahead window, found by its
+    `SchedulerBackend`, and arms them on an in-process timing wheel, which publishes each one to the webhook queue at its exact eta.
+    Broker and worker memory stay flat no matter how many timers are pending or how far out they are set,
+    and short timers fire with tick-level rather than poll-level lateness.
+
+    Timers that opted into coalescing are held for `coalesce_window_seconds` once due, and published
+    together with every other coalescing timer for the same url as one batched webhook.
+
+    With `owned_shards` the dispatcher only claims timers of the shards its node leases, so several
+    dispatcher nodes split the timers between them, and publishes each timer to its shard's queue.
+    """
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        tick_seconds: Optional[float] = None,
+        lookahead_seconds: Optional[float] = None,
+        wheel: Optional[TimingWheel] = None,
+        coalesce_window_seconds: Optional[float] = None,
+        coalesce_max_batch: Optional[int] = None,
+        owned_shards: Optional[Callable[[], Collection[int]]] = None,
+        backend: Optional[SchedulerBackend] = None,
+    ) -> None:
+        """
+        :param batch_size: maximum timers claimed per pass, defaults to `SCHEDULER_BATCH_SIZE`
+        :param tick_seconds: sleep between passes when idle, defaults to `SCHEDULER_TICK_SECONDS`
+        :param lookahead_seconds: claim timers due this far ahead, defaults to `SCHEDULER_LOOKAHEAD_SECONDS`
+        :param wheel: timing wheel holding claimed timers until they are due
+        :param coalesce_window_seconds: how long a due coalescing timer waits for others to the same url,
+            defaults to `SCHEDULER_COALESCE_WINDOW_SECONDS`
+        :param coalesce_max_batch: max timers per batched webhook, defaults to `SCHEDULER_COALESCE_MAX_BATCH`
+        :param owned_shards: returns the shards to claim timers of, usually `ShardCoordinator.owned_shards`,
+            every shard by default
+        :param backend: where due timers are found, configured by `SCHEDULER_BACKEND` by default
+        """
+        self.batch_size = batch_size or settings.SCHEDULER_BATCH_SIZE
+        self.tick_seconds = tick_seconds or settings.SCHEDULER_TICK_SECONDS
+        self.lookahead_seconds = (
+            settings.SCHEDULER_LOOKAHEAD_SECONDS if lookahead_seconds is None else lookahead_seconds
+        )
+        self.wheel = wheel or TimingWheel(tick_seconds=settings.SCHEDULER_WHEEL_TICK_SECONDS)
+        self.coalesce_window_seconds = (
+            settings.SCHEDULER_COALESCE_WINDOW_SECONDS if coalesce_window_seconds is None else coalesce_window_seconds
+        )
+        self.coalesce_max_batch = coalesce_max_batch or settings.SCHEDULER_COALESCE_MAX_BATCH
+        self.owned_shards = owned_shards
+        self.backend = backend or scheduler_backend()
+        self._ready: List[TimerDB] = []
+        self._coalescing: Dict[str, List[TimerDB]] = {}
+        self._stopped = asyncio.Event()
+
+    def publish_many(self, timers: List[TimerDB]) -> None:
+        """
+        Hand due timers to the webhook queue.
+
+        All messages go out through one pooled producer, so a burst is pipelined on a single channel
+        instead of acquiring a connection per timer. Coalescing timers for the same url go out as batched
+        messages of up to `coalesce_max_batch` timers.
+        """
+        if not timers:
+            return
+        batches: Dict[str, List[TimerDB]] = defaultdict(list)
+        with celery_app.producer_or_acquire() as producer:
+            for timer_db in timers:
+                if timer_db.coalesce:
+                    batches[timer_db.url].append(timer_db)
+                    continue
+                timer_celery.fire_webhook.apply_async(
+                    args=[str(timer_db.id), timer_db.url, timer_db.claim_id],
+                    queue=shard_queue(timer_db.shard),
+                    producer=producer,
+                )
+            for url, batch in batches.items():
+                for start in range(0, len(batch), self.coalesce_max_batch):
+                    chunk = batch[start:start + self.coalesce_max_batch]
+                    timer_celery.fire_webhook_batch.apply_async(
+                        args=[url, [[str(t.id), t.claim_id] for t in chunk]],
+                        queue=shard_queue(chunk[0].shard),
+                        producer=producer,
+                    )
+        TIMERS_PUBLISHED.inc(len(timers))
+
+    def arm(self, timer_db: TimerDB, now: datetime) -> None:
+        """Mark a claimed timer ready if it is due, otherwise park it on the timing wheel."""
+        eta = timer_db.eta if timer_db.eta.tzinfo else timer_db.eta.replace(tzinfo=timezone.utc)
+        delay = (eta - now).total_seconds()
+        if delay <= 0:
+            self._due(timer_db)
+        else:
+            self.wheel.schedule(str(timer_db.id), delay, self._due, timer_db)
+
+    def _due(self, timer_db: TimerDB) -> None:
+        """Mark a timer ready, holding a coalescing one back for its url's window."""
+        if not timer_db.coalesce or not self.coalesce_window_seconds:
+            self._ready.append(timer_db)
+            return
+        group = self._coalescing.get(timer_db.url)
+        if group is None:
+            group = self._coalescing[timer_db.url] = []
+            self.wheel.schedule(("coalesce", timer_db.url), self.coalesce_window_seconds, self._release, timer_db.url)
+        group.append(timer_db)
+        if len(group) >= self.coalesce_max_batch:
+            self.wheel.cancel(("coalesce", timer_db.url))
+            self._release(timer_db.url)
+
+    def _release(self, url: str) -> None:
+        """End the coalescing window of `url`, its timers go out together with the next flush."""
+        self._ready.extend(self._coalescing.pop(url, []))
+
+    def flush_ready(self) -> int:
+        """Publish every timer that has become due since the last flush."""
+        ready, self._ready = self._ready, []
+        self.publish_many(ready)
+        return len(ready)
+
+    async def dispatch_due(self) -> int:
+        """
+        Claim one batch of timers due within the lookahead window and arm them.
+
+        :return: number of timers claimed
+        """
+        shards = self.owned_shards() if self.owned_shards else None
+        if shards is not None and not shards:
+            return 0
+        now = datetime.now(tz=timezone.utc)
+        timers = await self.backend.claim_due(
+            until=now + timedelta(seconds=self.lookahead_seconds), limit=self.batch_size, shards=shards
+        )
+        for timer_db in timers:
+            self.arm(timer_db, now)
+        self.flush_ready()
+        TIMERS_CLAIMED.labels(source="dispatcher").inc(len(timers))
+        if timers:
+            logger.info("Claimed %s due timers, %s armed on the wheel", len(timers), len(self.wheel))
+        return len(timers)
+
+    async def drive_wheel(self) -> None:
+        """Advance the timing wheel every tick and publish what expired in one go."""
+        while not self._stopped.is_set():
+            self.wheel.advance()
+            WHEEL_ARMED.set(len(self.wheel))
+            try:
+                self.flush_ready()
+            except Exception as e:
+                logger.warning("Publishing due timers failed: %s", e)
+            await asyncio.sleep(self.wheel.next_tick_in())
+
+    async def run(self) -> None:
+        """Dispatch until stopped, draining back-to-back while batches come back full."""
+        wheel_task = asyncio.create_task(self.drive_wheel())
+        while not self._stopped.is_set():
+            try:
+                dispatched = await self.dispatch_due()
+            except Exception as e:
+                logger.warning("Dispatcher pass failed: %s", e)
+                dispatched = 0
+
+            if dispatched < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._stopped.wait(), timeout=self.tick_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        await wheel_task
+        for url in list(self._coalescing):
+            self._release(url)
+        self.flush_ready()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+async def main() -> None:
+    start_http_server(settings.SCHEDULER_METRICS_PORT, registry=metrics_registry())
+    await timer.ensure_indexes()
+    await dead_letter.ensure_indexes()
+    await shard_lease.ensure_indexes()
+    await shard_node.ensure_indexes()
+    await timer_archive.ensure_indexes()
+    coordinator = ShardCoordinator(role="dispatcher")
+    await coordinator.rebalance()
+    dispatcher = Dispatcher(owned_shards=coordinator.owned_shards)
+    sweeper = Sweeper(publish=dispatcher.publish_many, owned_shards=coordinator.owned_shards)
+    archiver = Archiver(owned_shards=coordinator.owned_shards)
+
+    def stop() -> None:
+        dispatcher.stop()
+        sweeper.stop()
+        archiver.stop()
+        coordinator.stop()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop)
+    await asyncio.gather(dispatcher.run(), sweeper.run(), archiver.run(), coordinator.run())
+    await dispatcher.backend.aclose()
+
+
+if __name__ == '__main__':
+    setup_logging()
+    asyncio.run(main())
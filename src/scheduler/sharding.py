@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, FrozenSet, Optional, Set
+
+from src.database.shard_lease import ShardLease, ShardNode, shard_lease, shard_node
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def default_node_id() -> str:
+    """`NODE_ID`, or host and pid so several local processes are told apart."""
+    return settings.NODE_ID or f"{socket.gethostname()}:{os.getpid()}"
+
+
+class ShardCoordinator:
+    """
+    Leases a fair share of the `SCHEDULER_SHARDS` timer partitions for one node of a role.
+
+    Every `interval` the node heartbeats, renews the leases it holds, gives back shards above its share
+    (`ceil(shards / live nodes)`) and takes free or expired ones up to it. When a node joins, the others
+    shed their extras over the next round and the newcomer picks them up; when a node leaves, it releases
+    its shards at once, and when it dies its leases expire and are taken over.
+
+    Leases only partition the work. Correctness still rests on the timer claim and acquire compare-and-set:
+    two nodes briefly overlapping on a shard claim disjoint timers, and timers a dead node had claimed are
+    recovered by the sweeper of the shard's next owner.
+    """
+
+    def __init__(
+        self,
+        role: str,
+        node_id: Optional[str] = None,
+        shards: Optional[int] = None,
+        lease_seconds: Optional[float] = None,
+        interval_seconds: Optional[float] = None,
+        on_change: Optional[Callable[[Set[int], Set[int]], None]] = None,
+        leases: ShardLease = shard_lease,
+        nodes: ShardNode = shard_node,
+    ) -> None:
+        """
+        :param role: nodes of the same role share the shards, e.g. `dispatcher` or `worker`
+        :param node_id: name of this node in the leases, defaults to `default_node_id()`
+        :param shards: number of shards, defaults to `SCHEDULER_SHARDS`
+        :param lease_seconds: lease and heartbeat duration, defaults to `SHARD_LEASE_SECONDS`
+        :param interval_seconds: pause between rebalances, defaults to `SHARD_REBALANCE_SECONDS`
+        :param on_change: called with the shards gained and lost whenever ownership changes
+        :param leases: lease store
+        :param nodes: heartbeat store
+        """
+        self.role = role
+        self.node_id = node_id or default_node_id()
+        self.shards = shards or settings.SCHEDULER_SHARDS
+        self.lease_seconds = lease_seconds or settings.SHARD_LEASE_SECONDS
+        self.interval_seconds = interval_seconds or settings.SHARD_REBALANCE_SECONDS
+        self.on_change = on_change
+        self.leases = leases
+        self.nodes = nodes
+        self._owned: FrozenSet[int] = frozenset()
+        self._valid_until = 0.0
+        self._stopped = asyncio.Event()
+
+    def owned_shards(self) -> FrozenSet[int]:
+        """Shards this node owns, none once its leases may have run out without being renewed."""
+        if time.monotonic() >= self._valid_until:
+            return frozenset()
+        return self._owned
+
+    async def rebalance(self) -> FrozenSet[int]:
+        """
+        Heartbeat, renew held leases and move towards this node's share of the shards.
+
+        :return: the shards owned afterwards
+        """
+        started = time.monotonic()
+        now = datetime.now(tz=timezone.utc)
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+
+        await self.nodes.heartbeat(self.role, self.node_id, expires_at)
+        live = max(await self.nodes.count_live(self.role, now), 1)
+        target = math.ceil(self.shards / live)
+
+        owned = {shard for shard in await self.leases.renew(self.role, self.node_id, now, expires_at)
+                 if shard < self.shards}
+        if len(owned) > target:
+            extra = set(sorted(owned)[target:])
+            await self.leases.release(self.role, self.node_id, extra)
+            owned -= extra
+        elif len(owned) < target:
+            taken = await self.leases.taken(self.role, now)
+            free = [shard for shard in range(self.shards) if shard not in taken and shard not in owned]
+            # Start at a random point so nodes rebalancing at the same time contend less
+            random.shuffle(free)
+            for shard in free:
+                if len(owned) >= target:
+                    break
+                if await self.leases.acquire(self.role, shard, self.node_id, now, expires_at):
+                    owned.add(shard)
+
+        self._valid_until = started + self.lease_seconds
+        self._set_owned(frozenset(owned))
+        return self._owned
+
+    def _set_owned(self, owned: FrozenSet[int]) -> None:
+        gained, lost = set(owned - self._owned), set(self._owned - owned)
+        self._owned = owned
+        if not (gained or lost):
+            return
+        logger.info("Node %s %s owns shards %s (+%s -%s)", self.node_id, self.role, sorted(owned), sorted(gained), sorted(lost))
+        if self.on_change is not None:
+            self.on_change(gained, lost)
+
+    async def release_all(self) -> None:
+        """Hand every shard back and drop the heartbeat, so the remaining nodes take over right away."""
+        owned = self._owned
+        self._valid_until = 0.0
+        self._set_owned(frozenset())
+        await self.leases.release(self.role, self.node_id, owned)
+        await self.nodes.leave(self.role, self.node_id)
+
+    async def run(self) -> None:
+        """Rebalance every `interval_seconds` until stopped, then release every shard."""
+        while not self._stopped.is_set():
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.warning("Shard rebalance of %s failed: %s", self.node_id, e)
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+        try:
+            await self.release_all()
+        except Exception as e:
+            logger.warning("Releasing the shards of %s failed: %s", self.node_id, e)
+
+    def stop(self) -> None:
+        self._stopped.set()
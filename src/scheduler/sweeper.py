@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Collection, List, Optional
+
+from src.database.timer import timer
+from src.models.timer_db import TimerDB
+from src.settings import settings
+from src.utilities.metrics import TIMERS_CLAIMED
+
+logger = logging.getLogger(__name__)
+
+
+class Sweeper:
+    """
+    Re-arms timers whose dispatch was lost.
+
+    A timer keeps a lease from the moment the dispatcher claims it until its webhook result is written.
+    If the message is lost by the broker, or the dispatcher or worker holding it dies, the lease runs out.
+    The sweeper streams expired leases from the `timer` collection in bounded batches, claims them again
+    under a new claim id and publishes them. The claim id makes re-dispatch idempotent: any older
+    message for the same timer is rejected when the worker tries to acquire it.
+
+    With `owned_shards` only the shards its node leases are swept, which also covers the timers a node
+    that died had claimed in a shard this node took over.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[List[TimerDB]], None],
+        batch_size: Optional[int] = None,
+        interval_seconds: Optional[float] = None,
+        owned_shards: Optional[Callable[[], Collection[int]]] = None,
+    ) -> None:
+        """
+        :param publish: sends re-claimed timers to the webhook queue, usually `Dispatcher.publish_many`
+        :param batch_size: timers re-claimed per batch, defaults to `SWEEPER_BATCH_SIZE`
+        :param interval_seconds: pause between sweeps, defaults to `SWEEPER_INTERVAL_SECONDS`
+        :param owned_shards: returns the shards to sweep, usually `ShardCoordinator.owned_shards`, every shard by default
+        """
+        self.publish = publish
+        self.batch_size = batch_size or settings.SWEEPER_BATCH_SIZE
+        self.interval_seconds = interval_seconds or settings.SWEEPER_INTERVAL_SECONDS
+        self.owned_shards = owned_shards
+        self._stopped = asyncio.Event()
+
+    async def sweep(self) -> int:
+        """
+        Re-dispatch every timer whose lease has expired.
+
+        :return: number of timers re-dispatched
+        """
+        shards = self.owned_shards() if self.owned_shards else None
+        if shards is not None and not shards:
+            return 0
+        now = datetime.now(tz=timezone.utc)
+        recovered = 0
+        async for ids in timer.iter_expired_leases(now=now, batch_size=self.batch_size, shards=shards):
+            timers = await timer.reclaim_timers(ids, now=now)
+            self.publish(timers)
+            TIMERS_CLAIMED.labels(source="sweeper").inc(len(timers))
+            recovered += len(timers)
+
+        if recovered:
+            logger.warning("Re-dispatched %s timers with expired leases", recovered)
+        return recovered
+
+    async def run(self) -> None:
+        """Sweep every `interval_seconds` until stopped."""
+        while not self._stopped.is_set():
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.warning("Sweep failed: %s", e)
+            try:
+                await asyncio.wait_for(self._stopped.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self) -> None:
+        self._stopped.set()
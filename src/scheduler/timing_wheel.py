@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _WheelEntry:
+    """A single armed timer sitting in one wheel slot."""
+
+    __slots__ = ("key", "deadline", "rounds", "slot", "callback", "args")
+
+    def __init__(self, key: Hashable, deadline: float, rounds: int, slot: int,
+                 callback: Callable[..., Any], args: tuple) -> None:
+        self.key = key
+        self.deadline = deadline
+        self.rounds = rounds
+        self.slot = slot
+        self.callback = callback
+        self.args = args
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel for firing large numbers of short timers with tick-level precision.
+
+    Each slot covers `tick_seconds`; an entry is dropped into the slot its deadline hashes to together
+    with the number of full rotations still to wait. Slots are dicts keyed by timer key, so both
+    `schedule` and `cancel` are O(1) regardless of how many timers are armed, and each tick only
+    touches the entries of a single slot.
+    """
+
+    def __init__(
+        self,
+        tick_seconds: float = 0.01,
+        wheel_size: int = 512,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        :param tick_seconds: resolution of the wheel, timers fire at most one tick late
+        :param wheel_size: number of slots, one rotation spans `tick_seconds * wheel_size`
+        :param clock: monotonic clock in seconds, injectable for tests
+        """
+        self.tick_seconds = tick_seconds
+        self.wheel_size = wheel_size
+        self._clock = clock
+        self._origin = clock()
+        self._current_tick = 0
+        self._slots: list[Dict[Hashable, _WheelEntry]] = [{} for _ in range(wheel_size)]
+        self._entries: Dict[Hashable, _WheelEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def schedule(self, key: Hashable, delay: float, callback: Callable[..., Any], *args: Any) -> None:
+        """
+        Arm `callback(*args)` to run `delay` seconds from now, replacing any timer armed under `key`.
+
+        :param key: unique handle used to cancel the timer
+        :param delay: seconds until the timer is due, values <= 0 fire on the next tick
+        :param callback: called with `args` once the timer expires
+        """
+        self.cancel(key)
+        deadline = self._clock() + max(delay, 0.0)
+        target_tick = max(math.ceil((deadline - self._origin) / self.tick_seconds), self._current_tick)
+        slot = target_tick % self.wheel_size
+        rounds = (target_tick - self._current_tick) // self.wheel_size
+
+        entry = _WheelEntry(key, deadline, rounds, slot, callback, args)
+        self._slots[slot][key] = entry
+        self._entries[key] = entry
+
+    def cancel(self, key: Hashable) -> bool:
+        """
+        Disarm the timer stored under `key`.
+
+        :return: True if a timer was armed under that key
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        del self._slots[entry.slot][key]
+        return True
+
+    def advance(self) -> int:
+        """
+        Process every tick that has elapsed since the last call and fire the expired timers.
+
+        :return: number of callbacks fired
+        """
+        fired = 0
+        elapsed_tick = math.floor((self._clock() - self._origin) / self.tick_seconds)
+        while self._current_tick <= elapsed_tick:
+            bucket = self._slots[self._current_tick % self.wheel_size]
+            expired = []
+            for entry in bucket.values():
+                if entry.rounds > 0:
+                    entry.rounds -= 1
+                else:
+                    expired.append(entry)
+            for entry in expired:
+                del bucket[entry.key]
+                del self._entries[entry.key]
+                try:
+                    entry.callback(*entry.args)
+                except Exception as e:
+                    logger.warning("Timing wheel callback for %s failed: %s", entry.key, e)
+                fired += 1
+            self._current_tick += 1
+        return fired
+
+    def next_tick_in(self) -> float:
+        """Seconds until the next unprocessed tick boundary."""
+        next_boundary = self._origin + self._current_tick * self.tick_seconds
+        return max(next_boundary - self._clock(), 0.0)
+
+    async def run(self, stopped: Optional[asyncio.Event] = None) -> None:
+        """Drive the wheel from the running event loop until `stopped` is set."""
+        stopped = stopped or asyncio.Event()
+        while not stopped.is_set():
+            self.advance()
+            await asyncio.sleep(self.next_tick_in())
@@ -0,0 +1,67 @@
+"""
+Production entry point of the API: `API_WORKERS` uvicorn worker processes on uvloop and httptools.
+
+    python -m src.server --workers 4
+
+Each worker is a fresh interpreter that imports `app:app`, opens its own Mongo and Redis pools in the
+app lifespan and closes them on shutdown. The parent process only supervises the workers and restarts
+any that die.
+"""
+import argparse
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from src.settings import settings
+from src.utilities.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count(workers: Optional[int] = None) -> int:
+    """Worker processes to run, one per usable CPU core unless configured."""
+    workers = workers or settings.API_WORKERS
+    if workers:
+        return workers
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def server_config(workers: int, host: Optional[str] = None, port: Optional[int] = None) -> Dict[str, Any]:
+    """Keyword arguments of `uvicorn.run` for the production server."""
+    return {
+        "app": "app:app",
+        "host": host or settings.API_HOST,
+        "port": port or settings.API_PORT,
+        "workers": workers,
+        "loop": "uvloop",
+        "http": "httptools",
+        "lifespan": "on",
+        "backlog": settings.API_BACKLOG,
+        "timeout_keep_alive": settings.API_KEEPALIVE_SECONDS,
+        # Request logs go through the queue based logging pipeline, sampled
+        "log_config": None,
+        "server_header": False,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the timer API with several uvicorn worker processes.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to API_WORKERS")
+    parser.add_argument("--host", default=None, help="Defaults to API_HOST")
+    parser.add_argument("--port", type=int, default=None, help="Defaults to API_PORT")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    setup_logging()
+    workers = worker_count(args.workers)
+    if workers > 1 and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        logger.warning("PROMETHEUS_MULTIPROC_DIR is not set, /metrics/ only reports the worker serving the scrape")
+    logger.info("Starting %s API workers", workers)
+    uvicorn.run(**server_config(workers, host=args.host, port=args.port))
+
+
+if __name__ == '__main__':
+    main()
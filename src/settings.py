@@ -7,6 +7,11 @@ class SendCloudEnvironment(str, enum.Enum):
     TESTING = "testing"
 
 
+class SchedulerBackendKind(str, enum.Enum):
+    MONGO = "mongo"
+    REDIS = "redis"
+
+
 class Settings(pydantic_settings.BaseSettings):
     SENDCLOUD_ENVIRONMENT: SendCloudEnvironment = Field(default=SendCloudEnvironment.LOCAL, description="Deployment environment")
 
@@ -30,8 +35,87 @@ class Settings(pydantic_settings.BaseSettings):
     MONGO_DBNAME: str = Field(default="timer", description= "Mongodb name")
     
     MONGO_URI: str = Field(default=f"{MONGO_PROTOCOL}://{MONGO_USERNAME}:{MONGO_PASSWORD}@{MONGO_HOSTS}/{MONGO_DBNAME}", description="Mongo URI")
+
+    API_HOST: str = Field(default="0.0.0.0", description="Interface the production API server binds")
+    API_PORT: int = Field(default=80, description="Port the production API server binds")
+    API_WORKERS: int = Field(default=0, ge=0, description="uvicorn worker processes of the production API server, 0 for one per CPU core")
+    API_BACKLOG: int = Field(default=2048, ge=1, description="Pending connections the API listen socket queues")
+    API_KEEPALIVE_SECONDS: int = Field(default=5, ge=1, description="Idle time before the API closes a keep-alive connection")
+
+    TIMER_BATCH_MAX_SIZE: int = Field(default=10000, ge=1, description="Max timers accepted by one POST /timer/batch")
+
+    TIMER_WRITE_BEHIND: bool = Field(default=False, description="Acknowledge new timers once journaled locally and insert them into Mongo in the background")
+    TIMER_JOURNAL_DIR: str = Field(default="journal", description="Directory of the write-behind journal segments, must be local disk that survives restarts")
+    TIMER_JOURNAL_SEGMENT_BYTES: int = Field(default=64 * 1024 * 1024, ge=4096, description="Size of one preallocated journal segment file")
+    TIMER_JOURNAL_SYNC_SECONDS: float = Field(default=0.002, ge=0, description="Group commit window: appends within it share one msync")
+    TIMER_JOURNAL_COMMIT_BATCH_SIZE: int = Field(default=1000, ge=1, description="Journaled timers per insert_many")
+    TIMER_JOURNAL_COMMIT_SECONDS: float = Field(default=0.05, gt=0, description="Max delay before journaled timers are inserted into Mongo")
+
+    TIMER_CACHE_MAXSIZE: int = Field(default=100_000, ge=1, description="Max timer etas cached per process")
+    TIMER_CACHE_TTL_SECONDS: float = Field(default=10.0, gt=0, description="Lifetime of a timer eta in the process cache")
+    TIMER_CACHE_REDIS_URL: str = Field(default="", description="Redis url of the shared timer cache tier, empty disables it")
+    TIMER_CACHE_REDIS_TTL_SECONDS: int = Field(default=300, ge=1, description="Lifetime of a timer eta in the shared cache")
+
+    TIMER_LIST_PAGE_SIZE: int = Field(default=100, ge=1, description="Timers per GET /timer page unless the request sets a limit")
+    TIMER_LIST_MAX_PAGE_SIZE: int = Field(default=1000, ge=1, description="Max timers per GET /timer page")
+    TIMER_STREAM_MAX_IDS: int = Field(default=1000, ge=1, description="Max timers one GET /timer/stream connection subscribes to")
+    TIMER_STREAM_KEEPALIVE_SECONDS: float = Field(default=15.0, gt=0, description="Idle time after which a timer stream sends a keep-alive comment")
+    TIMER_EVENTS_POLL_SECONDS: float = Field(default=1.0, gt=0, description="Poll interval of streamed timers when Mongo has no change streams")
+    TIMER_IDEMPOTENCY_CACHE_SIZE: int = Field(default=100_000, ge=1, description="Recent idempotency keys remembered per process, so replays skip Mongo")
+    TIMER_IDEMPOTENCY_CACHE_TTL_SECONDS: float = Field(default=3600.0, gt=0, description="Lifetime of a remembered idempotency key, capped below TIMER_ARCHIVE_AFTER_SECONDS so an archived timer's key is not answered")
+
+    SCHEDULER_BACKEND: SchedulerBackendKind = Field(default=SchedulerBackendKind.MONGO, description="Where the dispatcher finds due timers: the due bucket index of the timer collection, or Redis sorted sets")
+    SCHEDULER_REDIS_URL: str = Field(default="redis://redis:6379/2", description="Redis holding the due timer sorted sets of the redis scheduler backend")
+    SCHEDULER_REDIS_RECONCILE_SECONDS: float = Field(default=60.0, gt=0, description="How often the redis scheduler backend re-adds overdue timers missing from Redis")
+    SCHEDULER_BUCKET_SECONDS: int = Field(default=1, ge=1, description="Width of a timer due bucket in seconds")
+    SCHEDULER_TICK_SECONDS: float = Field(default=0.5, gt=0, description="Dispatcher poll interval when idle")
+    SCHEDULER_BATCH_SIZE: int = Field(default=1000, ge=1, description="Max timers claimed per dispatcher pass")
+    SCHEDULER_LOOKAHEAD_SECONDS: float = Field(default=2.0, ge=0, description="How far ahead timers are claimed onto the timing wheel")
+    SCHEDULER_WHEEL_TICK_SECONDS: float = Field(default=0.01, gt=0, description="Timing wheel resolution in seconds")
+    SCHEDULER_LEASE_SECONDS: int = Field(default=60, ge=1, description="How long a dispatched timer may wait for a worker past its eta")
+    SCHEDULER_COALESCE_WINDOW_SECONDS: float = Field(default=1.0, ge=0, description="How long a due coalescing timer waits for others to the same url, 0 only merges timers due together")
+    SCHEDULER_COALESCE_MAX_BATCH: int = Field(default=500, ge=1, description="Max timers merged into one batched webhook POST")
+    SCHEDULER_SHARDS: int = Field(default=16, ge=1, description="Number of timer partitions leased by scheduler and worker nodes; never lower it while timers are pending")
+    SHARD_LEASE_SECONDS: float = Field(default=15.0, gt=0, description="How long a node owns a shard without renewing its lease")
+    SHARD_REBALANCE_SECONDS: float = Field(default=5.0, gt=0, description="How often a node renews its shard leases and rebalances")
+    NODE_ID: str = Field(default="", description="Name of this scheduler or worker node in shard leases, defaults to host:pid")
+    WORKER_SHARD_LEASES: bool = Field(default=False, description="Let each Celery worker node lease shards and only consume their queues")
+    SWEEPER_INTERVAL_SECONDS: float = Field(default=30.0, gt=0, description="Pause between crash recovery sweeps")
+    SWEEPER_BATCH_SIZE: int = Field(default=500, ge=1, description="Expired leases re-dispatched per batch")
+    TIMER_ARCHIVE_AFTER_SECONDS: float = Field(default=86400.0, ge=0, description="Age since their last update after which fired and cancelled timers move to the archive, 0 disables archiving")
+    TIMER_DEAD_LETTER_RETENTION_SECONDS: float = Field(default=7 * 86400, ge=0, description="Age since their last update after which timers whose delivery failed for good are archived too and their dead letters dropped, 0 keeps them until replayed")
+    TIMER_ARCHIVE_TTL_SECONDS: int = Field(default=30 * 86400, ge=1, description="Lifetime of an archived timer before Mongo expires it")
+    TIMER_ARCHIVE_BATCH_SIZE: int = Field(default=1000, ge=1, description="Timers moved to the archive per batch")
+    TIMER_ARCHIVE_INTERVAL_SECONDS: float = Field(default=60.0, gt=0, description="Pause between archiving runs")
+    TIMER_RESPONSE_MAX_CHARS: int = Field(default=1024, ge=0, description="Webhook response body kept on a timer, longer bodies are cut and hashed")
     
 
+    WEBHOOK_TIMEOUT_SECONDS: float = Field(default=10.0, gt=0, description="Timeout of a single webhook POST")
+    WEBHOOK_MAX_IN_FLIGHT: int = Field(default=2000, ge=1, description="Max concurrent webhook POSTs per worker process")
+    WEBHOOK_MAX_CONNECTIONS_PER_HOST: int = Field(default=20, ge=1, description="Max concurrent webhook POSTs and pooled connections per destination host")
+    WEBHOOK_MAX_HOST_POOLS: int = Field(default=1000, ge=1, description="Destination host connection pools kept per worker process, the least recently used idle ones are closed beyond that")
+    WEBHOOK_LEASE_SECONDS: int = Field(default=60, ge=1, description="How long a worker owns a timer it is firing")
+    WEBHOOK_RESULT_BATCH_SIZE: int = Field(default=500, ge=1, description="Buffered webhook results flushed per bulk_write")
+    WEBHOOK_RESULT_FLUSH_SECONDS: float = Field(default=0.5, gt=0, description="Max time a webhook result waits in the buffer")
+    WEBHOOK_MAX_ATTEMPTS: int = Field(default=5, ge=1, description="Webhook attempts per timer before it is dead-lettered")
+    WEBHOOK_RETRY_BASE_SECONDS: float = Field(default=5.0, gt=0, description="Backoff before the first retry, doubled on every further attempt")
+    WEBHOOK_RETRY_MAX_SECONDS: float = Field(default=3600.0, gt=0, description="Upper bound of a single retry backoff")
+    WEBHOOK_RETRY_STATUS_CODES: list[int] = Field(default=[408, 425, 429, 500, 502, 503, 504], description="Response status codes that are retried")
+    WEBHOOK_ATTEMPT_HISTORY: int = Field(default=10, ge=1, description="Most recent attempts kept on a timer document")
+    TIMER_OCCURRENCE_HISTORY: int = Field(default=20, ge=1, description="Most recent occurrences kept on a recurring timer document")
+    WEBHOOK_RATE_LIMIT_PER_HOST: float = Field(default=50.0, ge=0, description="Webhooks per second sent to one destination host, 0 disables the limit")
+    WEBHOOK_RATE_LIMIT_BURST: int = Field(default=50, ge=1, description="Webhooks a host may receive at once before the rate limit spaces them out")
+    WEBHOOK_HOST_RATE_LIMITS: dict[str, float] = Field(default={}, description="Per host overrides of WEBHOOK_RATE_LIMIT_PER_HOST, keyed by host[:port]")
+    WEBHOOK_THROTTLE_MAX_DELAY_SECONDS: float = Field(default=30.0, ge=0, description="Longest a throttled webhook waits in the worker, later ones go back to the scheduler; keep it below SCHEDULER_LEASE_SECONDS")
+    WEBHOOK_THROTTLE_REDIS_URL: str = Field(default="", description="Redis shared by the worker processes for host rate limits and concurrency caps, empty keeps them per process")
+    SCHEDULER_METRICS_PORT: int = Field(default=9101, description="Port of the dispatcher Prometheus exporter")
+    WORKER_METRICS_PORT: int = Field(default=9100, description="Port of the Celery worker Prometheus exporter")
+    WORKER_QUEUE_DEPTH_POLL_SECONDS: float = Field(default=15.0, gt=0, description="How often the worker exporter samples queue depth")
+
+    LOG_LEVEL: str = Field(default="INFO", description="Level of the root and framework loggers")
+    LOG_FILE: str = Field(default="logs/project.log", description="JSON log file written by the log listener thread, empty to disable")
+    LOG_SAMPLE_RATE: float = Field(default=0.01, ge=0, le=1, description="Fraction of per request, task and webhook INFO records that are kept")
+
     class Config:
         env_file = ".env" 
         
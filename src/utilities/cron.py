@@ -0,0 +1,125 @@
+"""Minimal five field cron expressions evaluated in UTC."""
+
+from datetime import datetime, timedelta, timezone
+from typing import FrozenSet, List, Tuple
+
+# (first, last) value of minute, hour, day of month, month and day of week (0 and 7 are Sunday)
+_FIELDS: List[Tuple[int, int]] = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+_NAMES = [
+    {},
+    {},
+    {},
+    {name: number for number, name in enumerate(
+        ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)},
+    {name: number for number, name in enumerate(("sun", "mon", "tue", "wed", "thu", "fri", "sat"))},
+]
+_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+# An expression that matches nothing within this many years (e.g. `0 0 30 2 *`) is rejected
+_SEARCH_YEARS = 5
+
+
+class CronError(ValueError):
+    """Raised for a malformed cron expression or one that never matches."""
+
+
+def _value(token: str, index: int) -> int:
+    token = token.lower()
+    if token in _NAMES[index]:
+        return _NAMES[index][token]
+    if not token.isdigit():
+        raise CronError(f"Invalid cron value {token!r}")
+    return int(token)
+
+
+def _parse_field(field: str, index: int) -> FrozenSet[int]:
+    first, last = _FIELDS[index]
+    values = set()
+    for part in field.split(","):
+        expression, _, step_token = part.partition("/")
+        step = int(step_token) if step_token.isdigit() else None
+        if step_token and not step:
+            raise CronError(f"Invalid cron step in {part!r}")
+        if expression == "*":
+            start, end = first, last
+        elif "-" in expression:
+            start_token, end_token = expression.split("-", 1)
+            start, end = _value(start_token, index), _value(end_token, index)
+        else:
+            start = _value(expression, index)
+            end = last if step else start
+        if not first <= start <= end <= last:
+            raise CronError(f"Cron field {part!r} is out of range {first}-{last}")
+        values.update(range(start, end + 1, step or 1))
+    if index == 4 and 7 in values:
+        values = (values - {7}) | {0}
+    return frozenset(values)
+
+
+class CronExpression:
+    """
+    A parsed `minute hour day-of-month month day-of-week` expression, or one of the `@daily` style aliases.
+
+    Fields take `*`, values, `a-b` ranges, `,` lists and `/n` steps; months and weekdays also take
+    three letter names. As in Vixie cron, when both day of month and day of week are restricted a day
+    matching either one matches.
+    """
+
+    def __init__(self, expression: str) -> None:
+        """
+        :param expression: the cron expression
+        :raises CronError: if it is malformed
+        """
+        self.expression = expression
+        fields = _ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise CronError(f"A cron expression has 5 fields, got {len(fields)}")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            _parse_field(field, index) for index, field in enumerate(fields)
+        )
+        # Vixie cron counts a field starting with `*`, steps like `*/2` included, as unrestricted
+        self._any_day = fields[2].startswith("*")
+        self._any_weekday = fields[4].startswith("*")
+        self.next_after(datetime(2000, 1, 1, tzinfo=timezone.utc))
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.isoweekday() % 7) in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        The first matching minute strictly after `moment`.
+
+        Skips whole months, days and hours that cannot match instead of testing every minute.
+
+        :param moment: naive datetimes are taken as UTC
+        :return: an aware UTC datetime
+        :raises CronError: if nothing matches within the next few years
+        """
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        candidate = moment.astimezone(timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate.year + _SEARCH_YEARS
+        while candidate.year <= limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise CronError(f"Cron expression {self.expression!r} never matches")
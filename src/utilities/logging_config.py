@@ -1,6 +1,23 @@
-import os
+import atexit
 import logging
+import os
+import queue
+import random
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import orjson
+
+from src.settings import settings
+
+# Loggers that emit an INFO record per request, task or webhook; their INFO records are sampled
+SAMPLED_LOGGERS = ("uvicorn.access", "celery.app.trace", "src.celery_workers.delivery")
+
+# Attributes every LogRecord has; anything else was passed through `extra` and is added to the JSON line
+_RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[QueueListener] = None
 
 
 class CustomFilter(logging.Filter):
@@ -11,61 +28,119 @@ class CustomFilter(logging.Filter):
         return True
 
 
+class SamplingFilter(logging.Filter):
+    """Keep a random `rate` fraction of the INFO and DEBUG records of the high volume loggers."""
+
+    def __init__(self, rate: float = 1.0, loggers: tuple = SAMPLED_LOGGERS) -> None:
+        super().__init__()
+        self.rate = rate
+        self.loggers = loggers
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not record.name.startswith(self.loggers):
+            return True
+        return self.rate >= 1.0 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """Render a record as a single JSON line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that hands the record over as is; the listener thread does all of the formatting."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _start_listener(log_queue: queue.SimpleQueue, handlers: tuple) -> None:
+    global _listener
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_listener_after_fork() -> None:
+    # The listener thread does not survive a fork (Celery prefork children, uvicorn workers),
+    # so the child gets a fresh queue and thread of its own
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue = log_queue
+    _start_listener(log_queue, _listener.handlers)
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
 def setup_logging():
     """
     Sets up logging for the entire project using a dictionary configuration.
-    This can be easily extended with different handlers and formatters.
+
+    Loggers only put records on an in-memory queue; a background `QueueListener` thread formats them as JSON
+    and writes them to the console and the log file, so a request or task never blocks on log I/O.
+    Calling it again in the same process is a no-op.
     """
-        
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
     logging_config = {
         'version': 1,
         'disable_existing_loggers': False,
-        'formatters': {
-            'default': {
-                'format': '[%(asctime)s] %(levelname)s in %(module)s: %(message)s',
+        'filters': {
+            'custom_filter': {
+                '()': CustomFilter
             },
-            'detailed': {
-                'format': '[%(asctime)s] %(levelname)s in %(module)s (func: %(funcName)s): %(message)s',
+            'sampling_filter': {
+                '()': SamplingFilter,
+                'rate': settings.LOG_SAMPLE_RATE,
             },
         },
         'handlers': {
-            'console': {
-                'class': 'logging.StreamHandler',
-                'formatter': 'default',
-                'filters': ['custom_filter']
-            },
-            'file': {
-                'class': 'logging.FileHandler',
-                'filename': 'logs/project.log',
-                'formatter': 'detailed',
-                'level': 'DEBUG',
-                'filters': ['custom_filter']
+            'queue': {
+                '()': DeferredQueueHandler,
+                'queue': log_queue,
+                'filters': ['custom_filter', 'sampling_filter'],
             },
         },
-        'filters': {
-            'custom_filter': {
-                '()': CustomFilter
-            }, 
-        },
         'root': {
-            'level': 'INFO',
-            'handlers': ['console', 'file']
-        },
-        'celery': {
-            'level': 'INFO',
-            'handlers': ['console', 'file'],
-            'propagate': False
+            'level': settings.LOG_LEVEL,
+            'handlers': ['queue']
         },
-        'uvicorn.error': {
-            'level': 'INFO',
-            'handlers': ['console', 'file'],
-            'propagate': False,
-        },
-        'uvicorn.access': {
-            'level': 'INFO',
-            'handlers': ['console', 'file'],
-            'propagate': False,
+        'loggers': {
+            logger_name: {'level': settings.LOG_LEVEL, 'handlers': ['queue'], 'propagate': False}
+            for logger_name in ('celery', 'uvicorn', 'uvicorn.error', 'uvicorn.access')
         },
     }
-
     dictConfig(logging_config)
+
+    formatter = JsonFormatter()
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    handlers = [console]
+    if settings.LOG_FILE:
+        os.makedirs(os.path.dirname(settings.LOG_FILE) or ".", exist_ok=True)
+        file_handler = logging.FileHandler(settings.LOG_FILE)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    _start_listener(log_queue, tuple(handlers))
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
+    atexit.register(_stop_listener)
@@ -0,0 +1,198 @@
+"""
+Prometheus metrics shared by the API, scheduler and worker processes.
+
+When `PROMETHEUS_MULTIPROC_DIR` is set (prefork workers, several uvicorn workers) every process writes its
+samples there and the exporters aggregate them; otherwise each process serves its own registry.
+"""
+
+import os
+import time
+from typing import Any, Callable, Dict
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, multiprocess
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+TIMER_CACHE_REQUESTS = Counter(
+    "timer_cache_requests_total",
+    "Timer eta cache lookups by tier and outcome.",
+    ["tier", "result"],
+)
+
+TIMER_IDEMPOTENT_REPLAYS = Counter(
+    "timer_idempotent_replays_total",
+    "Timer creations answered with the timer an earlier request with the same idempotency key created.",
+    ["source"],
+)
+
+TIMER_CACHE_LOOKUP_SECONDS = Histogram(
+    "timer_cache_lookup_seconds",
+    "Latency of resolving a timer eta by the source that answered it.",
+    ["source"],
+    buckets=(0.00005, 0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds",
+    "API request latency by route template, method and status code.",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+MONGO_COMMAND_SECONDS = Histogram(
+    "mongo_command_seconds",
+    "Mongo command latency by command and collection.",
+    ["command", "collection", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+TIMER_JOURNAL_SYNC_SECONDS = Histogram(
+    "timer_journal_sync_seconds",
+    "Latency of one group msync of the write-behind timer journal.",
+    buckets=LATENCY_BUCKETS,
+)
+
+TIMER_JOURNAL_BACKLOG = Gauge(
+    "timer_journal_backlog",
+    "Timers acknowledged from the write-behind journal but not yet inserted into Mongo.",
+    multiprocess_mode="livesum",
+)
+
+TIMERS_CLAIMED = Counter(
+    "scheduler_timers_claimed_total",
+    "Timers claimed for dispatch, by the path that claimed them.",
+    ["source"],
+)
+
+TIMERS_ARCHIVED = Counter(
+    "scheduler_timers_archived_total",
+    "Fired and cancelled timers moved from the timer collection to the archive.",
+)
+
+TIMERS_PUBLISHED = Counter(
+    "scheduler_timers_published_total",
+    "Due timers published to the webhook queue.",
+)
+
+WHEEL_ARMED = Gauge(
+    "scheduler_wheel_armed_timers",
+    "Timers waiting on the dispatcher timing wheel.",
+    multiprocess_mode="livesum",
+)
+
+FIRING_LATENESS_SECONDS = Histogram(
+    "webhook_firing_lateness_seconds",
+    "Time between a timer's eta and the moment its webhook is sent.",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+WEBHOOK_SECONDS = Histogram(
+    "webhook_request_seconds",
+    "Webhook POST duration by destination host and response status.",
+    ["host", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+WEBHOOK_IN_FLIGHT = Gauge(
+    "webhook_in_flight",
+    "Webhook deliveries submitted and not finished yet.",
+    multiprocess_mode="livesum",
+)
+
+WEBHOOK_THROTTLED_SECONDS = Histogram(
+    "webhook_throttled_seconds",
+    "Time a webhook waited on its host's rate limit or concurrency cap before being sent.",
+    ["host", "limit"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+WEBHOOK_DEFERRED = Counter(
+    "webhook_deferred_total",
+    "Webhooks handed back to the scheduler because their host's rate limit was too far behind.",
+    ["host"],
+)
+
+WEBHOOK_RETRIES = Counter(
+    "webhook_retries_total",
+    "Failed webhooks sent back to the scheduler for another attempt.",
+    ["host"],
+)
+
+WEBHOOK_DEAD_LETTERED = Counter(
+    "webhook_dead_lettered_total",
+    "Timers whose webhook failed for good and were dead-lettered.",
+    ["host"],
+)
+
+WEBHOOK_QUEUE_DEPTH = Gauge(
+    "webhook_queue_depth",
+    "Messages ready in a broker queue.",
+    ["queue"],
+    multiprocess_mode="livemax",
+)
+
+
+def metrics_registry() -> CollectorRegistry:
+    """Registry to export: the multiprocess aggregate when enabled, the process registry otherwise."""
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every command a Mongo client sends, registered on the client through `event_listeners`."""
+
+    def __init__(self) -> None:
+        self._pending: Dict[tuple, tuple] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        self._pending[(event.connection_id, event.request_id)] = (
+            time.perf_counter(), collection if isinstance(collection, str) else ""
+        )
+
+    def _finish(self, event: Any, outcome: str) -> None:
+        started, collection = self._pending.pop((event.connection_id, event.request_id), (None, ""))
+        if started is not None:
+            MONGO_COMMAND_SECONDS.labels(
+                command=event.command_name, collection=collection, outcome=outcome
+            ).observe(time.perf_counter() - started)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, "failure")
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording `HTTP_REQUEST_SECONDS` for every request, labelled by route template."""
+
+    def __init__(self, app: Callable) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None)
+            if route is not None:
+                HTTP_REQUEST_SECONDS.labels(route=route, method=scope["method"], status=str(status)).observe(
+                    time.perf_counter() - started
+                )
@@ -2,19 +2,45 @@
 
 from __future__ import annotations
 
+import os
+from functools import partial
 from typing import Any, Generic, TypeVar, Optional
 
 SingletonMetaType = TypeVar("SingletonMetaType", bound="SingletonMeta")
 
 
 class SingletonMeta(type, Generic[SingletonMetaType]):
+    """
+    One instance per class and per process.
+
+    A forked child does not inherit the parent's instance, which would share its sockets and background
+    threads: the instance is dropped in the child and re-created on first use. An instance that must keep its
+    identity across the fork defines `after_fork()` instead, called in the child to drop what it inherited.
+    """
+
     _instance: Optional[SingletonMetaType] = None
 
+    def __init__(cls, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        if hasattr(os, "register_at_fork"):
+            # Bound explicitly, a class attribute of the same name would shadow a metaclass method
+            os.register_at_fork(after_in_child=partial(SingletonMeta._forget_in_child, cls))
+
     def __call__(cls: SingletonMetaType, *args: Any, **kwargs: Any) -> SingletonMetaType:
         if cls._instance is None:
             cls._instance = super(SingletonMeta, cls).__call__(*args, **kwargs)
         return cls._instance
 
+    def _forget_in_child(cls) -> None:
+        # Subclasses share the metaclass hook, only act on the class owning the instance
+        instance = cls.__dict__.get("_instance")
+        if instance is None:
+            return
+        if hasattr(instance, "after_fork"):
+            instance.after_fork()
+        else:
+            cls._instance = None
+
 
 class Singleton(metaclass=SingletonMeta):
     """
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from src.celery_workers.persistence import TimerResultWriter
+from src.settings import settings
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.bulk_update_timer_requests', new_callable=AsyncMock)
+async def test_flushes_when_batch_is_full(mock_bulk_update: AsyncMock):
+    writer = TimerResultWriter(batch_size=3, flush_seconds=60)
+
+    await writer.add("a", {"$set": {"success": True}})
+    await writer.add("b", {"$set": {"success": True}})
+    assert not mock_bulk_update.called
+
+    await writer.add("c", {"$set": {"success": False}})
+    mock_bulk_update.assert_awaited_once()
+    assert [timer_id for timer_id, _ in mock_bulk_update.await_args.args[0]] == ["a", "b", "c"]
+    assert len(writer) == 0
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.bulk_update_timer_requests', new_callable=AsyncMock)
+async def test_flushes_after_interval(mock_bulk_update: AsyncMock):
+    writer = TimerResultWriter(batch_size=100, flush_seconds=0.01)
+
+    await writer.add("a", {"$set": {"success": True}})
+    await asyncio.sleep(0.05)
+
+    mock_bulk_update.assert_awaited_once()
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.bulk_update_timer_requests', new_callable=AsyncMock)
+async def test_failed_flush_keeps_results(mock_bulk_update: AsyncMock):
+    writer = TimerResultWriter(batch_size=100, flush_seconds=60)
+    mock_bulk_update.side_effect = [RuntimeError("mongo down"), None]
+
+    await writer.add("a", {"$set": {"success": True}})
+    assert await writer.flush() == 0
+    assert len(writer) == 1
+
+    assert await writer.flush() == 1
+    assert len(writer) == 0
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.renew_leases', new_callable=AsyncMock)
+@patch('src.database.timer.timer.bulk_update_timer_requests', new_callable=AsyncMock)
+async def test_leases_are_renewed_until_the_result_is_written(mock_bulk_update: AsyncMock, mock_renew: AsyncMock):
+    writer = TimerResultWriter(batch_size=100, flush_seconds=60)
+
+    with patch.object(settings, "WEBHOOK_LEASE_SECONDS", 0.03):
+        writer.hold([("a", "claim-a"), ("b", "claim-b")])
+        await asyncio.sleep(0.05)
+        assert sorted(mock_renew.await_args.args[0]) == [("a", "claim-a"), ("b", "claim-b")]
+
+        await writer.add("a", {"$set": {"success": True}})
+        await writer.flush()
+        assert mock_bulk_update.await_args.kwargs["claims"] == {"a": "claim-a"}
+
+        writer.release(["b"])
+        await asyncio.sleep(0.05)
+        assert writer._renewal is None
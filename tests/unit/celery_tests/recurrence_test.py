@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch, AsyncMock
+
+import httpx
+import pytest
+
+from src.models.timer_db import Recurrence, TimerDB, TimerStatus
+
+
+def recurring(eta: datetime, **recurrence) -> TimerDB:
+    return TimerDB(eta=eta, url="http://example.com/webhook", recurrence=Recurrence(**recurrence))
+
+
+def test_interval_skips_missed_occurrences():
+    previous = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+    recurrence = Recurrence(interval_seconds=60)
+
+    assert recurrence.next_after(previous, previous + timedelta(seconds=1)) == previous + timedelta(minutes=1)
+    assert recurrence.next_after(previous, previous + timedelta(minutes=10, seconds=30)) == previous + timedelta(minutes=11)
+
+
+def test_cron_next_occurrence_is_not_in_the_past():
+    previous = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+    recurrence = Recurrence(cron="0 * * * *")
+
+    assert recurrence.next_after(previous, previous) == datetime(2024, 1, 1, 13, 0, tzinfo=timezone.utc)
+    assert recurrence.next_after(previous, previous + timedelta(hours=5, minutes=1)) == datetime(
+        2024, 1, 1, 18, 0, tzinfo=timezone.utc
+    )
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.acquire_timer', new_callable=AsyncMock)
+async def test_recurring_timer_moves_to_its_next_occurrence(mock_acquire_timer, setup_mocks):
+    """Test that a fired occurrence is recorded and the same document is rescheduled."""
+    engine, handler, mock_update_timer = setup_mocks
+    handler.return_value = httpx.Response(200, text="ok")
+    eta = datetime.now(tz=timezone.utc)
+    mock_acquire_timer.return_value = recurring(eta, interval_seconds=300, occurrences=2)
+
+    await engine.fire('test_timer_id', 'http://example.com/webhook', 'claim')
+
+    update_dict = mock_update_timer.call_args.args[1]
+    assert update_dict["$set"]["status"] == TimerStatus.PENDING
+    assert update_dict["$set"]["eta"] == eta + timedelta(seconds=300)
+    assert update_dict["$set"]["attempts"] == 0
+    assert update_dict["$inc"] == {"recurrence.occurrences": 1}
+    assert "claim_id" in update_dict["$unset"]
+    occurrence = update_dict["$push"]["occurrence_history"]["$each"][0]
+    assert occurrence["eta"] == eta and occurrence["success"] and occurrence["status_code"] == 200
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.acquire_timer', new_callable=AsyncMock)
+async def test_recurring_timer_stops_after_max_occurrences(mock_acquire_timer, setup_mocks):
+    engine, handler, mock_update_timer = setup_mocks
+    handler.return_value = httpx.Response(200, text="ok")
+    mock_acquire_timer.return_value = recurring(
+        datetime.now(tz=timezone.utc), cron="*/5 * * * *", max_occurrences=3, occurrences=2
+    )
+
+    await engine.fire('test_timer_id', 'http://example.com/webhook', 'claim')
+
+    update_dict = mock_update_timer.call_args.args[1]
+    assert update_dict["$set"]["status"] == TimerStatus.FIRED
+    assert "eta" not in update_dict["$set"]
+    assert update_dict["$inc"] == {"recurrence.occurrences": 1}
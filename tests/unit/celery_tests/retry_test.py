@@ -0,0 +1,75 @@
+from datetime import datetime, timezone
+from unittest.mock import patch, AsyncMock
+
+import httpx
+import pytest
+
+from src.celery_workers.retry import RetryPolicy, parse_retry_after
+from src.models.timer_db import TimerDB, TimerStatus
+
+
+def test_backoff_doubles_with_jitter_up_to_the_cap():
+    policy = RetryPolicy(max_attempts=5, base_seconds=2, max_seconds=10, status_codes=[503])
+
+    assert 1 <= policy.backoff(1) <= 2
+    assert 4 <= policy.backoff(3) <= 8
+    assert 5 <= policy.backoff(10) <= 10
+    assert policy.backoff(1, retry_after=7) == 7
+    assert policy.backoff(1, retry_after=60) == 10
+
+
+def test_is_retryable():
+    policy = RetryPolicy(status_codes=[429, 503])
+
+    assert policy.is_retryable(503)
+    assert policy.is_retryable(None)
+    assert not policy.is_retryable(404)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def acquired(attempts: int) -> TimerDB:
+    return TimerDB(eta=datetime.now(tz=timezone.utc), url="http://example.com/webhook", attempts=attempts)
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.acquire_timer', new_callable=AsyncMock)
+async def test_retryable_failure_goes_back_to_the_scheduler(mock_acquire_timer, setup_mocks):
+    """Test that a retryable failure with attempts left is rescheduled instead of recorded as final."""
+    engine, handler, mock_update_timer = setup_mocks
+    handler.return_value = httpx.Response(503, text="Unavailable", headers={"Retry-After": "30"})
+    mock_acquire_timer.return_value = acquired(attempts=0)
+
+    with patch('src.database.dead_letter.dead_letter.add', new_callable=AsyncMock) as mock_dead_letter:
+        await engine.fire('test_timer_id', 'http://example.com/webhook', 'claim')
+
+    update_dict = mock_update_timer.call_args.args[1]
+    assert update_dict["$set"]["status"] == TimerStatus.PENDING
+    assert update_dict["$set"]["due_bucket"] >= int(datetime.now(tz=timezone.utc).timestamp()) + 29
+    assert "claim_id" in update_dict["$unset"]
+    assert update_dict["$push"]["attempt_history"]["$each"][0]["status_code"] == 503
+    assert not mock_dead_letter.called
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("status_code, attempts", [(503, 4), (404, 0)])
+@patch('src.database.timer.timer.acquire_timer', new_callable=AsyncMock)
+async def test_final_failure_is_dead_lettered(mock_acquire_timer, status_code, attempts, setup_mocks):
+    """Test that exhausted and non retryable failures are final and dead-lettered."""
+    engine, handler, mock_update_timer = setup_mocks
+    engine.retry_policy = RetryPolicy(max_attempts=5, status_codes=[503])
+    handler.return_value = httpx.Response(status_code, text="Error")
+    mock_acquire_timer.return_value = acquired(attempts=attempts)
+
+    with patch('src.database.dead_letter.dead_letter.add', new_callable=AsyncMock) as mock_dead_letter:
+        await engine.fire('test_timer_id', 'http://example.com/webhook', 'claim')
+
+    assert mock_update_timer.call_args.args[1]["$set"]["status"] == TimerStatus.FIRED
+    mock_dead_letter.assert_awaited_once_with(
+        'test_timer_id', 'http://example.com/webhook', attempts + 1, status_code=status_code, response="Error"
+    )
@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from src.celery_workers.delivery import WebhookDeliveryEngine
+from src.celery_workers.throttle import HostThrottle
+from src.settings import settings
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.anyio
+async def test_reserve_spaces_out_a_burst():
+    """Test that requests past the burst wait for evenly spaced slots."""
+    clock = FakeClock()
+    throttle = HostThrottle(rate=10, burst=2, host_rates={}, max_delay=1.0, redis_url="", clock=clock)
+
+    waits = [await throttle.reserve("example.com") for _ in range(4)]
+
+    assert waits == pytest.approx([0.0, 0.0, 0.1, 0.2])
+
+    clock.now += 0.3
+    assert await throttle.reserve("example.com") == pytest.approx(0.0)
+    assert await throttle.reserve("other.example.com") == 0.0
+
+
+@pytest.mark.anyio
+async def test_reserve_beyond_max_delay_reserves_nothing():
+    """Test that a slot further away than max_delay is reported but not taken."""
+    throttle = HostThrottle(rate=1, burst=1, host_rates={}, max_delay=1.5, redis_url="", clock=FakeClock())
+
+    assert [await throttle.reserve("example.com") for _ in range(3)] == pytest.approx([0.0, 1.0, 2.0])
+    assert await throttle.reserve("example.com") == pytest.approx(2.0)
+    assert await throttle.reserve("example.com", max_delay=float("inf")) == pytest.approx(2.0)
+    assert await throttle.reserve("example.com", max_delay=float("inf")) == pytest.approx(3.0)
+
+
+@pytest.mark.anyio
+async def test_host_rate_overrides():
+    """Test per host overrides, a rate of 0 disables the limit."""
+    throttle = HostThrottle(rate=1, burst=1, host_rates={"fast.example.com": 0}, redis_url="", clock=FakeClock())
+
+    assert [await throttle.reserve("fast.example.com") for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+@pytest.mark.anyio
+@patch('src.celery_workers.persistence.result_writer.hold')
+@patch('src.database.timer.timer.acquire_timer', new_callable=AsyncMock)
+@patch('src.database.timer.timer.defer_timer', new_callable=AsyncMock)
+async def test_throttled_timer_is_deferred(mock_defer_timer, mock_acquire_timer, mock_hold):
+    """Test that a claimed timer too far behind its host's rate limit goes back to the scheduler."""
+    handler = MagicMock()
+    throttle = HostThrottle(rate=1, burst=1, host_rates={}, max_delay=0.5, redis_url="", clock=FakeClock())
+    engine = WebhookDeliveryEngine(transport=httpx.MockTransport(handler), throttle=throttle)
+    mock_defer_timer.return_value = True
+    await throttle.reserve("example.com")
+
+    await engine.fire('test_timer_id', 'http://example.com/webhook', 'claim')
+
+    mock_defer_timer.assert_awaited_once()
+    assert mock_defer_timer.call_args.args[:2] == ('test_timer_id', 'claim')
+    assert not handler.called
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.acquire_timer', new_callable=AsyncMock, return_value=None)
+async def test_stale_dispatches_take_no_send_slot(mock_acquire_timer):
+    """Test that a message whose claim no longer holds its timer leaves the host's budget alone."""
+    clock = FakeClock()
+    throttle = HostThrottle(rate=1, burst=1, host_rates={}, max_delay=0.5, redis_url="", clock=clock)
+    engine = WebhookDeliveryEngine(transport=httpx.MockTransport(MagicMock()), throttle=throttle)
+
+    await engine.fire('test_timer_id', 'http://example.com/webhook', 'stale_claim')
+
+    assert await throttle.reserve("example.com") == 0.0
+
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeAsyncRedis()
+
+
+@pytest.mark.anyio
+async def test_shared_rate_limit_script(redis_client):
+    """Test that processes sharing a Redis space out a burst together and only reserve within max delay."""
+    clock = FakeClock()
+    throttles = [
+        HostThrottle(rate=10, burst=2, host_rates={}, max_delay=0.25, clock=clock, client=redis_client)
+        for _ in range(2)
+    ]
+
+    waits = [await throttles[index % 2].reserve("example.com") for index in range(4)]
+    assert waits == pytest.approx([0.0, 0.0, 0.1, 0.2])
+    assert await throttles[0].reserve("example.com") == pytest.approx(0.3)
+    # The slot beyond max delay was not taken
+    assert await throttles[1].reserve("example.com", max_delay=float("inf")) == pytest.approx(0.3)
+
+    clock.now += 1
+    assert await throttles[1].reserve("example.com") == 0.0
+    assert await throttles[0].reserve("other.example.com") == 0.0
+
+
+@pytest.mark.anyio
+async def test_shared_concurrency_slot_script(redis_client):
+    """Test the shared cap on concurrent sends, and that slots of a dead holder expire."""
+    clock = FakeClock()
+    # The slot set expires in Redis time
+    clock.now = time.time()
+    throttle = HostThrottle(concurrency=2, host_rates={}, clock=clock, client=redis_client)
+
+    async with throttle.slot("example.com"), throttle.slot("example.com"):
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(throttle.slot("example.com").__aenter__(), timeout=0.1)
+    async with throttle.slot("example.com"):
+        assert await redis_client.zcard("webhook:slots:example.com") == 1
+
+    # A holder that died never releases its slots, they free themselves once expired
+    for _ in range(2):
+        await throttle.slot("example.com").__aenter__()
+    clock.now += settings.WEBHOOK_TIMEOUT_SECONDS + 10
+    async with throttle.slot("example.com"):
+        assert await redis_client.zcard("webhook:slots:example.com") == 1
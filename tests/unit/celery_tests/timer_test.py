@@ -1,46 +1,154 @@
-import requests
-from unittest.mock import MagicMock
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timezone
 
+import httpx
+import pytest
+from bson import ObjectId
+from unittest.mock import patch, AsyncMock, ANY
+
+from src.celery_workers.delivery import WebhookDeliveryEngine, WebhookResult
 from src.celery_workers.timer import fire_webhook
+from src.models.timer_db import TimerDB, TimerStatus
+from src.settings import settings
+
+
+def assert_posted(handler, url: str, timer_id: str) -> None:
+    handler.assert_called_once()
+    request = handler.call_args.args[0]
+    assert request.method == "POST"
+    assert str(request.url) == url
+    assert request.content == f"id={timer_id}".encode()
+
 
+def expected_update(fields: dict) -> dict:
+    return {
+        "$set": {**fields, "status": TimerStatus.FIRED},
+        "$unset": {"lease_expires_at": "", "response_length": "", "response_sha256": ""},
+        "$inc": {"attempts": 1},
+        "$push": {"attempt_history": {"$each": [ANY], "$slice": ANY}},
+    }
 
-def test_fire_webhook_success(setup_mocks):
+
+@pytest.mark.anyio
+async def test_fire_webhook_success(setup_mocks):
     """Test with `fire_webhook` successful request."""
-    mock_post, mock_update_timer = setup_mocks
+    engine, handler, mock_update_timer = setup_mocks
 
-    mock_post.return_value = MagicMock(status_code=200, text="Success")
+    handler.return_value = httpx.Response(200, text="Success")
 
-    fire_webhook('test_timer_id', 'http://example.com/webhook')
+    await engine.fire('test_timer_id', 'http://example.com/webhook')
 
-    mock_post.assert_called_once_with('http://example.com/webhook', data={"id": 'test_timer_id'}, timeout=10.0)
+    assert_posted(handler, 'http://example.com/webhook', 'test_timer_id')
 
-    expected_update_dict = {"$set": {"status_code": 200, "success": True, "response": "Success"}}
-    mock_update_timer.assert_called_once_with(timer_id='test_timer_id', update_obj=expected_update_dict)
+    expected_update_dict = expected_update({"status_code": 200, "success": True, "response": "Success"})
+    mock_update_timer.assert_called_once_with('test_timer_id', expected_update_dict)
 
 
-def test_fire_webhook_failure(setup_mocks):
+@pytest.mark.anyio
+async def test_fire_webhook_failure(setup_mocks):
     """Test with `fire_webhook` on a failed request."""
-    mock_post, mock_update_timer = setup_mocks
+    engine, handler, mock_update_timer = setup_mocks
 
-    mock_post.return_value = MagicMock(status_code=500, text="Error")
+    handler.return_value = httpx.Response(500, text="Error")
 
-    fire_webhook('test_timer_id', 'http://example.com/webhook')
+    await engine.fire('test_timer_id', 'http://example.com/webhook')
 
-    mock_post.assert_called_once_with('http://example.com/webhook', data={"id": 'test_timer_id'}, timeout=10.0)
+    assert_posted(handler, 'http://example.com/webhook', 'test_timer_id')
     
-    expected_update_dict = {"$set": {"status_code": 500, "success": False, "response": "Error"}}
-    mock_update_timer.assert_called_once_with(timer_id='test_timer_id', update_obj=expected_update_dict)
+    expected_update_dict = expected_update({"status_code": 500, "success": False, "response": "Error"})
+    mock_update_timer.assert_called_once_with('test_timer_id', expected_update_dict)
 
 
-def test_fire_webhook_exception(setup_mocks):
+@pytest.mark.anyio
+async def test_fire_webhook_exception(setup_mocks):
     """Test that `fire_webhook` handles exceptions gracefully."""
-    mock_post, mock_update_timer = setup_mocks
+    engine, handler, mock_update_timer = setup_mocks
 
-    mock_post.side_effect = requests.RequestException("Network error")
+    handler.side_effect = httpx.ConnectError("Network error")
 
+    await engine.fire('test_timer_id', 'http://example.com/webhook')
+
+    expected_update_dict = expected_update({"success": False, "response": "Network error"})
+    mock_update_timer.assert_called_once_with('test_timer_id', expected_update_dict)
+
+
+@patch('src.celery_workers.timer.delivery_engine.submit')
+def test_fire_webhook_submits_to_engine(mock_submit):
+    """Test that the task hands the delivery to the engine without waiting for it."""
     fire_webhook('test_timer_id', 'http://example.com/webhook')
 
-    mock_post.assert_called_once_with('http://example.com/webhook', data={"id": 'test_timer_id'}, timeout=10.0)
+    mock_submit.assert_called_once_with('test_timer_id', 'http://example.com/webhook', None)
+
+
+@pytest.mark.anyio
+async def test_least_recently_used_host_pools_are_closed():
+    engine = WebhookDeliveryEngine(transport=httpx.MockTransport(lambda request: httpx.Response(200)), max_hosts=2)
+    await engine.deliver("1", "http://a.example.com/webhook")
+    first = engine._hosts["a.example.com"].client
+    await engine.deliver("2", "http://b.example.com/webhook")
+    await engine.deliver("3", "http://a.example.com/webhook")
+    await engine.deliver("4", "http://c.example.com/webhook")
+    await asyncio.gather(*engine._closing)
+
+    assert list(engine._hosts) == ["a.example.com", "c.example.com"]
+    assert not first.is_closed
+    await engine.aclose()
+    assert first.is_closed
+
+
+@patch('src.celery_workers.delivery.run_coroutine', side_effect=RuntimeError("worker loop is gone"))
+def test_submit_gives_the_slot_back_when_scheduling_fails(mock_run_coroutine):
+    engine = WebhookDeliveryEngine(max_in_flight=1)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            engine.submit("test_timer_id", "http://example.com/webhook")
+    assert engine._in_flight.acquire(blocking=False)
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.acquire_timer', new_callable=AsyncMock)
+async def test_fire_webhook_stale_claim_is_skipped(mock_acquire_timer, setup_mocks):
+    """Test that a timer re-dispatched under another claim is not fired by the old message."""
+    engine, handler, mock_update_timer = setup_mocks
+
+    mock_acquire_timer.return_value = None
+
+    await engine.fire('test_timer_id', 'http://example.com/webhook', 'old_claim')
+
+    mock_acquire_timer.assert_awaited_once_with('test_timer_id', 'old_claim')
+    assert not handler.called
+    assert not mock_update_timer.called
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.acquire_timers', new_callable=AsyncMock)
+async def test_fire_webhook_batch(mock_acquire_timers, setup_mocks):
+    """Test that coalesced timers share one POST and each get the outcome recorded."""
+    engine, handler, mock_update_timer = setup_mocks
+    handler.return_value = httpx.Response(200, text="Success")
+    acquired = [
+        TimerDB(_id=str(ObjectId()), eta=datetime.now(tz=timezone.utc), url='http://example.com/webhook')
+        for _ in range(2)
+    ]
+    mock_acquire_timers.return_value = acquired
+    claimed = [(timer_db.id, 'claim') for timer_db in acquired] + [(str(ObjectId()), 'stale_claim')]
+
+    await engine.fire_batch('http://example.com/webhook', claimed)
+
+    mock_acquire_timers.assert_awaited_once_with(claimed)
+    handler.assert_called_once()
+    assert json.loads(handler.call_args.args[0].content) == {"ids": [timer_db.id for timer_db in acquired]}
+    assert [call.args[0] for call in mock_update_timer.call_args_list] == [timer_db.id for timer_db in acquired]
+    assert all(call.args[1]["$set"]["success"] for call in mock_update_timer.call_args_list)
+
+
+def test_long_responses_are_cut_and_hashed():
+    body = "x" * (settings.TIMER_RESPONSE_MAX_CHARS + 10)
+
+    update_dict = WebhookDeliveryEngine.outcome_update(WebhookResult(500, body))
 
-    expected_update_dict = {"$set": {"success": False, "response": "Network error"}}
-    mock_update_timer.assert_called_once_with(timer_id='test_timer_id', update_obj=expected_update_dict)
+    assert update_dict["$set"]["response"] == body[:settings.TIMER_RESPONSE_MAX_CHARS]
+    assert update_dict["$set"]["response_length"] == len(body)
+    assert update_dict["$set"]["response_sha256"] == hashlib.sha256(body.encode()).hexdigest()
@@ -1,9 +1,26 @@
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock, MagicMock
+import httpx
 import pytest
 
+from src.celery_workers.delivery import WebhookDeliveryEngine
+
+
 @pytest.fixture
 def setup_mocks():
-    """Fixture to setup mocks for `requests.post` and `timer.update_timer_request`."""
-    with patch('src.celery_workers.timer.requests.post') as mock_post, \
-         patch('src.database.timer.timer.update_timer_request') as mock_update_timer:
-        yield mock_post, mock_update_timer
\ No newline at end of file
+    """Fixture to setup a delivery engine on a mocked HTTP transport and mock the result writer and dead letters."""
+    handler = MagicMock()
+    engine = WebhookDeliveryEngine(transport=httpx.MockTransport(handler))
+    with patch('src.celery_workers.persistence.result_writer.add', new_callable=AsyncMock) as mock_update_timer, \
+            patch('src.celery_workers.persistence.result_writer.hold'), \
+            patch('src.database.dead_letter.dead_letter.add', new_callable=AsyncMock):
+        yield engine, handler, mock_update_timer
+
+
+@pytest.fixture
+def mongo():
+    """Point the database singleton at an in-memory mongomock-motor database, for tests of the queries themselves."""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient()["timer_test"]
+    with patch('src.database.base.Database') as mock_database:
+        mock_database.return_value.db = db
+        yield db
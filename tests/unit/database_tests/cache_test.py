@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+from datetime import datetime, timezone
+from bson import ObjectId
+from unittest.mock import patch, AsyncMock, PropertyMock, MagicMock
+
+from src.database.cache import TimerEtaCache
+from src.database.timer import Timer
+
+
+@pytest.mark.anyio
+async def test_local_tier_roundtrip_and_invalidate():
+    cache = TimerEtaCache(maxsize=2, ttl=60, redis_url="")
+    eta = datetime(2030, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+    assert await cache.get("a") is None
+    await cache.set("a", eta)
+    assert await cache.get("a") == eta.replace(tzinfo=None)
+
+    await cache.invalidate("a")
+    assert await cache.get("a") is None
+
+
+@pytest.mark.anyio
+async def test_get_timer_eta_reads_through():
+    timer_id = ObjectId()
+    eta = datetime(2030, 1, 1, 12, 0)
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value={"_id": timer_id, "eta": eta})
+    collection.find_one_and_update = AsyncMock(return_value=None)
+
+    with patch('src.database.timer.Timer._collection', new_callable=PropertyMock, return_value=collection):
+        timer = Timer()
+        assert await timer.get_timer_eta(timer_id) == eta
+        assert await timer.get_timer_eta(timer_id) == eta
+        collection.find_one.assert_awaited_once_with({"_id": timer_id}, projection={"eta": 1})
+
+        await timer.update_timer_request(timer_id=timer_id, update_obj={"$set": {"success": True}})
+        await timer.get_timer_eta(timer_id)
+        assert collection.find_one.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_fill_racing_an_invalidation_is_dropped():
+    cache = TimerEtaCache(maxsize=2, ttl=60, redis_url="")
+    generation = cache.generation
+    # Another request cancelled the timer while this one read the old eta from Mongo
+    await cache.invalidate("a")
+    await cache.set("a", datetime(2030, 1, 1), generation=generation)
+    assert await cache.get("a") is None
+
+    await cache.set("a", datetime(2030, 1, 1), generation=cache.generation)
+    assert await cache.get("a") == datetime(2030, 1, 1)
+
+
+@pytest.mark.anyio
+async def test_invalidations_reach_the_local_tier_of_other_processes():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    caches = [TimerEtaCache(ttl=60, redis_url="") for _ in range(2)]
+    for cache in caches:
+        cache._redis = fakeredis.FakeAsyncRedis(server=server)
+        await cache.start()
+    this, other = caches
+    eta = datetime(2030, 1, 1)
+    await this.set("a", eta)
+    assert await other.get("a") == eta
+
+    await this.invalidate("a")
+    for _ in range(100):
+        if "a" not in other._local:
+            break
+        await asyncio.sleep(0.01)
+    assert await other.get("a") is None
+    # The tombstone keeps a fill that read the old eta out of the shared tier, even in a process that missed
+    # the invalidation
+    late = TimerEtaCache(ttl=60, redis_url="")
+    late._redis = fakeredis.FakeAsyncRedis(server=server)
+    await late.set("a", eta, generation=late.generation)
+    assert await this._redis.get("timer:eta:a") == b""
+    await late.aclose()
+
+    for cache in caches:
+        await cache.aclose()
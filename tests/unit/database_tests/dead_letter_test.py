@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+from src.database.dead_letter import dead_letter
+from src.database.timer import timer
+from src.models.timer_db import TimerStatus
+
+
+async def insert_fired(db, **fields):
+    timer_id = ObjectId()
+    await db["timer"].insert_one({
+        "_id": timer_id,
+        "eta": datetime.now(tz=timezone.utc),
+        "url": "http://example.com",
+        "status": TimerStatus.FIRED,
+        "success": False,
+        "attempts": 5,
+        "updated": datetime.now(tz=timezone.utc),
+        **fields,
+    })
+    await dead_letter.add(str(timer_id), "http://example.com", attempts=5, status_code=500)
+    return timer_id
+
+
+@pytest.mark.anyio
+async def test_replay_requeues_fired_timers_and_keeps_the_dead_letters_of_the_others(mongo):
+    user_id = ObjectId()
+    failed = await insert_fired(mongo, user_id=user_id)
+    # A recurring timer that moved on to its next occurrence meanwhile, and one deleted since
+    moved_on = await insert_fired(mongo, status=TimerStatus.PENDING)
+    gone = await insert_fired(mongo)
+    await mongo["timer"].delete_one({"_id": gone})
+    # The failed occurrence of a recurring timer is over once it moved on, its dead letter goes
+    await insert_fired(mongo, status=TimerStatus.PENDING, recurrence={"interval_seconds": 60, "occurrences": 1})
+
+    assert await dead_letter.replay() == 1
+
+    requeued = await mongo["timer"].find_one({"_id": failed})
+    assert requeued["status"] == TimerStatus.PENDING
+    assert requeued["attempts"] == 0
+    assert "success" not in requeued
+    assert (await mongo["timer_counters"].find_one({"_id": user_id}))["pending"] == 1
+    assert sorted([doc["timer_id"] async for doc in mongo["timer_dead_letter"].find()]) == sorted([str(moved_on), str(gone)])
+    assert await timer.requeue_timers([failed, moved_on, gone]) == []
@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+from unittest.mock import AsyncMock
+
+from src.database.due_queue import RedisDueQueue
+from src.database.timer import Timer, shard_of
+from src.models.timer_db import TimerStatus
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+
+@pytest.fixture
+def due_queue():
+    return RedisDueQueue(client=fakeredis.FakeAsyncRedis())
+
+
+@pytest.mark.anyio
+async def test_claims_due_timers_oldest_first(due_queue):
+    early, late, later, future = (ObjectId() for _ in range(4))
+    await due_queue.add([(future, 0, 300), (later, 0, 120), (early, 0, 100), (late, 0, 110)])
+
+    assert await due_queue.claim(0, until_bucket=200, limit=2, lease_seconds=60) == [early, late]
+    assert await due_queue.claim(0, until_bucket=200, limit=10, lease_seconds=60) == [later]
+    assert await due_queue.claim(0, until_bucket=200, limit=10, lease_seconds=60) == []
+    assert await due_queue.claim(1, until_bucket=400, limit=10, lease_seconds=60) == []
+    assert await due_queue.size(0) == 1
+
+
+@pytest.mark.anyio
+async def test_unacknowledged_claims_come_back(due_queue):
+    acked, lost, rescheduled = ObjectId(), ObjectId(), ObjectId()
+    await due_queue.add([(acked, 3, 100), (lost, 3, 100), (rescheduled, 3, 100)])
+    assert len(await due_queue.claim(3, until_bucket=100, limit=10, lease_seconds=0)) == 3
+    await due_queue.ack(3, [acked])
+    # Moved to a later bucket while its claim was in flight
+    await due_queue.add([(rescheduled, 3, 10 ** 12)])
+
+    assert await due_queue.claim(3, until_bucket=10 ** 11, limit=10, lease_seconds=60) == [lost]
+    assert await due_queue.size(3) == 1
+
+
+@pytest.mark.anyio
+async def test_discarded_timers_are_not_claimed(due_queue):
+    cancelled, pending = ObjectId(), ObjectId()
+    await due_queue.add([(cancelled, 5, 100), (pending, 5, 100)])
+    await due_queue.discard([(cancelled, 5)])
+
+    assert await due_queue.claim(5, until_bucket=100, limit=10, lease_seconds=60) == [pending]
+
+
+@pytest.mark.anyio
+async def test_timer_writes_keep_the_due_queue_in_step(mongo):
+    retried, fired, lost = ObjectId(), ObjectId(), ObjectId()
+    timer = Timer()
+    timer.due_queue = AsyncMock()
+    await mongo["timer"].insert_many([
+        {"_id": timer_id, "status": TimerStatus.FIRING, "claim_id": "current"} for timer_id in (retried, fired, lost)
+    ])
+
+    await timer.bulk_update_timer_requests(
+        [
+            (retried, {"$set": {"status": TimerStatus.PENDING, "due_bucket": 42}}),
+            (fired, {"$set": {"status": TimerStatus.FIRED}}),
+            # The sweeper handed this one to another worker meanwhile
+            (lost, {"$set": {"status": TimerStatus.PENDING, "due_bucket": 42}}),
+        ],
+        claims={str(retried): "current", str(lost): "stale"},
+    )
+
+    assert list(timer.due_queue.add.await_args.args[0]) == [(retried, shard_of(retried), 42)]
+    assert (await mongo["timer"].find_one({"_id": lost}))["status"] == TimerStatus.FIRING
+
+
+@pytest.mark.anyio
+async def test_replay_leaves_timers_that_moved_on_at_their_due_bucket(mongo, due_queue):
+    timer = Timer()
+    timer.due_queue = due_queue
+    failed, moved_on = ObjectId(), ObjectId()
+    await mongo["timer"].insert_many([
+        {"_id": failed, "status": TimerStatus.FIRED, "success": False, "updated": datetime.now(tz=timezone.utc)},
+        # A recurring timer already pending under its next occurrence
+        {"_id": moved_on, "status": TimerStatus.PENDING, "due_bucket": 10 ** 9},
+    ])
+    await due_queue.add([(moved_on, shard_of(moved_on), 10 ** 9)])
+
+    assert await timer.requeue_timers([failed, moved_on]) == [failed]
+
+    assert await due_queue._redis.zscore(due_queue._keys(shard_of(moved_on))[0], moved_on.binary) == 10 ** 9
+    assert await due_queue._redis.zscore(due_queue._keys(shard_of(failed))[0], failed.binary) is not None
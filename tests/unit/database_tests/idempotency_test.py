@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+from functools import partial
+
+import pytest
+from bson import ObjectId
+from cachetools import TTLCache
+from pymongo.errors import DuplicateKeyError
+from unittest.mock import MagicMock, AsyncMock, PropertyMock, patch
+
+from src.database.cache import IdempotencyKeyCache, IdempotentTimer
+from src.database.timer import Timer
+
+
+@pytest.mark.anyio
+@patch('src.database.timer_counters.timer_counters.record', new_callable=AsyncMock)
+async def test_retries_get_the_timer_the_first_request_created(mock_record):
+    collection = MagicMock()
+    collection.insert_one = AsyncMock()
+    timer = Timer()
+    eta = datetime.now(tz=timezone.utc)
+
+    with patch('src.database.timer.Timer._collection', new_callable=PropertyMock, return_value=collection):
+        first, created = await timer.insert_idempotent_timer_request("key", eta=eta, url="http://example.com")
+        assert created
+        assert collection.insert_one.await_args.args[0]["idempotency_key"] == "key"
+
+        # Answered from the recent keys of this process
+        again, created = await timer.insert_idempotent_timer_request("key", eta=eta, url="http://example.com")
+        assert (again.id, created) == (str(first.id), False)
+        collection.insert_one.assert_awaited_once()
+
+
+@pytest.mark.anyio
+@patch('src.database.timer_counters.timer_counters.record', new_callable=AsyncMock)
+async def test_keys_used_by_other_processes_are_settled_by_the_unique_index(mock_record):
+    original = {"_id": ObjectId(), "eta": datetime(2024, 1, 1), "url": "http://example.com"}
+    collection = MagicMock()
+    collection.insert_one = AsyncMock(side_effect=DuplicateKeyError("E11000 duplicate key error"))
+    collection.find_one = AsyncMock(return_value=original)
+    user_id = ObjectId()
+
+    with patch('src.database.timer.Timer._collection', new_callable=PropertyMock, return_value=collection):
+        timer_db, created = await Timer().insert_idempotent_timer_request(
+            "key", eta=datetime.now(tz=timezone.utc), url="http://example.com", user_id=user_id
+        )
+
+    assert (timer_db.id, created) == (str(original["_id"]), False)
+    assert collection.find_one.await_args.args[0] == {"idempotency_key": "key", "user_id": user_id}
+    mock_record.assert_not_awaited()
+
+
+@pytest.mark.anyio
+@patch('src.database.timer_counters.timer_counters.record', new_callable=AsyncMock)
+async def test_timers_without_a_key_stay_out_of_the_unique_index(mock_record, mongo):
+    index = next(index.document for index in Timer._indexes if index.document["name"] == "idempotency_key")
+    assert index["unique"]
+
+    timer = Timer()
+    eta = datetime.now(tz=timezone.utc)
+    await timer.insert_timer_request(eta=eta, url="http://example.com")
+    await timer.insert_timer_request(eta=eta, url="http://example.com")
+    await timer.insert_idempotent_timer_request("key", eta=eta, url="http://example.com")
+
+    # Only documents holding a key match the partial filter, so any number of timers may go without one
+    matched = await mongo["timer"].count_documents(index["partialFilterExpression"])
+    assert (matched, await mongo["timer"].count_documents({})) == (1, 3)
+
+
+def test_remembered_keys_hold_only_what_a_replay_answers_and_expire_before_archiving():
+    now = [0.0]
+    eta = datetime(2024, 1, 1)
+    with patch('src.database.cache.settings.TIMER_ARCHIVE_AFTER_SECONDS', 600.0), \
+            patch('src.database.cache.TTLCache', partial(TTLCache, timer=lambda: now[0])):
+        cache = IdempotencyKeyCache(maxsize=10, ttl=3600)
+
+    cache.set(None, "key", "66f000000000000000000000", eta, "http://example.com")
+    assert cache.get(None, "key") == IdempotentTimer("66f000000000000000000000", eta, "http://example.com")
+
+    # Capped at half the archive delay
+    now[0] = 301
+    assert cache.get(None, "key") is None
@@ -0,0 +1,48 @@
+import pytest
+from unittest.mock import MagicMock, AsyncMock, PropertyMock, patch
+
+from src.database.query_plans import QueryPlanError, check_query_plans, index_used
+from src.database.timer import Timer
+
+IXSCAN_PLAN = {
+    "queryPlanner": {
+        "winningPlan": {
+            "stage": "LIMIT",
+            "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "status_due_bucket"}},
+        }
+    }
+}
+SBE_PLAN = {
+    "queryPlanner": {
+        "winningPlan": {"queryPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "user_eta"}}}
+    }
+}
+COLLSCAN_PLAN = {"queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}}
+
+
+def test_index_used():
+    assert index_used(IXSCAN_PLAN) == "status_due_bucket"
+    assert index_used(SBE_PLAN) == "user_eta"
+    assert index_used(COLLSCAN_PLAN) is None
+
+
+@pytest.mark.anyio
+async def test_check_query_plans_reports_collection_scans():
+    collection = MagicMock()
+    plans = [IXSCAN_PLAN, COLLSCAN_PLAN] + [IXSCAN_PLAN] * 6
+    collection.find.return_value.explain = AsyncMock(side_effect=plans)
+
+    with patch('src.database.timer.Timer._collection', new_callable=PropertyMock, return_value=collection):
+        with pytest.raises(QueryPlanError, match="timer.expired_leases: COLLSCAN"):
+            await check_query_plans([Timer()])
+
+
+@pytest.mark.anyio
+async def test_ensure_indexes_creates_declared_indexes():
+    collection = MagicMock()
+    collection.create_indexes = AsyncMock(return_value=["status_due_bucket"])
+
+    with patch('src.database.timer.Timer._collection', new_callable=PropertyMock, return_value=collection):
+        await Timer().ensure_indexes()
+
+    collection.create_indexes.assert_awaited_once_with(Timer._indexes)
@@ -0,0 +1,47 @@
+import hashlib
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from unittest.mock import MagicMock, AsyncMock, PropertyMock, patch
+
+from src.database.timer import Timer
+from src.database.timer_archive import TimerArchive
+from src.settings import settings
+
+
+@pytest.mark.anyio
+async def test_archive_drops_live_fields_and_compacts_responses():
+    body = "y" * (settings.TIMER_RESPONSE_MAX_CHARS * 2)
+    document = {
+        "_id": ObjectId(), "eta": datetime(2024, 1, 1), "url": "http://example.com", "status": "fired",
+        "due_bucket": 1704067200, "shard": 3, "claim_id": "claim", "response": body,
+    }
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock(return_value=MagicMock(upserted_count=1, modified_count=0))
+
+    with patch('src.database.timer_archive.TimerArchive._collection', new_callable=PropertyMock, return_value=collection):
+        assert await TimerArchive().archive([document]) == 1
+
+    archived = collection.bulk_write.await_args.args[0][0]._doc
+    assert not {"due_bucket", "shard", "claim_id"} & archived.keys()
+    assert archived["response"] == body[:settings.TIMER_RESPONSE_MAX_CHARS]
+    assert archived["response_sha256"] == hashlib.sha256(body.encode()).hexdigest()
+    assert isinstance(archived["archived_at"], datetime)
+
+
+@pytest.mark.anyio
+async def test_reads_fall_back_to_the_archive():
+    timer_id = ObjectId()
+    archived = {"_id": timer_id, "eta": datetime(2024, 1, 1), "url": "http://example.com", "status": "fired"}
+    hot, cold = MagicMock(), MagicMock()
+    hot.find_one = AsyncMock(return_value=None)
+    cold.find_one = AsyncMock(return_value=archived)
+
+    with patch('src.database.timer.Timer._collection', new_callable=PropertyMock, return_value=hot), \
+            patch('src.database.timer_archive.TimerArchive._collection', new_callable=PropertyMock, return_value=cold):
+        timer_db = await Timer().get_timer_by_id(timer_id)
+        eta = await Timer().get_timer_eta(timer_id)
+
+    assert timer_db.id == str(timer_id)
+    assert eta == archived["eta"]
@@ -0,0 +1,38 @@
+import pytest
+from bson import ObjectId
+from unittest.mock import MagicMock, AsyncMock, PropertyMock, patch
+
+from src.database.timer_counters import TimerCounters
+
+
+@pytest.mark.anyio
+async def test_changes_are_merged_into_one_upsert_per_user():
+    first, second = ObjectId(), ObjectId()
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock()
+
+    with patch('src.database.timer_counters.TimerCounters._collection', new_callable=PropertyMock, return_value=collection):
+        await TimerCounters().add([
+            (first, {"pending": -1, "fired": 1}),
+            (None, {"pending": -1, "fired": 1}),
+            (first, {"pending": -1, "failed": 1}),
+            (second, {"pending": 1, "failed": -1}),
+            (second, {"pending": -1, "failed": 1}),
+        ])
+
+    operations = collection.bulk_write.await_args.args[0]
+    assert [(operation._filter, operation._doc["$inc"]) for operation in operations] == [
+        ({"_id": first}, {"pending": -2, "fired": 1, "failed": 1}),
+    ]
+    assert operations[0]._upsert
+
+
+@pytest.mark.anyio
+async def test_users_without_counters_read_as_zero():
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=None)
+
+    with patch('src.database.timer_counters.TimerCounters._collection', new_callable=PropertyMock, return_value=collection):
+        counters = await TimerCounters().get_counters(ObjectId())
+
+    assert (counters.pending, counters.fired, counters.failed, counters.cancelled) == (0, 0, 0, 0)
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from src.models.timer_db import TimerDB, TimerStatus
+
+
+def test_from_document():
+    document = {
+        "_id": ObjectId(),
+        "eta": datetime(2024, 1, 1, 12, 0, 0),
+        "url": "http://example.com/webhook",
+        "status": "dispatched",
+        "due_bucket": 1704110400,
+        "claim_id": "claim",
+        "created": datetime(2024, 1, 1, 11, 0, 0),
+        "updated": datetime(2024, 1, 1, 11, 0, 0),
+    }
+
+    timer_db = TimerDB.from_document(document)
+
+    assert timer_db.id == str(document["_id"])
+    assert timer_db.status is TimerStatus.DISPATCHED
+    assert timer_db.claim_id == "claim"
+
+
+def test_from_document_with_projection():
+    timer_db = TimerDB.from_document(
+        {"_id": ObjectId(), "eta": datetime(2024, 1, 1), "url": "http://example.com/webhook", "status": "fired"}
+    )
+
+    assert timer_db.status is TimerStatus.FIRED
+    assert timer_db.response is None
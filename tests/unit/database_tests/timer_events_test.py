@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from bson import ObjectId
+from unittest.mock import MagicMock, PropertyMock, patch
+from pymongo.errors import OperationFailure
+
+from src.database.timer_events import TimerEvents
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+@pytest.mark.anyio
+async def test_subscribers_only_get_their_timers():
+    events = TimerEvents(poll_seconds=0.01)
+
+    async def run():
+        events._ready.set()
+        await asyncio.Event().wait()
+
+    with patch.object(events, 'run', run):
+        async with events.subscribe(["a", "b"]) as first, events.subscribe(["b"]) as second:
+            events.publish({"id": "b", "status": "fired"})
+            events.publish({"id": "c", "status": "fired"})
+            assert first.qsize() == 1 and second.qsize() == 1
+        assert not events._subscribers
+    await events.stop()
+
+
+@pytest.mark.anyio
+async def test_falls_back_to_polling_without_change_streams():
+    timer_id = ObjectId()
+    collection = MagicMock()
+    collection.watch.side_effect = OperationFailure("The $changeStream stage is only supported on replica sets", 40573)
+    collection.find.return_value = Cursor([{"_id": timer_id, "status": "cancelled"}])
+    events = TimerEvents(poll_seconds=0.01)
+
+    with patch('src.database.timer.Timer._collection', new_callable=PropertyMock, return_value=collection):
+        async with events.subscribe([str(timer_id)]) as queue:
+            event = await asyncio.wait_for(queue.get(), timeout=1)
+        await events.stop()
+
+    assert not events.change_streams
+    assert event == {"id": str(timer_id), "status": "cancelled", "success": None, "status_code": None}
@@ -0,0 +1,150 @@
+import asyncio
+import fcntl
+import os
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+from src.database.timer_journal import TimerJournal
+
+
+class FakeCollection:
+    """Stands in for `Timer.insert_journaled`: a unique `_id` index that skips ids it already holds."""
+
+    def __init__(self):
+        self.docs = {}
+        self.inserts = 0
+        self.fail = False
+
+    async def insert(self, documents):
+        if self.fail:
+            raise ConnectionError("mongo is down")
+        self.inserts += 1
+        for document in documents:
+            self.docs.setdefault(document["_id"], document)
+
+
+def timers(count):
+    return [{"_id": ObjectId(), "eta": datetime.now(tz=timezone.utc), "url": "http://example.com"} for _ in range(count)]
+
+
+def make_journal(tmp_path, collection, **options):
+    options = {"segment_bytes": 4096, "sync_seconds": 0.001, "commit_seconds": 0.01, **options}
+    return TimerJournal(insert=collection.insert, directory=str(tmp_path), **options)
+
+
+def crash(journal):
+    """Drop the journal like a killed process would: its locks go away, nothing is committed."""
+    journal._commit_task.cancel()
+    for segment in {journal._segment, *(segment for segment, *_ in journal._pending)}:
+        segment.close()
+
+
+@pytest.mark.anyio
+async def test_appends_share_a_sync_and_are_group_committed(tmp_path):
+    collection = FakeCollection()
+    journal = make_journal(tmp_path, collection, commit_seconds=60)
+    await journal.start()
+
+    batches = [timers(10) for _ in range(5)]
+    await asyncio.gather(*(journal.append(batch) for batch in batches))
+    assert len(journal._pending) == 50
+
+    assert await journal.commit() == 50
+    assert collection.inserts == 1
+    assert set(collection.docs) == {doc["_id"] for batch in batches for doc in batch}
+    await journal.stop()
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.anyio
+async def test_full_segments_rotate_and_are_deleted_once_committed(tmp_path):
+    collection = FakeCollection()
+    journal = make_journal(tmp_path, collection, commit_seconds=60)
+    await journal.start()
+
+    for _ in range(20):
+        await journal.append(timers(5))
+    assert len(list(tmp_path.iterdir())) > 1
+
+    await journal.commit()
+    assert len(list(tmp_path.iterdir())) == 1
+    assert len(collection.docs) == 100
+    await journal.stop()
+
+
+@pytest.mark.anyio
+async def test_crash_is_replayed_without_loss_or_duplicates(tmp_path):
+    collection = FakeCollection()
+    journal = make_journal(tmp_path, collection, commit_seconds=60, commit_batch_size=10)
+    await journal.start()
+    acknowledged = timers(25)
+    await journal.append(acknowledged)
+    # The first batch reached Mongo, then Mongo went away and the process died
+    await journal.insert([document for *_, document in list(journal._pending)[:10]])
+    crash(journal)
+
+    restarted = make_journal(tmp_path, collection)
+    assert await restarted.start() == 25
+    assert set(collection.docs) == {doc["_id"] for doc in acknowledged}
+    await restarted.stop()
+
+    again = make_journal(tmp_path, collection)
+    assert await again.start() == 0
+    await again.stop()
+
+
+@pytest.mark.anyio
+async def test_torn_tail_is_ignored(tmp_path):
+    collection = FakeCollection()
+    journal = make_journal(tmp_path, collection, commit_seconds=60)
+    await journal.start()
+    await journal.append(timers(3))
+    segment, start, end, _ = journal._pending[-1]
+    # Half of the last record reached the disk
+    segment._map[end - 5:end] = b"\0" * 5
+    crash(journal)
+
+    restarted = make_journal(tmp_path, collection)
+    assert await restarted.start() == 2
+    await restarted.stop()
+
+
+@pytest.mark.anyio
+async def test_live_segments_are_not_replayed(tmp_path):
+    collection = FakeCollection()
+    collection.fail = True
+    live = make_journal(tmp_path, collection)
+    await live.start()
+    await live.append(timers(3))
+
+    other = make_journal(tmp_path, FakeCollection())
+    assert await other.start() == 0
+    await other.stop()
+
+    collection.fail = False
+    await live.stop()
+    assert len(collection.docs) == 3
+
+
+@pytest.mark.anyio
+async def test_segments_are_only_visible_once_initialized(tmp_path):
+    live = make_journal(tmp_path, FakeCollection())
+    await live.start()
+    assert [path.suffix for path in tmp_path.iterdir()] == [".journal"]
+
+    # One process is creating a segment, another one died doing so long ago
+    creating, abandoned = tmp_path / "2-1.journal.tmp", tmp_path / "1-1.journal.tmp"
+    abandoned.write_bytes(b"")
+    os.utime(abandoned, (0, 0))
+    fd = os.open(creating, os.O_RDWR | os.O_CREAT)
+    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    other = make_journal(tmp_path, FakeCollection())
+    assert await other.start() == 0
+    assert creating.exists() and not abandoned.exists()
+
+    os.close(fd)
+    await other.stop()
+    await live.stop()
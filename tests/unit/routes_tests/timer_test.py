@@ -1,13 +1,17 @@
+import asyncio
 import pytest
 import httpx
+from contextlib import asynccontextmanager
 from app import app
 from datetime import datetime, timezone, timedelta
 from bson import ObjectId
 from unittest.mock import patch, Mock, MagicMock
+from src.models.timer_counters_db import TimerCountersDB
+from src.models.timer_db import TimerDB, TimerStatus
 
 @pytest.mark.anyio
-@patch('src.celery_workers.timer.fire_webhook.apply_async')
-async def test_set_timer(mock_apply_async: Mock, async_client: httpx.AsyncClient):
+@patch('src.database.timer.Timer.insert_timer_request')
+async def test_set_timer(mock_insert_timer_request: Mock, async_client: httpx.AsyncClient):
     payload = {
         "hours": 1,
         "minutes": 30,
@@ -15,7 +19,7 @@ async def test_set_timer(mock_apply_async: Mock, async_client: httpx.AsyncClient
         "url": "http://example.com/webhook"
     }
         
-    mock_apply_async.return_value = None
+    mock_insert_timer_request.return_value = MagicMock(id=ObjectId())
 
     # Successful Response
     response = await async_client.post("/", json=payload, headers={"Content-Type": "application/json"})
@@ -24,7 +28,8 @@ async def test_set_timer(mock_apply_async: Mock, async_client: httpx.AsyncClient
     response_data = response.json()
     assert "id" in response_data
     assert "time_left" in response_data
-    assert mock_apply_async.called
+    assert response_data["time_left"] == 5415
+    assert mock_insert_timer_request.called
 
     # Not a json request
     response = await async_client.post("", data="invalid json")
@@ -34,27 +39,87 @@ async def test_set_timer(mock_apply_async: Mock, async_client: httpx.AsyncClient
     # Invalid request
     response = await async_client.post("", json={"hours": 1}, headers={"Content-Type": "application/json"})
     assert response.status_code == 422
+    response = await async_client.post(
+        "", json={"hours": None, "url": "http://example.com/webhook"}, headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.insert_timer_request')
+async def test_set_recurring_timer(mock_insert_timer_request: Mock, async_client: httpx.AsyncClient):
+    mock_insert_timer_request.return_value = MagicMock(id=ObjectId())
+    payload = {"url": "http://example.com/webhook", "interval_seconds": 600, "max_occurrences": 3}
+
+    response = await async_client.post("/", json=payload, headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 201
+    assert response.json()["time_left"] == 600
+    recurrence = mock_insert_timer_request.call_args.kwargs["recurrence"]
+    assert (recurrence.interval_seconds, recurrence.max_occurrences) == (600, 3)
+
+    # Both kinds of recurrence, or a malformed cron expression
+    for payload in ({"url": "http://example.com", "interval_seconds": 60, "cron": "* * * * *"},
+                    {"url": "http://example.com", "cron": "61 * * * *"}):
+        response = await async_client.post("/", json=payload, headers={"Content-Type": "application/json"})
+        assert response.status_code == 422
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.insert_idempotent_timer_request')
+async def test_set_timer_idempotent_replay(mock_insert: Mock, async_client: httpx.AsyncClient):
+    original = TimerDB(
+        _id=str(ObjectId()), eta=datetime.now(tz=timezone.utc) + timedelta(minutes=10), url="http://example.com/webhook"
+    )
+    mock_insert.return_value = (original, False)
+    payload = {"minutes": 15, "url": "http://example.com/webhook"}
+
+    response = await async_client.post(
+        "/", json=payload, headers={"Content-Type": "application/json", "Idempotency-Key": "order-42"}
+    )
+
+    assert response.status_code == 201
+    assert response.headers["Idempotent-Replayed"] == "true"
+    assert response.json()["id"] == original.id
+    assert 595 <= response.json()["time_left"] <= 600
+    assert mock_insert.call_args.args[0] == "order-42"
+
+    # Without the header, a client_ref derives the key from the request
+    await async_client.post("/", json={**payload, "client_ref": "order-42"}, headers={"Content-Type": "application/json"})
+    derived = mock_insert.call_args.args[0]
+    await async_client.post("/", json={**payload, "client_ref": "order-42"}, headers={"Content-Type": "application/json"})
+    assert mock_insert.call_args.args[0] == derived != "order-42"
+
+    # The key was used for another url
+    response = await async_client.post(
+        "/", json={**payload, "url": "http://example.com/other"},
+        headers={"Content-Type": "application/json", "Idempotency-Key": "order-42"},
+    )
+    assert response.status_code == 409
+
+    response = await async_client.post(
+        "/", json=payload, headers={"Content-Type": "application/json", "Idempotency-Key": "x" * 256}
+    )
+    assert response.status_code == 400
 
 
 @pytest.mark.anyio
-@patch('src.database.timer.Timer.get_timer_by_id') 
-async def test_get_timer(mock_get_timer_by_id: MagicMock, async_client: httpx.AsyncClient):
+@patch('src.database.timer.Timer.get_timer_eta') 
+async def test_get_timer(mock_get_timer_eta: MagicMock, async_client: httpx.AsyncClient):
     # Prepare mock data
     timer_id = ObjectId()
-    mock_timer = MagicMock()
-    mock_timer.id = str(timer_id)
-    mock_timer.eta = (datetime.now(tz=timezone.utc) + timedelta(hours=1, minutes=30, seconds=15)).replace(tzinfo=None)
+    eta = (datetime.now(tz=timezone.utc) + timedelta(hours=1, minutes=30, seconds=15)).replace(tzinfo=None)
     
-    # Mock the behavior of get_timer_by_id
-    mock_get_timer_by_id.return_value = mock_timer
+    # Mock the behavior of get_timer_eta
+    mock_get_timer_eta.return_value = eta
 
     # Make the GET request
     response = await async_client.get(f"/{timer_id}")
 
     assert response.status_code == 200
     response_data = response.json()
-    assert "id" in response_data
-    assert "time_left" in response_data
+    assert response_data["id"] == str(timer_id)
+    assert 5410 <= response_data["time_left"] <= 5415
 
     # Test invalid ID format
     response = await async_client.get("/invalid_id")
@@ -62,8 +127,183 @@ async def test_get_timer(mock_get_timer_by_id: MagicMock, async_client: httpx.As
     assert response.json() == {"detail": "Invalid timer ID format."}
 
     # Test non-existent timer
-    mock_get_timer_by_id.return_value = None
+    mock_get_timer_eta.return_value = None
     non_existent_id = ObjectId()
     response = await async_client.get(f"/{non_existent_id}")
     assert response.status_code == 404
     assert response.json() == {"detail": "Timer not found"}
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.insert_timer_requests')
+async def test_set_timers_batch(mock_insert_timer_requests: Mock, async_client: httpx.AsyncClient):
+    payload = [
+        {"seconds": 10, "url": "http://example.com/webhook"},
+        {"hours": 1},
+        {"minutes": 2, "url": "http://example.com/other"},
+        {"hours": None, "url": "http://example.com/webhook"},
+    ]
+    first_id, third_id = ObjectId(), ObjectId()
+    mock_insert_timer_requests.return_value = [MagicMock(id=first_id), MagicMock(id=third_id)]
+
+    response = await async_client.post("/batch", json=payload, headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 201
+    first, second, third, fourth = response.json()["timers"]
+    assert first == {"id": str(first_id), "time_left": 10}
+    assert second["errors"][0]["loc"] == ["url"]
+    assert third == {"id": str(third_id), "time_left": 120}
+    assert fourth["errors"][0]["loc"] == ["hours"]
+    mock_insert_timer_requests.assert_called_once()
+    assert [url for _, url, _, _ in mock_insert_timer_requests.call_args.args[0]] == [
+        "http://example.com/webhook", "http://example.com/other"
+    ]
+
+    # Not a JSON array
+    response = await async_client.post("/batch", json={"seconds": 1}, headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.get_timer_by_id')
+@patch('src.database.timer.Timer.cancel_timer')
+async def test_cancel_timer(mock_cancel_timer: Mock, mock_get_timer_by_id: Mock, async_client: httpx.AsyncClient):
+    timer_id = ObjectId()
+    mock_cancel_timer.return_value = MagicMock(id=str(timer_id))
+
+    response = await async_client.delete(f"/{timer_id}")
+    assert response.status_code == 204
+    mock_cancel_timer.assert_called_once_with(timer_id=timer_id)
+
+    # Already fired
+    mock_cancel_timer.return_value = None
+    mock_get_timer_by_id.return_value = MagicMock(status=TimerStatus.FIRED)
+    response = await async_client.delete(f"/{timer_id}")
+    assert response.status_code == 409
+
+    # Unknown timer
+    mock_get_timer_by_id.return_value = None
+    response = await async_client.delete(f"/{timer_id}")
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.reschedule_timer')
+async def test_reschedule_timer(mock_reschedule_timer: Mock, async_client: httpx.AsyncClient):
+    timer_id = ObjectId()
+    mock_reschedule_timer.return_value = MagicMock(id=str(timer_id))
+
+    response = await async_client.patch(f"/{timer_id}", json={"minutes": 10}, headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 200
+    assert response.json() == {"id": str(timer_id), "time_left": 600}
+    eta = mock_reschedule_timer.call_args.kwargs["eta"]
+    assert timedelta(seconds=595) < eta - datetime.now(tz=timezone.utc) <= timedelta(seconds=600)
+
+    # Invalid request
+    response = await async_client.patch(f"/{timer_id}", json={"minutes": -1}, headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+    response = await async_client.patch(f"/{timer_id}", json={"hours": None}, headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.get_timer_eta')
+async def test_metrics_endpoint(mock_get_timer_eta: MagicMock, async_client: httpx.AsyncClient):
+    mock_get_timer_eta.return_value = None
+    await async_client.get(f"/{ObjectId()}")
+
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/metrics/")
+
+    assert response.status_code == 200
+    assert 'http_request_seconds_count{method="GET",route="/timer/{timer_id}",status="404"}' in response.text
+
+
+@pytest.mark.anyio
+async def test_set_timer_malformed_json(async_client: httpx.AsyncClient):
+    response = await async_client.post("/", content=b"{not json", headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Request body is not valid JSON"
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.get_timers')
+async def test_stream_timers(mock_get_timers: Mock, async_client: httpx.AsyncClient):
+    eta = datetime.now(tz=timezone.utc) + timedelta(minutes=1)
+    pending = TimerDB(_id=str(ObjectId()), eta=eta, url="http://example.com", status=TimerStatus.DISPATCHED)
+    fired = TimerDB(
+        _id=str(ObjectId()), eta=eta, url="http://example.com", status=TimerStatus.FIRED, success=True, status_code=200
+    )
+    unknown = ObjectId()
+    mock_get_timers.return_value = [pending, fired]
+
+    @asynccontextmanager
+    async def subscribe(timer_ids):
+        assert set(timer_ids) == {pending.id, fired.id, str(unknown)}
+        queue = asyncio.Queue()
+        queue.put_nowait({"id": pending.id, "status": "fired", "success": False, "status_code": 500})
+        yield queue
+
+    with patch('src.routes.timer.timer_events.subscribe', subscribe):
+        response = await async_client.get("/stream", params={"ids": f"{pending.id},{fired.id},{unknown}"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert [lines[0] for lines in events] == [
+        "event: snapshot", "event: snapshot", "event: completed", "event: not_found", "event: completed"
+    ]
+    assert '"time_left":59' in events[0][1] or '"time_left":60' in events[0][1]
+    assert events[-1][1] == f'data: {{"id":"{pending.id}","status":"fired","success":false,"status_code":500}}'
+
+    response = await async_client.get("/stream", params={"ids": "not-an-id"})
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.iter_user_timers')
+async def test_list_timers(mock_iter_user_timers: Mock, async_client: httpx.AsyncClient):
+    user_id = ObjectId()
+    eta = datetime.now(tz=timezone.utc) + timedelta(minutes=1)
+    timers = [TimerDB(_id=str(ObjectId()), eta=eta, url="http://example.com") for _ in range(3)]
+
+    async def page(*args, **kwargs):
+        for timer_db in timers:
+            yield timer_db
+
+    mock_iter_user_timers.side_effect = page
+    response = await async_client.get("/", params={"user_id": str(user_id), "status": "pending", "limit": 2})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["id"] for item in body["timers"]] == [timers[0].id, timers[1].id]
+    assert body["timers"][0]["status"] == "pending"
+    args, kwargs = mock_iter_user_timers.call_args
+    assert args == (user_id, 3) and kwargs["status"] == TimerStatus.PENDING and kwargs["after"] is None
+
+    # The next page starts after the last listed timer
+    response = await async_client.get("/", params={"user_id": str(user_id), "cursor": body["next_cursor"]})
+    after_eta, after_id = mock_iter_user_timers.call_args.kwargs["after"]
+    assert str(after_id) == timers[1].id
+    assert abs(after_eta - eta) < timedelta(milliseconds=1)
+    assert response.json()["next_cursor"] is None
+
+    for params in ({"user_id": "nope"}, {"user_id": str(user_id), "cursor": "nope"},
+                   {"user_id": str(user_id), "status": "nope"}, {"user_id": str(user_id), "limit": 100_000}):
+        response = await async_client.get("/", params=params)
+        assert response.status_code == 400
+
+
+@pytest.mark.anyio
+@patch('src.database.timer_counters.TimerCounters.get_counters')
+async def test_timer_stats(mock_get_counters: Mock, async_client: httpx.AsyncClient):
+    user_id = ObjectId()
+    mock_get_counters.return_value = TimerCountersDB(_id=str(user_id), pending=3, fired=10, failed=1)
+
+    response = await async_client.get("/stats", params={"user_id": str(user_id)})
+
+    assert response.status_code == 200
+    assert response.json() == {"user_id": str(user_id), "pending": 3, "fired": 10, "failed": 1, "cancelled": 0}
+    mock_get_counters.assert_called_once_with(user_id)
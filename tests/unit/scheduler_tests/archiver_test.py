@@ -0,0 +1,82 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from unittest.mock import patch, AsyncMock
+
+from src.database.dead_letter import dead_letter
+from src.models.timer_db import TimerStatus
+from src.scheduler.archiver import Archiver
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.delete_archived', new_callable=AsyncMock)
+@patch('src.database.timer_archive.TimerArchive.archive', new_callable=AsyncMock)
+@patch('src.database.timer.Timer.iter_archivable')
+async def test_archive_copies_then_deletes_each_batch(mock_iter, mock_archive: AsyncMock, mock_delete: AsyncMock):
+    chunks = [[{"_id": ObjectId()}, {"_id": ObjectId()}], [{"_id": ObjectId()}]]
+    cutoffs = []
+
+    async def archivable(before, batch_size, shards, failed_before):
+        cutoffs.append(before)
+        assert shards == {1, 3}
+        assert failed_before < before
+        for chunk in chunks:
+            yield chunk
+
+    mock_iter.side_effect = archivable
+    # The second timer of the first batch was updated in between and stays
+    mock_delete.side_effect = [1, 1]
+
+    archiver = Archiver(after_seconds=3600, batch_size=2, failed_after_seconds=7200, owned_shards=lambda: {1, 3})
+    assert await archiver.archive() == 2
+
+    assert (datetime.now(tz=timezone.utc) - cutoffs[0]).total_seconds() == pytest.approx(3600, abs=5)
+    assert [call.args[0] for call in mock_archive.await_args_list] == chunks
+    assert [call.args[0] for call in mock_delete.await_args_list] == [[doc["_id"] for doc in chunk] for chunk in chunks]
+    assert all(call.kwargs["before"] == cutoffs[0] for call in mock_delete.await_args_list)
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.iter_archivable')
+async def test_archive_skips_a_node_without_shards(mock_iter):
+    assert await Archiver(owned_shards=lambda: set()).archive() == 0
+    mock_iter.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_dead_lettered_timers_stay_replayable(mongo):
+    long_ago = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    fired, failed = ObjectId(), ObjectId()
+    await mongo["timer"].insert_many([
+        {"_id": fired, "url": "http://example.com", "status": TimerStatus.FIRED, "success": True, "updated": long_ago},
+        {"_id": failed, "url": "http://example.com", "status": TimerStatus.FIRED, "success": False, "updated": long_ago},
+    ])
+    await dead_letter.add(str(failed), "http://example.com", attempts=5, status_code=500)
+
+    assert await Archiver(after_seconds=3600, failed_after_seconds=0).archive() == 1
+    assert await mongo["timer_archive"].find_one({"_id": fired})
+
+    assert await dead_letter.replay() == 1
+    assert (await mongo["timer"].find_one({"_id": failed}))["status"] == TimerStatus.PENDING
+    assert await mongo["timer_dead_letter"].count_documents({}) == 0
+
+
+@pytest.mark.anyio
+async def test_dead_lettered_timers_are_archived_after_the_retention(mongo):
+    now = datetime.now(tz=timezone.utc)
+    stale, recent = ObjectId(), ObjectId()
+    await mongo["timer"].insert_many([
+        {"_id": stale, "url": "http://example.com", "status": TimerStatus.FIRED, "success": False,
+         "updated": now - timedelta(days=10)},
+        {"_id": recent, "url": "http://example.com", "status": TimerStatus.FIRED, "success": False,
+         "updated": now - timedelta(days=2)},
+    ])
+    for timer_id in (stale, recent):
+        await dead_letter.add(str(timer_id), "http://example.com", attempts=5, status_code=500)
+    # The stale timer's letter predates the cutoff, the recent one's was written after a replay
+    await mongo["timer_dead_letter"].update_one({"timer_id": str(stale)}, {"$set": {"failed_at": now - timedelta(days=10)}})
+
+    assert await Archiver(after_seconds=3600, failed_after_seconds=7 * 86400).archive() == 1
+    assert await mongo["timer_archive"].find_one({"_id": stale})
+    assert await mongo["timer"].find_one({"_id": recent})
+    assert [doc["timer_id"] async for doc in mongo["timer_dead_letter"].find()] == [str(recent)]
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from unittest.mock import patch, AsyncMock
+
+import pytest
+from bson import ObjectId
+
+from src.database.due_queue import RedisDueQueue
+from src.database.timer import shard_of
+from src.models.timer_db import TimerDB
+from src.scheduler.backend import RedisSchedulerBackend
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+
+async def no_pending(*args, **kwargs):
+    return
+    yield
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.iter_pending', no_pending)
+@patch('src.database.timer.timer.claim_timers', new_callable=AsyncMock)
+async def test_due_ids_are_claimed_in_mongo_and_acknowledged(mock_claim_timers):
+    due_queue = RedisDueQueue(client=fakeredis.FakeAsyncRedis())
+    backend = RedisSchedulerBackend(due_queue=due_queue)
+    now = datetime.now(tz=timezone.utc)
+    due, stale = ObjectId(), ObjectId()
+    await due_queue.add([(due, shard_of(due), 1), (stale, shard_of(stale), 1)])
+    # The stale one was cancelled in Mongo, its claim does not hold
+    mock_claim_timers.side_effect = lambda ids, until: [
+        TimerDB(_id=str(timer_id), eta=now, url="http://example.com") for timer_id in ids if timer_id == due
+    ]
+
+    claimed = await backend.claim_due(now, limit=10)
+
+    assert [timer_db.id for timer_db in claimed] == [str(due)]
+    assert sorted(timer_id for call in mock_claim_timers.await_args_list for timer_id in call.args[0]) == sorted([due, stale])
+    assert not await due_queue._redis.zcard(due_queue._keys(shard_of(due))[1])
+    assert not await due_queue._redis.zcard(due_queue._keys(shard_of(stale))[1])
+    assert await backend.claim_due(now, limit=10) == []
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.timer.claim_timers', new_callable=AsyncMock, return_value=[])
+async def test_overdue_timers_missing_from_redis_are_added_back(mock_claim_timers):
+    due_queue = RedisDueQueue(client=fakeredis.FakeAsyncRedis())
+    backend = RedisSchedulerBackend(due_queue=due_queue, reconcile_seconds=3600)
+    missing = ObjectId()
+
+    async def pending(until, batch_size, shards=None):
+        assert until < datetime.now(tz=timezone.utc)
+        yield [(missing, 1)]
+
+    with patch('src.database.timer.timer.iter_pending', pending):
+        await backend.claim_due(datetime.now(tz=timezone.utc), limit=10)
+        # Reconciled at most every `reconcile_seconds`
+        await backend.claim_due(datetime.now(tz=timezone.utc), limit=10)
+
+    assert [timer_id for call in mock_claim_timers.await_args_list for timer_id in call.args[0]] == [missing]
@@ -0,0 +1,99 @@
+import pytest
+from datetime import datetime, timezone, timedelta
+from bson import ObjectId
+from unittest.mock import patch, AsyncMock
+
+from src.database.timer import due_bucket
+from src.models.timer_db import TimerDB, TimerStatus
+from src.scheduler.dispatcher import Dispatcher
+
+
+def make_timer(eta: datetime) -> TimerDB:
+    return TimerDB(
+        _id=str(ObjectId()), eta=eta, url="http://example.com/webhook", status=TimerStatus.DISPATCHED, claim_id="claim"
+    )
+
+
+def test_due_bucket_treats_naive_as_utc():
+    eta = datetime(2024, 1, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+    assert due_bucket(eta) == due_bucket(eta.replace(tzinfo=None))
+    assert due_bucket(eta + timedelta(seconds=1)) == due_bucket(eta) + 1
+
+
+@pytest.mark.anyio
+@patch('src.scheduler.dispatcher.celery_app.producer_or_acquire')
+@patch('src.celery_workers.timer.fire_webhook.apply_async')
+@patch('src.database.timer.Timer.claim_due_timers', new_callable=AsyncMock)
+async def test_dispatch_due_publishes_claimed_timers(mock_claim: AsyncMock, mock_apply_async, mock_producer):
+    overdue = make_timer(datetime.now(tz=timezone.utc) - timedelta(seconds=5))
+    upcoming = make_timer(datetime.now(tz=timezone.utc) + timedelta(milliseconds=500))
+    mock_claim.return_value = [overdue, upcoming]
+
+    dispatcher = Dispatcher(batch_size=10, lookahead_seconds=2)
+    dispatched = await dispatcher.dispatch_due()
+
+    assert dispatched == 2
+    assert mock_claim.await_args.kwargs["limit"] == 10
+    mock_apply_async.assert_called_once_with(
+        args=[str(overdue.id), overdue.url, "claim"],
+        queue="webhook_queue.0",
+        producer=mock_producer.return_value.__enter__.return_value,
+    )
+    assert str(upcoming.id) in dispatcher.wheel
+
+
+@pytest.mark.anyio
+@patch('src.scheduler.dispatcher.celery_app.producer_or_acquire')
+@patch('src.celery_workers.timer.fire_webhook.apply_async')
+@patch('src.database.timer.Timer.claim_due_timers', new_callable=AsyncMock)
+async def test_dispatch_due_claims_owned_shards(mock_claim: AsyncMock, mock_apply_async, mock_producer):
+    overdue = make_timer(datetime.now(tz=timezone.utc) - timedelta(seconds=5))
+    overdue.shard = 3
+    mock_claim.return_value = [overdue]
+    owned = frozenset()
+
+    dispatcher = Dispatcher(owned_shards=lambda: owned)
+    assert await dispatcher.dispatch_due() == 0
+    assert not mock_claim.called
+
+    owned = frozenset({3, 7})
+    assert await dispatcher.dispatch_due() == 1
+    assert mock_claim.await_args.kwargs["shards"] == {3, 7}
+    assert mock_apply_async.call_args.kwargs["queue"] == "webhook_queue.3"
+
+
+@pytest.mark.anyio
+@patch('src.celery_workers.timer.fire_webhook.apply_async')
+@patch('src.database.timer.Timer.claim_due_timers', new_callable=AsyncMock)
+async def test_dispatch_due_nothing_claimed(mock_claim: AsyncMock, mock_apply_async):
+    mock_claim.return_value = []
+
+    assert await Dispatcher().dispatch_due() == 0
+    assert not mock_apply_async.called
+
+
+@patch('src.scheduler.dispatcher.celery_app.producer_or_acquire')
+@patch('src.celery_workers.timer.fire_webhook_batch.apply_async')
+@patch('src.celery_workers.timer.fire_webhook.apply_async')
+def test_coalescing_timers_go_out_as_one_batch(mock_apply_async, mock_apply_batch, mock_producer):
+    now = datetime.now(tz=timezone.utc)
+    coalescing = [make_timer(now - timedelta(seconds=1)) for _ in range(3)]
+    for timer_db in coalescing:
+        timer_db.coalesce = True
+    single = make_timer(now - timedelta(seconds=1))
+
+    dispatcher = Dispatcher(coalesce_window_seconds=1.0, coalesce_max_batch=2)
+    for timer_db in [*coalescing, single]:
+        dispatcher.arm(timer_db, now)
+
+    assert dispatcher.flush_ready() == 3
+    mock_apply_async.assert_called_once()
+    mock_apply_batch.assert_called_once_with(
+        args=["http://example.com/webhook", [[str(t.id), "claim"] for t in coalescing[:2]]],
+        queue="webhook_queue.0",
+        producer=mock_producer.return_value.__enter__.return_value,
+    )
+
+    dispatcher._release("http://example.com/webhook")
+    assert dispatcher.flush_ready() == 1
+    assert mock_apply_batch.call_args.kwargs["args"] == ["http://example.com/webhook", [[str(coalescing[2].id), "claim"]]]
@@ -0,0 +1,132 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from src.database.timer import shard_filter, shard_of
+from src.scheduler.sharding import ShardCoordinator
+
+SHARDS = 8
+
+
+class FakeLeases:
+    """In-memory stand-in for `ShardLease` with the same compare-and-set semantics."""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def renew(self, role, node_id, now, expires_at):
+        owned = set()
+        for (doc_role, shard), (owner, lease_expires_at) in self.docs.items():
+            if doc_role == role and owner == node_id and lease_expires_at >= now:
+                self.docs[(role, shard)] = (node_id, expires_at)
+                owned.add(shard)
+        return owned
+
+    async def taken(self, role, now):
+        return {shard for (doc_role, shard), (owner, expires) in self.docs.items()
+                if doc_role == role and owner and expires >= now}
+
+    async def acquire(self, role, shard, node_id, now, expires_at):
+        owner, lease_expires_at = self.docs.get((role, shard), (None, None))
+        if owner not in (None, node_id) and lease_expires_at >= now:
+            return False
+        self.docs[(role, shard)] = (node_id, expires_at)
+        return True
+
+    async def release(self, role, node_id, shards):
+        for shard in shards:
+            if self.docs.get((role, shard), (None,))[0] == node_id:
+                self.docs[(role, shard)] = (None, None)
+
+
+class FakeNodes:
+    def __init__(self):
+        self.expires = {}
+
+    async def heartbeat(self, role, node_id, expires_at):
+        self.expires[(role, node_id)] = expires_at
+
+    async def count_live(self, role, now):
+        return sum(1 for (doc_role, _), expires in self.expires.items() if doc_role == role and expires > now)
+
+    async def leave(self, role, node_id):
+        self.expires.pop((role, node_id), None)
+
+
+@pytest.fixture
+def stores():
+    return FakeLeases(), FakeNodes()
+
+
+def make_node(stores, node_id, changes=None):
+    leases, nodes = stores
+    return ShardCoordinator(
+        role="dispatcher", node_id=node_id, shards=SHARDS, lease_seconds=15, interval_seconds=1,
+        on_change=(lambda gained, lost: changes.append((gained, lost))) if changes is not None else None,
+        leases=leases, nodes=nodes,
+    )
+
+
+async def settle(coordinators, rounds=3):
+    for _ in range(rounds):
+        for coordinator in coordinators:
+            await coordinator.rebalance()
+
+
+def assert_partitioned(coordinators):
+    owned = [coordinator.owned_shards() for coordinator in coordinators]
+    assert set().union(*owned) == set(range(SHARDS))
+    assert sum(len(shards) for shards in owned) == SHARDS
+    assert max(map(len, owned)) - min(map(len, owned)) <= 1
+
+
+@pytest.mark.anyio
+async def test_nodes_joining_split_the_shards(stores):
+    changes = []
+    first = make_node(stores, "a", changes)
+    await first.rebalance()
+    assert first.owned_shards() == set(range(SHARDS))
+    assert changes == [(set(range(SHARDS)), set())]
+
+    others = [make_node(stores, "b"), make_node(stores, "c")]
+    await settle([first, *others])
+
+    assert_partitioned([first, *others])
+    assert changes[-1][1], "the first node handed shards over"
+
+
+@pytest.mark.anyio
+async def test_node_leaving_hands_its_shards_over(stores):
+    nodes = [make_node(stores, node_id) for node_id in "abcd"]
+    await settle(nodes)
+    assert_partitioned(nodes)
+
+    await nodes[1].release_all()
+    assert nodes[1].owned_shards() == frozenset()
+    await settle([nodes[0], nodes[2], nodes[3]])
+
+    assert_partitioned([nodes[0], nodes[2], nodes[3]])
+
+
+@pytest.mark.anyio
+async def test_dead_node_shards_are_taken_after_its_leases_expire(stores):
+    leases, node_store = stores
+    nodes = [make_node(stores, node_id) for node_id in "abc"]
+    await settle(nodes)
+    dead = nodes.pop()
+
+    # The dead node stops renewing: expire its heartbeat and leases
+    past = datetime.now(tz=timezone.utc) - timedelta(seconds=1)
+    node_store.expires[("dispatcher", dead.node_id)] = past
+    for key, (owner, _) in leases.docs.items():
+        if owner == dead.node_id:
+            leases.docs[key] = (owner, past)
+    await settle(nodes)
+
+    assert_partitioned(nodes)
+
+
+def test_legacy_timers_belong_to_shard_zero():
+    assert shard_filter(None) == {}
+    assert shard_filter({0, 2}) == {"shard": {"$in": [0, 2, None]}}
+    assert shard_filter({3}) == {"shard": {"$in": [3]}}
+    assert 0 <= shard_of("6ad51313538efee0f270dcb1") < 16
@@ -0,0 +1,40 @@
+import pytest
+from datetime import datetime, timezone
+from bson import ObjectId
+from unittest.mock import patch, AsyncMock, MagicMock
+
+from src.models.timer_db import TimerDB, TimerStatus
+from src.scheduler.sweeper import Sweeper
+
+
+def make_timer() -> TimerDB:
+    return TimerDB(
+        _id=str(ObjectId()),
+        eta=datetime.now(tz=timezone.utc),
+        url="http://example.com/webhook",
+        status=TimerStatus.DISPATCHED,
+        claim_id="new_claim",
+    )
+
+
+@pytest.mark.anyio
+@patch('src.database.timer.Timer.reclaim_timers', new_callable=AsyncMock)
+@patch('src.database.timer.Timer.iter_expired_leases')
+async def test_sweep_reclaims_and_publishes_each_batch(mock_iter, mock_reclaim: AsyncMock):
+    chunks = [[ObjectId(), ObjectId()], [ObjectId()]]
+
+    async def expired(now, batch_size, shards):
+        assert shards is None
+        assert batch_size == 2
+        for chunk in chunks:
+            yield chunk
+
+    mock_iter.side_effect = expired
+    first, second = [make_timer(), make_timer()], [make_timer()]
+    mock_reclaim.side_effect = [first, second]
+    publish = MagicMock()
+
+    assert await Sweeper(publish=publish, batch_size=2).sweep() == 3
+
+    assert [call.args[0] for call in mock_reclaim.await_args_list] == chunks
+    assert [call.args[0] for call in publish.call_args_list] == [first, second]
@@ -0,0 +1,58 @@
+from unittest.mock import MagicMock
+
+from src.scheduler.timing_wheel import TimingWheel
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_fires_only_once_due():
+    clock = FakeClock()
+    wheel = TimingWheel(tick_seconds=0.01, wheel_size=8, clock=clock)
+    callback = MagicMock()
+
+    wheel.schedule("a", 0.05, callback, "a")
+    clock.now = 0.04
+    assert wheel.advance() == 0
+
+    clock.now = 0.05
+    assert wheel.advance() == 1
+    callback.assert_called_once_with("a")
+    assert len(wheel) == 0
+
+
+def test_delay_longer_than_one_rotation():
+    clock = FakeClock()
+    wheel = TimingWheel(tick_seconds=0.01, wheel_size=8, clock=clock)
+    callback = MagicMock()
+
+    wheel.schedule("a", 0.25, callback)
+    for step in range(1, 25):
+        clock.now = step * 0.01
+        wheel.advance()
+    assert not callback.called
+
+    clock.now = 0.25
+    wheel.advance()
+    assert callback.called
+
+
+def test_cancel_and_reschedule():
+    clock = FakeClock()
+    wheel = TimingWheel(tick_seconds=0.01, wheel_size=8, clock=clock)
+    callback = MagicMock()
+
+    wheel.schedule("a", 0.02, callback, 1)
+    assert wheel.cancel("a")
+    assert not wheel.cancel("a")
+
+    wheel.schedule("b", 0.02, callback, 2)
+    wheel.schedule("b", 0.03, callback, 3)
+    clock.now = 0.1
+    assert wheel.advance() == 1
+    callback.assert_called_once_with(3)
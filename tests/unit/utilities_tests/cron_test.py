@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from src.utilities.cron import CronError, CronExpression
+
+
+def at(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_next_after():
+    assert CronExpression("*/15 * * * *").next_after(at(2024, 1, 1, 10, 7)) == at(2024, 1, 1, 10, 15)
+    assert CronExpression("30 9 * * mon-fri").next_after(at(2024, 1, 5, 9, 30)) == at(2024, 1, 8, 9, 30)
+    assert CronExpression("@monthly").next_after(at(2024, 1, 31, 23, 59)) == at(2024, 2, 1, 0, 0)
+    assert CronExpression("0 0 29 feb *").next_after(at(2024, 3, 1)) == at(2028, 2, 29, 0, 0)
+    # Naive datetimes are UTC
+    assert CronExpression("0 12 * * *").next_after(datetime(2024, 1, 1, 12, 0)) == at(2024, 1, 2, 12, 0)
+
+
+def test_day_of_month_or_day_of_week():
+    # The 13th of any month or any Friday
+    expression = CronExpression("0 0 13 * 5")
+    assert expression.next_after(at(2024, 1, 1)) == at(2024, 1, 5, 0, 0)
+    assert expression.next_after(at(2024, 1, 12, 0, 0)) == at(2024, 1, 13, 0, 0)
+    # A stepped `*` leaves the field unrestricted: odd days that are Mondays
+    expression = CronExpression("0 0 */2 * 1")
+    assert expression.next_after(at(2024, 1, 1)) == at(2024, 1, 15, 0, 0)
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* * * * mon-", "*/0 * * * *", "0 0 30 2 *"])
+def test_invalid_expressions(expression):
+    with pytest.raises(CronError):
+        CronExpression(expression)
@@ -0,0 +1,31 @@
+import logging
+
+import orjson
+
+from src.utilities.logging_config import JsonFormatter, SamplingFilter
+
+
+def make_record(name: str, level: int, msg: str = "message %s", args: tuple = ("arg",), **extra) -> logging.LogRecord:
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_sampling_filter_drops_high_volume_info():
+    sampling = SamplingFilter(rate=0.0)
+
+    assert not sampling.filter(make_record("src.celery_workers.delivery", logging.INFO))
+    assert not sampling.filter(make_record("uvicorn.access", logging.INFO))
+    assert sampling.filter(make_record("src.celery_workers.delivery", logging.WARNING))
+    assert sampling.filter(make_record("src.routes.timer", logging.INFO))
+    assert SamplingFilter(rate=1.0).filter(make_record("uvicorn.access", logging.INFO))
+
+
+def test_json_formatter_includes_extra_fields():
+    line = JsonFormatter().format(make_record("src.routes.timer", logging.INFO, timer_id="abc"))
+
+    entry = orjson.loads(line)
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "src.routes.timer"
+    assert entry["message"] == "message arg"
+    assert entry["timer_id"] == "abc"
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from src.celery_workers.celery_app import CeleryApp, celery_app
+from src.celery_workers.timer import fire_webhook
+from src.utilities.singleton import Singleton
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+
+
+class Client(Singleton):
+    pass
+
+
+def in_child(check) -> bool:
+    """Run `check` in a forked child and report whether it returned True."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(0 if check() else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status) == 0
+
+
+def test_forked_child_gets_its_own_instance():
+    parent = Client()
+
+    assert in_child(lambda: Client() is not parent and Client() is Client())
+    assert Client() is parent
+
+
+def test_celery_app_keeps_its_tasks_but_drops_its_pools_after_fork():
+    assert celery_app.pool is not None
+
+    assert in_child(lambda: CeleryApp.create_app() is celery_app and celery_app._pool is None
+                    and fire_webhook.name in celery_app.tasks)
+    assert celery_app._pool is not None